@@ -0,0 +1,267 @@
+'''
+Benchmark of fieldwork mesh fitting on synthetic shapes.
+
+Times FieldworkMeshFittingStep._fit over a grid of shapes, mesh orders,
+point cloud sizes, and fitting parameters, and writes the wall time,
+throughput, peak memory and RMS error of each case to a JSON file. Each
+case runs in a fresh process so that its peak memory is measured in
+isolation. Needs neither a display nor network access.
+
+Usage:
+
+    python benchmarks/benchfitting.py -o results.json
+    python benchmarks/benchfitting.py --quick
+    python benchmarks/benchfitting.py --shapes femur --orders 4 \\
+        --points 1000000 --gd "[5,5]" "[8,8]" --modes DPEP
+
+If MAP Client is not installed, --target core times the same data
+preparation and fitting through meshfitting instead of the step.
+'''
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# no display is needed for a step that is not executed with its GUI
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+# the benchmarks directory for synthetic, and the repository root for the
+# package when it is not installed. Spawned case processes inherit both.
+_BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [_BENCHMARKS_DIR, os.path.dirname(_BENCHMARKS_DIR)]
+
+import numpy as np
+
+import synthetic
+
+# named sobelov and normal weights
+SMOOTHING = {
+    'default': ('[1e-6, 1e-6, 1e-6, 1e-6, 2e-6]', '50.0'),
+    'strong': ('[1e-4, 1e-4, 1e-4, 1e-4, 2e-4]', '500.0'),
+    'none': ('[0.0, 0.0, 0.0, 0.0, 0.0]', '0.0'),
+}
+
+# sobelov and normal discretisation recommended for each mesh order
+ORDER_CONFIGS = {
+    3: {'sobelov discretisation': '[4,4]', 'normal discretisation': '4'},
+    4: {'sobelov discretisation': '[5,5]', 'normal discretisation': '5'},
+}
+
+DEFAULT_POINTS = (10000, 100000, 1000000, 5000000)
+
+
+def caseConfig(case, iterations):
+    '''
+    Step config for a benchmark case.
+    '''
+    sobW, normalW = SMOOTHING[case['smoothing']]
+    config = {
+        'mesh discretisation': case['GD'],
+        'fit mode': case['fit mode'],
+        'n closest points': str(case['n closest points']),
+        'sobelov weight': sobW,
+        'normal weight': normalW,
+        'max iterations': str(iterations),
+        'precision': case['precision'],
+        'query workers': str(case['query workers']),
+        'verbose': 'False',
+    }
+    config.update(ORDER_CONFIGS[case['order']])
+    return config
+
+
+def _peakRSS():
+    '''
+    Peak resident set size of this process in MB.
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB elsewhere
+    return rss / 2.0 ** 20 if sys.platform == 'darwin' else rss / 2.0 ** 10
+
+
+def _stepFit(GF, data, config):
+    from mapclientplugins.fieldworkmeshfittingstep.step import FieldworkMeshFittingStep
+
+    step = FieldworkMeshFittingStep(tempfile.gettempdir())
+    step._config.update(config)
+    step._config['GUI'] = 'False'
+    step.setPortData(1, GF)
+    t0 = time.perf_counter()
+    step.setPortData(0, data)
+    setupTime = time.perf_counter() - t0
+    return step._fit, setupTime
+
+
+def _coreFit(GF, data, config):
+    from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+    from mapclientplugins.fieldworkmeshfittingstep.fittrace import FitTrace
+
+    t0 = time.perf_counter()
+    fitData, fitDataWeights = meshfitting.prepareData(data, None, config)
+    dataTree = meshfitting.buildDataTree(fitData)
+    setupTime = time.perf_counter() - t0
+
+    def fit():
+        trace = FitTrace()
+        GFFitted, params, rms, errors = meshfitting.fitMesh(
+            GF, fitData, fitDataWeights, config, None, dataTree, None, trace
+        )
+        return GFFitted, params, rms, errors, trace
+
+    return fit, setupTime
+
+
+def _resolveTarget(target):
+    if target != 'auto':
+        return target
+    try:
+        from mapclientplugins.fieldworkmeshfittingstep import step
+    except ImportError:
+        return 'core'
+    return 'step'
+
+
+def runCase(case, iterations, target, memory):
+    '''
+    Run one benchmark case in this process and return its results dict.
+    '''
+    GF = synthetic.makeMesh(case['shape'], case['order'])
+    data = synthetic.makePointCloud(case['shape'], case['points'], seed=case['seed'])
+    config = caseConfig(case, iterations)
+    rssBefore = _peakRSS()
+
+    target = _resolveTarget(target)
+    makeFit = _stepFit if target == 'step' else _coreFit
+    fit, setupTime = makeFit(GF, data, config)
+
+    t0 = time.perf_counter()
+    GFFitted, params, rms, errors, trace = fit()
+    fitTime = time.perf_counter() - t0
+
+    result = dict(case)
+    result.update({
+        'target': target,
+        'nodes': GF.get_number_of_points(),
+        'elements': len(GF.ensemble_field_function.mesh.elements),
+        'setup seconds': setupTime,
+        'fit seconds': fitTime,
+        'iterations': len(trace.iterations),
+        'rmse': float(rms),
+        'peak rss mb': _peakRSS(),
+        'rss before fit mb': rssBefore,
+        'trace totals': dict(trace.totals()),
+    })
+    nIts = max(1, result['iterations'])
+    result['seconds per iteration'] = fitTime / nIts
+    result['points per second'] = case['points'] * nIts / fitTime
+
+    if memory:
+        # second run as tracing slows allocation-heavy code
+        fit, setupTime = makeFit(synthetic.makeMesh(case['shape'], case['order']), data, config)
+        tracemalloc.start()
+        fit()
+        result['fit peak traced mb'] = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+        tracemalloc.stop()
+
+    return result
+
+
+def _runCaseInProcess(args):
+    try:
+        return runCase(*args)
+    except Exception as e:
+        result = dict(args[0])
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        return result
+
+
+def makeCases(args):
+    cases = []
+    for shape, order, points, GD, mode, nClosest, smoothing, precision, workers in itertools.product(
+            args.shapes, args.orders, args.points, args.gd, args.modes,
+            args.n_closest, args.smoothing, args.precisions, args.query_workers):
+        for repeat in range(args.repeats):
+            cases.append({
+                'shape': shape,
+                'order': order,
+                'points': points,
+                'GD': GD,
+                'fit mode': mode,
+                'n closest points': nClosest,
+                'smoothing': smoothing,
+                'precision': precision,
+                'query workers': workers,
+                'seed': repeat,
+            })
+    return cases
+
+
+def _environment():
+    import scipy
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fieldwork mesh fitting on synthetic shapes.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='output JSON file')
+    parser.add_argument('--shapes', nargs='+', default=list(synthetic.SHAPES), choices=synthetic.SHAPES)
+    parser.add_argument('--orders', nargs='+', type=int, default=[3, 4], choices=sorted(synthetic.ELEMENT_TYPES))
+    parser.add_argument('--points', nargs='+', type=int, default=list(DEFAULT_POINTS), help='point cloud sizes')
+    parser.add_argument('--gd', nargs='+', default=['[5,5]', '[8,8]'], help='mesh discretisations')
+    parser.add_argument('--modes', nargs='+', default=['DPEP', 'EPDP'], help='fit modes')
+    parser.add_argument('--n-closest', nargs='+', type=int, default=[1, 3], help='n closest points')
+    parser.add_argument('--smoothing', nargs='+', default=['default', 'strong'], choices=sorted(SMOOTHING))
+    parser.add_argument('--precisions', nargs='+', default=['float64'], choices=['float64', 'float32'])
+    parser.add_argument('--query-workers', nargs='+', default=['None'],
+                        help='closest point search threads, None for all cores')
+    parser.add_argument('--iterations', type=int, default=3, help='max iterations of each fit')
+    parser.add_argument('--repeats', type=int, default=1, help='runs of each case, with different clouds')
+    parser.add_argument('--target', default='auto', choices=['auto', 'step', 'core'],
+                        help='time the step, or meshfitting directly if MAP Client is not installed')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced memory run of each case')
+    parser.add_argument('--quick', action='store_true', help='small smoke test grid')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.orders = [3]
+        args.points = [10000]
+        args.gd = ['[5,5]']
+        args.n_closest = [1]
+        args.smoothing = ['default']
+        args.iterations = 1
+
+    cases = makeCases(args)
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for i, case in enumerate(cases):
+        with ctx.Pool(1) as pool:
+            result = pool.apply(_runCaseInProcess, ((case, args.iterations, args.target, not args.no_memory),))
+        results.append(result)
+        if 'error' in result:
+            print('[{}/{}] {} failed: {}'.format(i + 1, len(cases), case, result['error']))
+        else:
+            print('[{}/{}] {shape} order {order} {points} points GD {GD} {fit mode} k={n closest points} '
+                  '{smoothing} {precision} workers={query workers}: {fit seconds:.2f} s, {points per second:.3g} points/s, rmse {rmse:.4f}, '
+                  '{peak rss mb:.0f} MB'.format(i + 1, len(cases), **result))
+
+        # written after every case so that partial results survive
+        with open(args.output, 'w') as f:
+            json.dump({'environment': _environment(), 'iterations': args.iterations, 'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
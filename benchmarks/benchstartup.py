@@ -0,0 +1,130 @@
+'''
+Benchmark of the startup time of the headless fitting path.
+
+Times, in fresh processes, importing the package, importing the batch
+fitting module as batch workers do, and creating and configuring a step
+with GUI set to False as a headless workflow does. Also records which
+GUI modules (Qt widgets, Mayavi, traits, VTK and the Qt resources) each
+path loaded, none of which should be. Writes the results to a JSON file.
+
+Usage:
+
+    python benchmarks/benchstartup.py -o startup.json --repeats 10
+
+The step case is skipped if MAP Client is not installed.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# no display is needed for a step that is not executed with its GUI
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+# GUI modules that the headless path should not import
+GUI_MODULES = (
+    'PySide6.QtWidgets',
+    'mayavi',
+    'traits',
+    'tvtk',
+    'vtk',
+    'mapclientplugins.fieldworkmeshfittingstep.resources_rc',
+    'mapclientplugins.fieldworkmeshfittingstep.mayavifittingviewerwidget',
+    'mapclientplugins.fieldworkmeshfittingstep.configuredialog',
+)
+
+# code of each case, run after the clock starts in a fresh interpreter
+CASES = {
+    'package': 'import mapclientplugins.fieldworkmeshfittingstep',
+    'batch': 'import mapclientplugins.fieldworkmeshfittingstep.batchfit',
+    'step': '\n'.join([
+        'import json, tempfile',
+        'from mapclientplugins.fieldworkmeshfittingstep.step import FieldworkMeshFittingStep',
+        'step = FieldworkMeshFittingStep(tempfile.gettempdir())',
+        'step._identifierOccursCount = lambda identifier: 1',
+        "step.deserialize(json.dumps({'identifier': 'fit', 'GUI': 'False'}))",
+    ]),
+}
+
+_RUNNER = '''
+import json, sys, time
+t0 = time.perf_counter()
+exec({code!r})
+seconds = time.perf_counter() - t0
+loaded = [m for m in {modules!r} if m in sys.modules]
+print(json.dumps({{'seconds': seconds, 'gui modules': loaded}}))
+'''
+
+
+def runCase(name):
+    '''
+    Run a case in a fresh interpreter. Returns its results dict, with the
+    in-process time of the case and the wall time of the process.
+    '''
+    code = _RUNNER.format(code=CASES[name], modules=GUI_MODULES)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    wallTime = time.perf_counter() - t0
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1]}
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process seconds'] = wallTime
+    return result
+
+
+def _mapclientInstalled():
+    proc = subprocess.run([sys.executable, '-c', 'import mapclient'], capture_output=True)
+    return proc.returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of headless fitting.')
+    parser.add_argument('-o', '--output', default='startup_results.json', help='output JSON file')
+    parser.add_argument('--repeats', type=int, default=5, help='runs of each case')
+    parser.add_argument('--cases', nargs='+', default=sorted(CASES), choices=sorted(CASES))
+    args = parser.parse_args()
+
+    cases = list(args.cases)
+    if ('step' in cases) and not _mapclientInstalled():
+        print('MAP Client is not installed, skipping the step case')
+        cases.remove('step')
+
+    # run from the repository so that the package is importable uninstalled
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    results = {}
+    for name in cases:
+        runs = [runCase(name) for _ in range(args.repeats)]
+        errors = [r['error'] for r in runs if 'error' in r]
+        if errors:
+            results[name] = {'error': errors[0]}
+            print('{} failed: {}'.format(name, errors[0]))
+            continue
+
+        seconds = sorted(r['seconds'] for r in runs)
+        processSeconds = sorted(r['process seconds'] for r in runs)
+        guiModules = sorted(set(m for r in runs for m in r['gui modules']))
+        results[name] = {
+            'median seconds': seconds[len(seconds) // 2],
+            'min seconds': seconds[0],
+            'median process seconds': processSeconds[len(processSeconds) // 2],
+            'gui modules': guiModules,
+        }
+        print('{}: {:.3f} s import, {:.3f} s process, GUI modules loaded: {}'.format(
+            name, results[name]['median seconds'], results[name]['median process seconds'],
+            ', '.join(guiModules) if guiModules else 'none'))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+            'repeats': args.repeats,
+            'results': results,
+        }, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
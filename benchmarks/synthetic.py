@@ -0,0 +1,149 @@
+'''
+Synthetic meshes and point clouds for benchmarking mesh fitting.
+
+Each shape is an analytic surface used both to build a fieldwork mesh of
+cubic (quad44) or quartic (quad55) Lagrange elements and to sample a target
+point cloud. The mesh is built on a scaled copy of the surface so that the
+fit has to move the nodes onto the cloud.
+
+- sphere : a cube-sphere of 6 faces.
+- cylinder : an open cylinder.
+- femur : an open tube with bulbous ends and a bent shaft, roughly the
+  shape of a femur.
+'''
+import numpy as np
+
+from gias3.fieldwork.field import geometric_field
+from gias3.fieldwork.field import ensemble_field_function as EFF
+from gias3.fieldwork.field.topology import element_types
+
+SHAPES = ('sphere', 'cylinder', 'femur')
+
+# element type and basis of each mesh order
+ELEMENT_TYPES = {
+    3: ('quad44', 'quad_L3_L3'),
+    4: ('quad55', 'quad_L4_L4'),
+}
+
+# default number of elements in each direction of each shape, per face for
+# the sphere
+DEFAULT_ELEMENTS = {
+    'sphere': (2, 2),
+    'cylinder': (8, 4),
+    'femur': (8, 6),
+}
+
+RADIUS = 20.0
+LENGTH = 200.0
+
+# outward orientated (centre, xi1 tangent, xi2 tangent) of each cube face
+_CUBE_FACES = (
+    ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+    ((-1, 0, 0), (0, 0, 1), (0, 1, 0)),
+    ((0, 1, 0), (0, 0, 1), (1, 0, 0)),
+    ((0, -1, 0), (1, 0, 0), (0, 0, 1)),
+    ((0, 0, 1), (1, 0, 0), (0, 1, 0)),
+    ((0, 0, -1), (0, 1, 0), (1, 0, 0)),
+)
+
+
+def _sphereFace(face, u, v, scale=1.0):
+    c, a, b = [np.array(x, dtype=float) for x in _CUBE_FACES[face]]
+    p = c + (2.0 * u[:, np.newaxis] - 1.0) * a + (2.0 * v[:, np.newaxis] - 1.0) * b
+    return RADIUS * scale * p / np.linalg.norm(p, axis=1)[:, np.newaxis]
+
+
+def _tubeRadius(shape, z):
+    if shape == 'cylinder':
+        return np.full(z.shape, RADIUS)
+    # femur-like: condyles at the distal end, head and trochanters at the
+    # proximal end
+    w = 0.12 * LENGTH
+    return RADIUS * (
+        1.0 + 0.8 * np.exp(-(z / w) ** 2) + 0.5 * np.exp(-((z - LENGTH) / w) ** 2)
+    )
+
+
+def _tube(shape, u, v, scale=1.0):
+    '''
+    Points on a tube at u = angle / 2pi and v = height / LENGTH. xi1 runs
+    around the tube and xi2 along it, giving outward normals.
+    '''
+    theta = 2.0 * np.pi * u
+    z = LENGTH * v
+    r = _tubeRadius(shape, z) * scale
+    p = np.column_stack([r * np.cos(theta), r * np.sin(theta), z])
+    if shape == 'femur':
+        p[:, 0] += 0.15 * LENGTH * (v - 0.5) ** 2
+    return p
+
+
+def _surfacePatches(shape, elements):
+    '''
+    Returns a list of (surface function, nu, nv) patches covering the
+    shape, where surface function(u, v, scale) gives points at parametric
+    coordinates u, v in [0, 1].
+    '''
+    nu, nv = elements
+    if shape == 'sphere':
+        return [
+            (lambda u, v, scale, f=f: _sphereFace(f, u, v, scale), nu, nv)
+            for f in range(len(_CUBE_FACES))
+        ]
+    elif shape in ('cylinder', 'femur'):
+        return [(lambda u, v, scale: _tube(shape, u, v, scale), nu, nv)]
+    else:
+        raise ValueError('unknown shape ' + shape)
+
+
+def makeMesh(shape, order=3, elements=None, scale=1.1):
+    '''
+    Build a GeometricField of the shape.
+
+    inputs
+    ------
+    shape : one of SHAPES.
+    order : 3 for cubic or 4 for quartic Lagrange elements.
+    elements : (n1, n2) number of elements in each element direction, per
+        cube face for the sphere. Defaults to DEFAULT_ELEMENTS[shape].
+    scale : scaling of the shape radius, so that the mesh starts off the
+        point cloud.
+    '''
+    if elements is None:
+        elements = DEFAULT_ELEMENTS[shape]
+    elementType, basis = ELEMENT_TYPES[order]
+    name = '{}_{}'.format(shape, order)
+    F = EFF.EnsembleFieldFunction(name, 2, debug=0)
+    F.set_basis({'quad{0}{0}'.format(order + 1): basis})
+    F.set_new_mesh(name)
+    GF = geometric_field.GeometricField(name, 3, ensemble_field_function=F)
+
+    # element point xi, xi1 fastest
+    xi = np.linspace(0.0, 1.0, order + 1)
+    xi1, xi2 = [x.ravel() for x in np.meshgrid(xi, xi)]
+    tol = 1e-6 * RADIUS
+    for surface, nu, nv in _surfacePatches(shape, elements):
+        for j in range(nv):
+            for i in range(nu):
+                p = surface((i + xi1) / nu, (j + xi2) / nv, scale)
+                GF.add_element_with_parameters(
+                    element_types.create_element(elementType), p.T[:, :, np.newaxis], tol=tol
+                )
+
+    return GF
+
+
+def makePointCloud(shape, nPoints, noise=0.2, seed=0):
+    '''
+    Sample nPoints points on the shape with Gaussian noise of standard
+    deviation noise in each coordinate.
+    '''
+    rand = np.random.RandomState(seed)
+    if shape == 'sphere':
+        p = rand.normal(size=(nPoints, 3))
+        p *= RADIUS / np.linalg.norm(p, axis=1)[:, np.newaxis]
+    else:
+        p = _tube(shape, rand.uniform(size=nPoints), rand.uniform(size=nPoints))
+    if noise:
+        p += rand.normal(scale=noise, size=p.shape)
+    return p
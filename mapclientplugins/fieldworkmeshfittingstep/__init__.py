@@ -22,5 +22,10 @@ __author__ = 'Ju Zhang'
 __stepname__ = 'Fieldwork Mesh Fitting'
 __location__ = 'https://github.com/mapclient-plugins/fieldworkmeshfittingstep/archive/v1.0.1.zip'
 
-from mapclientplugins.fieldworkmeshfittingstep import step
-import mapclientplugins.fieldworkmeshfittingstep.resources_rc
+import importlib.util
+
+# the step is only registered with MAP Client if it is installed, so that
+# the fitting modules can be imported by headless batch workers without it.
+# The Qt resources are loaded by the step when its icon is first shown.
+if importlib.util.find_spec('mapclient') is not None:
+    from mapclientplugins.fieldworkmeshfittingstep import step
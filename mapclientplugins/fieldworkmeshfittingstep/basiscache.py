@@ -0,0 +1,155 @@
+'''
+Least-recently-used cache of evaluated basis matrices and element xi
+sample sets, held in memory and optionally on disk.
+
+Entries are keyed by strings built from a mesh topology key (see
+meshsampling.meshTopologyKey) and the discretisation settings, so meshes
+sharing a template share entries.
+'''
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+
+def makeKey(*parts):
+    '''
+    Make a cache key from the repr of parts.
+    '''
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+class BasisCache(object):
+    '''
+    LRU cache of basis matrices and xi sample sets.
+
+    inputs
+    ------
+    maxEntries : maximum number of entries held in memory, and on disk if
+        cacheDir is given.
+    cacheDir : optional directory to also store entries in. Entries found
+        on disk are loaded into memory when requested.
+    '''
+
+    def __init__(self, maxEntries=32, cacheDir=None):
+        self.maxEntries = maxEntries
+        self.cacheDir = cacheDir
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        if key in self._entries:
+            return True
+        path = self._diskPath(key)
+        return path is not None and os.path.exists(path)
+
+    def get(self, key):
+        '''
+        Returns the cached value for key, or None if it is not cached.
+        '''
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        value = self._diskGet(key)
+        if value is not None:
+            self._memPut(key, value)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._memPut(key, value)
+        self._diskPut(key, value)
+
+    def getOrBuild(self, key, builder):
+        '''
+        Returns the cached value for key, calling builder() to create and
+        cache it if it is not cached.
+        '''
+        value = self.get(key)
+        if value is None:
+            value = builder()
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        if self.cacheDir is not None and os.path.isdir(self.cacheDir):
+            for f in self._diskFiles():
+                os.remove(f)
+
+    def _memPut(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+
+    def _diskPath(self, key):
+        if self.cacheDir is None:
+            return None
+        return os.path.join(self.cacheDir, key + '.pkl')
+
+    def _diskFiles(self):
+        return [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir) if f.endswith('.pkl')]
+
+    def _diskGet(self, key):
+        path = self._diskPath(key)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # mark as recently used
+        os.utime(path, None)
+        return value
+
+    def _diskPut(self, key, value):
+        if self.cacheDir is None:
+            return
+
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+        # write to a temporary file first so that concurrent readers never
+        # see a partial entry
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, self._diskPath(key))
+
+        files = self._diskFiles()
+        if len(files) > self.maxEntries:
+            files.sort(key=os.path.getmtime)
+            for f in files[:len(files) - self.maxEntries]:
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+
+
+_defaultCache = BasisCache()
+
+
+def getBasisCache(maxEntries=None, cacheDir=None):
+    '''
+    Returns the cache shared by all fits in this process, updating its
+    size and disk directory if given.
+    '''
+    if maxEntries is not None:
+        _defaultCache.maxEntries = maxEntries
+    _defaultCache.cacheDir = cacheDir
+    return _defaultCache
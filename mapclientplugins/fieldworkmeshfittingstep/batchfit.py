@@ -0,0 +1,156 @@
+'''
+Headless batch fitting of fieldwork meshes to many point clouds across a
+process pool. Nothing here creates Qt widgets or needs a display.
+
+Each job is a tuple of (point cloud, GeometricField, data weights, config):
+
+- point cloud : nx3 array, or path to a .npy or text file. .npy files
+  are memory-mapped rather than read into memory.
+- GeometricField : GeometricField instance, or path to a .geof file.
+- data weights : 1-D array, path to a .npy or text file, or None.
+- config : dict of step config strings. Missing keys take the default
+  values in meshfitting.FIT_CONFIG_DEFAULTS.
+
+Usage from the command line:
+
+    fieldworkmeshfit-batch jobs.json -o outputdir -n 8 -t 600
+
+where jobs.json is a list of objects with the keys "name", "pointcloud",
+"fieldworkmodel", and optionally "weights" and "config".
+'''
+import argparse
+import json
+import multiprocessing
+import os
+
+import numpy as np
+from gias3.fieldwork.field import geometric_field
+
+from mapclientplugins.fieldworkmeshfittingstep import errorstats
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+
+
+def _loadGF(GFIn):
+    if isinstance(GFIn, str):
+        return geometric_field.load_geometric_field(GFIn)
+    else:
+        return GFIn
+
+
+def _fitJob(job):
+    data, GF, dataWeights, config = job
+    config = {} if config is None else config
+    fullData = meshfitting.loadArray(data)
+    data, dataWeights = meshfitting.prepareData(fullData, meshfitting.loadArray(dataWeights), config)
+    elementErrors = bool(eval(config.get('element errors', meshfitting.FIT_CONFIG_DEFAULTS['element errors'])))
+    # fit a GF sharing the topology of the input, so that jobs run in the
+    # calling process do not modify it, as they do not in a pool
+    GF = meshfitting.shareTopology(_loadGF(GF))
+    fitOutput = meshfitting.fitMesh(GF, data, dataWeights, config, elementErrors=elementErrors)
+    if not meshfitting.isDownsampled(config):
+        return fitOutput
+
+    # errors of a fit to a downsampled cloud are of the full cloud
+    errorOutput = meshfitting.evaluateErrors(
+        fitOutput[0], fitOutput[1], fullData, config, elementErrors=elementErrors
+    )
+    return tuple(fitOutput[:2]) + tuple(errorOutput[2:])
+
+
+def batchFit(jobs, processes=None, chunksize=1):
+    '''
+    Fit a list of jobs in a pool of processes.
+
+    inputs
+    ------
+    jobs : list of (point cloud, GeometricField, data weights, config)
+        tuples. See the module docstring.
+    processes : number of worker processes. Defaults to the number of
+        cores.
+    chunksize : number of jobs sent to a worker at a time.
+
+    returns
+    -------
+    A list of (fitted GF, fitted parameters, RMS error, per-point errors)
+    tuples in the same order as jobs, followed by the per-element errors
+    of jobs configured with 'element errors'.
+    '''
+    jobs = list(jobs)
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+
+    if processes == 1:
+        return [_fitJob(j) for j in jobs]
+
+    jobs = [
+        (data, GF, dataWeights, meshfitting.shareQueryWorkers({} if config is None else config, processes))
+        for data, GF, dataWeights, config in jobs
+    ]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_fitJob, jobs, chunksize)
+
+
+def _readJobsFile(filename):
+    with open(filename, 'r') as f:
+        jobSpecs = json.load(f)
+
+    jobDir = os.path.dirname(os.path.abspath(filename))
+
+    def _path(p):
+        if p is None:
+            return None
+        return os.path.join(jobDir, p)
+
+    names = []
+    jobs = []
+    for i, spec in enumerate(jobSpecs):
+        names.append(spec.get('name', 'job{}'.format(i)))
+        jobs.append((
+            _path(spec['pointcloud']),
+            _path(spec['fieldworkmodel']),
+            _path(spec.get('weights')),
+            {k: str(v) for k, v in spec.get('config', {}).items()},
+        ))
+
+    return names, jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fit fieldwork meshes to point clouds in parallel.'
+    )
+    parser.add_argument('jobs', help='JSON file listing the fitting jobs.')
+    parser.add_argument('-o', '--outdir', default='.', help='Directory to write fitted outputs to.')
+    parser.add_argument('-n', '--processes', type=int, default=None,
+                        help='Number of worker processes. Defaults to the number of cores.')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='Time limit in seconds for each fit, for jobs that do not configure one. '
+                             'Fits that time out return their best parameters so far.')
+    args = parser.parse_args(argv)
+
+    names, jobs = _readJobsFile(args.jobs)
+    if args.timeout is not None:
+        for job in jobs:
+            job[3].setdefault('timeout', str(args.timeout))
+    results = batchFit(jobs, processes=args.processes)
+
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+
+    summary = {}
+    for name, result in zip(names, results):
+        (GFFitted, paramsFitted, RMSEFitted, fitErrors) = result[:4]
+        GFFitted.save_geometric_field(os.path.join(args.outdir, name + '.geof'))
+        np.save(os.path.join(args.outdir, name + '_params.npy'), paramsFitted)
+        np.save(os.path.join(args.outdir, name + '_errors.npy'), fitErrors)
+        if len(result) > 4:
+            np.savez(os.path.join(args.outdir, name + '_element_errors.npz'), **result[4])
+        summary[name] = {'rmse': float(RMSEFitted), 'errors': errorstats.summariseErrors(fitErrors)}
+
+    with open(os.path.join(args.outdir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, sort_keys=True, indent=4)
+
+
+if __name__ == '__main__':
+    main()
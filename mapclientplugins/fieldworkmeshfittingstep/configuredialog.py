@@ -88,6 +88,29 @@ class ConfigureDialog(QtWidgets.QDialog):
         config['verbose'] = self._ui.lineEdit12.text()
         config['fixed nodes'] = self._ui.lineEdit13.text()
         config['GUI'] = self._ui.lineEdit14.text()
+        config['basis cache size'] = self._ui.lineEdit15.text()
+        config['basis cache dir'] = self._ui.lineEdit16.text()
+        config['fit schedule'] = self._ui.lineEdit17.text()
+        config['downsample spacing'] = self._ui.lineEdit18.text()
+        config['downsample points'] = self._ui.lineEdit19.text()
+        config['plateau iterations'] = self._ui.lineEdit20.text()
+        config['plateau tolerance'] = self._ui.lineEdit21.text()
+        config['timeout'] = self._ui.lineEdit22.text()
+        config['result cache dir'] = self._ui.lineEdit23.text()
+        config['result cache size'] = self._ui.lineEdit24.text()
+        config['precision'] = self._ui.lineEdit25.text()
+        config['sweep'] = self._ui.lineEdit26.text()
+        config['sweep processes'] = self._ui.lineEdit27.text()
+        config['sweep selection'] = self._ui.lineEdit28.text()
+        config['preview rate'] = self._ui.lineEdit29.text()
+        config['render point budget'] = self._ui.lineEdit30.text()
+        config['incremental'] = self._ui.lineEdit31.text()
+        config['incremental tolerance'] = self._ui.lineEdit32.text()
+        config['incremental radius'] = self._ui.lineEdit33.text()
+        config['adaptive discretisation'] = self._ui.lineEdit34.text()
+        config['query workers'] = self._ui.lineEdit35.text()
+        config['query chunk size'] = self._ui.lineEdit36.text()
+        config['element errors'] = self._ui.lineEdit37.text()
         return config
 
     def setConfig(self, config):
@@ -112,3 +135,26 @@ class ConfigureDialog(QtWidgets.QDialog):
         self._ui.lineEdit12.setText(config['verbose'])
         self._ui.lineEdit13.setText(config['fixed nodes'])
         self._ui.lineEdit14.setText(config['GUI'])
+        self._ui.lineEdit15.setText(config['basis cache size'])
+        self._ui.lineEdit16.setText(config['basis cache dir'])
+        self._ui.lineEdit17.setText(config['fit schedule'])
+        self._ui.lineEdit18.setText(config['downsample spacing'])
+        self._ui.lineEdit19.setText(config['downsample points'])
+        self._ui.lineEdit20.setText(config['plateau iterations'])
+        self._ui.lineEdit21.setText(config['plateau tolerance'])
+        self._ui.lineEdit22.setText(config['timeout'])
+        self._ui.lineEdit23.setText(config['result cache dir'])
+        self._ui.lineEdit24.setText(config['result cache size'])
+        self._ui.lineEdit25.setText(config['precision'])
+        self._ui.lineEdit26.setText(config['sweep'])
+        self._ui.lineEdit27.setText(config['sweep processes'])
+        self._ui.lineEdit28.setText(config['sweep selection'])
+        self._ui.lineEdit29.setText(config['preview rate'])
+        self._ui.lineEdit30.setText(config['render point budget'])
+        self._ui.lineEdit31.setText(config['incremental'])
+        self._ui.lineEdit32.setText(config['incremental tolerance'])
+        self._ui.lineEdit33.setText(config['incremental radius'])
+        self._ui.lineEdit34.setText(config['adaptive discretisation'])
+        self._ui.lineEdit35.setText(config['query workers'])
+        self._ui.lineEdit36.setText(config['query chunk size'])
+        self._ui.lineEdit37.setText(config['element errors'])
@@ -0,0 +1,116 @@
+'''
+Early stopping of fits: RMSE plateau detection, cancellation from the GUI,
+and time limits.
+'''
+import threading
+import time
+
+PLATEAU = 'plateau'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+
+
+class FitStopped(Exception):
+    '''
+    Raised inside a fit to interrupt it when it has been cancelled or has
+    timed out.
+    '''
+
+    def __init__(self, reason):
+        Exception.__init__(self, 'fit stopped: ' + reason)
+        self.reason = reason
+
+
+class CancellationToken(object):
+    '''
+    Thread-safe flag for cancelling a running fit from another thread,
+    e.g. the GUI Stop button.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def reset(self):
+        self._event.clear()
+
+    def isCancelled(self):
+        return self._event.is_set()
+
+
+class ConvergenceMonitor(object):
+    '''
+    Tracks the RMSE of each outer fit iteration, keeps the best iteration,
+    and decides when a fit should stop.
+
+    inputs
+    ------
+    window : number of iterations over which to measure improvement.
+    tol : stop when the relative RMSE improvement over the last window
+        iterations is below tol. None to not detect plateaus.
+    token : optional CancellationToken.
+    timeout : optional time limit in seconds, counted from monitor
+        creation.
+    deadline : optional absolute time.time() limit. Overrides timeout, so
+        that several monitors, e.g. one per fit schedule stage, can share
+        a limit.
+    '''
+
+    def __init__(self, window=3, tol=None, token=None, timeout=None, deadline=None):
+        self.window = max(1, int(window))
+        self.tol = tol
+        self.token = token
+        if (deadline is None) and (timeout is not None):
+            deadline = time.time() + timeout
+        self.deadline = deadline
+
+        self.history = []
+        self.best = None
+        self.bestRMS = None
+        self.stopReason = None
+
+    def check(self):
+        '''
+        Raise FitStopped if the fit has been cancelled or has timed out.
+        Cheap enough to call on every objective function evaluation.
+        '''
+        if (self.token is not None) and self.token.isCancelled():
+            self.stopReason = CANCELLED
+            raise FitStopped(CANCELLED)
+        if (self.deadline is not None) and (time.time() > self.deadline):
+            self.stopReason = TIMEOUT
+            raise FitStopped(TIMEOUT)
+
+    def update(self, fitOutput):
+        '''
+        Record the output tuple (GF, params, RMS, ...) of an iteration.
+        Returns True if the fit should stop.
+        '''
+        rms = fitOutput[2]
+        self.history.append(rms)
+        if (self.bestRMS is None) or (rms < self.bestRMS):
+            self.bestRMS = rms
+            self.best = (fitOutput[0], fitOutput[1].copy()) + tuple(fitOutput[2:])
+
+        if self.plateaued():
+            self.stopReason = PLATEAU
+            return True
+
+        try:
+            self.check()
+        except FitStopped:
+            return True
+
+        return False
+
+    def plateaued(self):
+        if (self.tol is None) or (len(self.history) <= self.window):
+            return False
+
+        old = self.history[-self.window - 1]
+        # an exact fit cannot improve
+        if old <= 0:
+            return True
+        return (old - min(self.history[-self.window:])) / old < self.tol
@@ -0,0 +1,87 @@
+'''
+Voxel grid downsampling of target point clouds.
+'''
+import numpy as np
+
+# max number of spacing bisections when downsampling to a point count
+_MAX_BISECTIONS = 20
+
+
+def _voxelIndices(data, spacing):
+    '''
+    Returns the voxel index of each point for a grid of the given spacing,
+    and the number of voxels occupied.
+    '''
+    ijk = np.floor((data - data.min(0)) / spacing).astype(np.int64)
+    shape = ijk.max(0) + 1
+    voxelKeys = np.ravel_multi_index(ijk.T, shape)
+    occupied, voxelI = np.unique(voxelKeys, return_inverse=True)
+    return voxelI, len(occupied)
+
+
+def _spacingForCount(data, nPoints):
+    '''
+    Bisect for the voxel spacing giving about nPoints occupied voxels.
+    '''
+    extent = (data.max(0) - data.min(0)).max()
+    lo = extent * 1e-6
+    hi = extent
+    best = hi
+    for i in range(_MAX_BISECTIONS):
+        mid = np.sqrt(lo * hi)
+        n = _voxelIndices(data, mid)[1]
+        if n > nPoints:
+            lo = mid
+        else:
+            hi = mid
+            best = mid
+            if n > 0.95 * nPoints:
+                break
+
+    return best
+
+
+def voxelDownsample(data, spacing=None, nPoints=None, weights=None):
+    '''
+    Downsample a point cloud by replacing the points in each voxel of a
+    regular grid by their centroid.
+
+    inputs
+    ------
+    data : nx3 array of points.
+    spacing : voxel size. Either spacing or nPoints must be given.
+    nPoints : target number of points. The voxel size is chosen to give
+        at most about this many points.
+    weights : optional weight of each point. Defaults to 1.
+
+    returns
+    -------
+    points : mx3 array of the centroid of the points in each voxel.
+    pointWeights : the root of the sum of the squared weights in each
+        voxel, sqrt(count) for unit weights. The fitting residual of a
+        point is linear in its weight and the objective is their sum of
+        squares, so this gives each voxel the influence of the points it
+        replaces.
+    '''
+    data = np.asarray(data, dtype=float)
+    if weights is None:
+        weights = np.ones(data.shape[0], dtype=float)
+    else:
+        weights = np.asarray(weights, dtype=float)
+
+    if spacing is None:
+        if nPoints is None:
+            raise ValueError('spacing or nPoints must be given')
+        if nPoints >= data.shape[0]:
+            return data, weights
+        spacing = _spacingForCount(data, nPoints)
+
+    voxelI, nVoxels = _voxelIndices(data, spacing)
+    counts = np.bincount(voxelI, minlength=nVoxels)
+    pointWeights = np.sqrt(np.bincount(voxelI, weights=weights ** 2, minlength=nVoxels))
+    points = np.empty((nVoxels, data.shape[1]), dtype=float)
+    for c in range(data.shape[1]):
+        points[:, c] = np.bincount(voxelI, weights=data[:, c], minlength=nVoxels)
+    points /= counts[:, np.newaxis]
+
+    return points, pointWeights
@@ -0,0 +1,181 @@
+'''
+Summaries of the per-point errors of a fit, computed in chunks so that
+their memory does not grow with the size of the point cloud.
+
+ErrorSummary keeps running moments and a histogram with logarithmic bins
+of the errors added to it, from which the mean, SD, RMS, maximum and
+percentiles of any number of errors are found. elementErrors aggregates
+the errors of the points closest to each element of a mesh.
+'''
+import numpy as np
+
+# number of errors processed at a time
+CHUNK = 2 ** 20
+
+# percentiles of the errors reported by summariseErrors
+PERCENTILES = (50, 90, 95, 99)
+
+# default relative accuracy of the percentiles of an ErrorSummary
+_RELATIVE_ACCURACY = 0.01
+
+
+class ErrorSummary(object):
+    '''
+    Running summary of errors added in chunks: their count, mean, SD, RMS,
+    maximum and percentiles. Percentiles are estimated from a histogram
+    with logarithmic bins, to within relativeAccuracy of the true value.
+    Non-finite errors, e.g. of points without a correspondence, are only
+    counted as missing.
+    '''
+
+    def __init__(self, relativeAccuracy=_RELATIVE_ACCURACY):
+        self.count = 0
+        self.missing = 0
+        self.mean = 0.0
+        self.max = np.nan
+        self._m2 = 0.0
+        self._sumSq = 0.0
+        self._gamma = (1.0 + relativeAccuracy) / (1.0 - relativeAccuracy)
+        self._logGamma = np.log(self._gamma)
+        self._zeros = 0
+        self._keyMin = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, errors):
+        '''
+        Add a chunk of errors to the summary.
+        '''
+        errors = np.asarray(errors, dtype=float).ravel()
+        finite = errors[np.isfinite(errors)]
+        self.missing += errors.size - finite.size
+        n = finite.size
+        if n == 0:
+            return
+
+        # merge the mean and sum of squared deviations of the chunk
+        mean = finite.mean()
+        dev = finite - mean
+        delta = mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self._m2 += dev.dot(dev) + delta * delta * self.count * n / total
+        self._sumSq += finite.dot(finite)
+        self.count = total
+        self.max = np.fmax(self.max, finite.max())
+
+        positive = finite[finite > 0.0]
+        self._zeros += n - positive.size
+        if positive.size > 0:
+            self._addKeys(np.ceil(np.log(positive) / self._logGamma).astype(np.int64))
+
+    def _addKeys(self, keys):
+        lo = int(keys.min())
+        hi = int(keys.max())
+        if self._counts.size == 0:
+            self._keyMin = lo
+            self._counts = np.zeros(hi - lo + 1, dtype=np.int64)
+        elif (lo < self._keyMin) or (hi >= self._keyMin + self._counts.size):
+            keyMin = min(lo, self._keyMin)
+            counts = np.zeros(max(hi, self._keyMin + self._counts.size - 1) - keyMin + 1, dtype=np.int64)
+            counts[self._keyMin - keyMin:self._keyMin - keyMin + self._counts.size] = self._counts
+            self._keyMin = keyMin
+            self._counts = counts
+        self._counts += np.bincount(keys - self._keyMin, minlength=self._counts.size)
+
+    @property
+    def sd(self):
+        return np.sqrt(self._m2 / self.count) if self.count else np.nan
+
+    @property
+    def rms(self):
+        return np.sqrt(self._sumSq / self.count) if self.count else np.nan
+
+    def percentile(self, q):
+        '''
+        Returns an estimate of the q-th percentile of the errors.
+        '''
+        if self.count == 0:
+            return np.nan
+        rank = q / 100.0 * (self.count - 1)
+        if rank < self._zeros:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self._counts), rank - self._zeros, side='right'))
+        i = min(i, self._counts.size - 1)
+        # midpoint of the bin with the same relative error to both edges
+        value = 2.0 * self._gamma ** (self._keyMin + i) / (self._gamma + 1.0)
+        return float(min(value, self.max))
+
+    def toDict(self, percentiles=PERCENTILES):
+        '''
+        Returns the summary as a dict of 'count', 'missing', 'mean', 'sd',
+        'rms', 'max' and a 'p<q>' item for each of percentiles.
+        '''
+        summary = {
+            'count': int(self.count),
+            'missing': int(self.missing),
+            'mean': float(self.mean) if self.count else np.nan,
+            'sd': float(self.sd),
+            'rms': float(self.rms),
+            'max': float(self.max),
+        }
+        for q in percentiles:
+            summary['p{}'.format(q)] = self.percentile(q)
+        return summary
+
+
+def summariseErrors(errors, chunk=CHUNK, percentiles=PERCENTILES):
+    '''
+    Returns the ErrorSummary dict of errors, processed chunk at a time.
+    '''
+    summary = ErrorSummary()
+    for i in range(0, len(errors), chunk):
+        summary.add(errors[i:i + chunk])
+    return summary.toDict(percentiles)
+
+
+def sqrtInPlace(sqErrors, chunk=CHUNK):
+    '''
+    Convert squared errors to errors in place, chunk at a time. Returns
+    sqErrors.
+    '''
+    for i in range(0, len(sqErrors), chunk):
+        np.sqrt(sqErrors[i:i + chunk], out=sqErrors[i:i + chunk])
+    return sqErrors
+
+
+def elementErrors(errors, errorElements, elementNumbers, chunk=CHUNK):
+    '''
+    Aggregate errors by element. errorElements is the number of the
+    element closest to the point of each error, -1 for none, and
+    elementNumbers the sorted numbers of all elements.
+
+    Returns a dict of the 'element' numbers, and the 'mean', 'max' and
+    'count' of the finite errors of each element. Elements without errors
+    have a count of 0 and a NaN mean and max.
+    '''
+    elementNumbers = np.asarray(elementNumbers)
+    nElements = len(elementNumbers)
+    counts = np.zeros(nElements, dtype=np.int64)
+    sums = np.zeros(nElements, dtype=float)
+    maxima = np.full(nElements, -np.inf)
+    for i in range(0, len(errors), chunk):
+        e = np.asarray(errors[i:i + chunk], dtype=float)
+        elems = errorElements[i:i + chunk]
+        keep = np.isfinite(e) & (elems >= 0)
+        e = e[keep]
+        if e.size == 0:
+            continue
+        index = np.searchsorted(elementNumbers, elems[keep])
+        counts += np.bincount(index, minlength=nElements)
+        sums += np.bincount(index, weights=e, minlength=nElements)
+
+        order = np.argsort(index, kind='stable')
+        index = index[order]
+        starts = np.hstack([[0], np.flatnonzero(np.diff(index)) + 1])
+        chunkMax = np.maximum.reduceat(e[order], starts)
+        maxima[index[starts]] = np.maximum(maxima[index[starts]], chunkMax)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    maxima[counts == 0] = np.nan
+    return {'element': elementNumbers.copy(), 'mean': means, 'max': maxima, 'count': counts}
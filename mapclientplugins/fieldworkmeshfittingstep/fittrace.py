@@ -0,0 +1,122 @@
+'''
+Timing trace of fits: wall time per phase of each outer iteration, and
+of the steps around the fit.
+'''
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# phases timed in each outer iteration
+ITERATION_PHASES = (
+    'evaluate',  # mesh sample point evaluation
+    'search',  # closest point search
+    'data term',  # data residuals and Jacobian
+    'sobolev',  # Sobolev penalty residuals and Jacobian
+    'normal',  # normal penalty residuals and Jacobian
+    'solver',  # least squares solver, excluding residual and Jacobian evaluations
+    'errors',  # final errors of the iteration
+)
+
+# non-timing columns of each iteration record
+ITERATION_INFO = ('stage', 'iteration', 'nfev', 'njev', 'samples', 'pairs', 'rmse')
+
+
+class FitTrace(object):
+    '''
+    Structured record of where time goes during fitting.
+
+    iterations is a list of one OrderedDict per outer iteration holding
+    the ITERATION_INFO values and the seconds spent in each of
+    ITERATION_PHASES. phases holds the seconds spent in steps outside the
+    iterations, e.g. data preparation.
+
+    stopReason is the convergence stop reason of the last fit stage, if it
+    stopped early. resultCache is resultcache.HIT if the result was
+    loaded from the result cache, resultcache.WARM_START if the fit started
+    from a cached result of another config, else None. sweep is a dict of
+    the 'runs' summary and 'selected' run index of a parameter sweep, if
+    one was run. incremental is a dict of the number of 'changed points'
+    and 'free nodes' of an incremental re-fit, if the fit was one. errors
+    is the errorstats.summariseErrors dict of the output errors.
+    '''
+
+    def __init__(self):
+        self.iterations = []
+        self.phases = OrderedDict()
+        self.stage = 0
+        self.stopReason = None
+        self.resultCache = None
+        self.sweep = None
+        self.incremental = None
+        self.errors = None
+        self._current = None
+
+    def startIteration(self, iteration):
+        self._current = OrderedDict((k, None) for k in ITERATION_INFO)
+        self._current['stage'] = self.stage
+        self._current['iteration'] = iteration
+        for p in ITERATION_PHASES:
+            self._current[p] = 0.0
+
+    def endIteration(self, **info):
+        self._current.update(info)
+        self.iterations.append(self._current)
+        self._current = None
+
+    def addTime(self, name, seconds):
+        '''
+        Add time to a phase of the current iteration, or to a phase outside
+        iterations if no iteration has been started.
+        '''
+        if self._current is not None:
+            self._current[name] = self._current.get(name, 0.0) + seconds
+        else:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def iterationTime(self, *phases):
+        '''
+        Returns the seconds spent so far in phases in the current
+        iteration.
+        '''
+        return sum(self._current[p] for p in phases)
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Context manager timing the enclosed block as phase name.
+        '''
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - t0)
+
+    def columns(self):
+        return ITERATION_INFO + ITERATION_PHASES
+
+    def rows(self):
+        '''
+        Returns a list of the column values of each iteration.
+        '''
+        return [[it.get(c) for c in self.columns()] for it in self.iterations]
+
+    def totals(self):
+        '''
+        Returns the total seconds spent in each phase over all iterations
+        and outside iterations.
+        '''
+        totals = OrderedDict((p, sum(it[p] for it in self.iterations)) for p in ITERATION_PHASES)
+        totals.update(self.phases)
+        return totals
+
+    def toDict(self):
+        return {
+            'iterations': [dict(it) for it in self.iterations],
+            'phases': dict(self.phases),
+            'totals': dict(self.totals()),
+            'stop reason': self.stopReason,
+            'result cache': self.resultCache,
+            'sweep': self.sweep,
+            'incremental': self.incremental,
+            'errors': self.errors,
+        }
@@ -0,0 +1,126 @@
+'''
+Incremental re-fitting of a mesh to a point cloud that has changed only
+locally, e.g. after a segmentation is corrected in a small patch.
+
+The points that were added, moved or removed are found by a spatial diff
+of the old and new clouds. Only the nodes of the elements near those
+points are optimised, starting from the previous fitted parameters, and
+all other nodes are fixed, so a small change costs a small fit.
+'''
+import numpy as np
+from scipy.spatial import cKDTree
+
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep.meshfitting import FIT_CONFIG_DEFAULTS
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import MeshSampler
+
+# relative to the size of the new cloud, default distance within which
+# an old and new point are the same point
+_DEFAULT_TOLERANCE = 1e-6
+
+# fraction of the points or nodes that, if changed, make a full fit
+# cheaper than an incremental one
+MAX_CHANGED_FRACTION = 0.5
+
+
+def _unmatched(points, tree, tol):
+    '''
+    Returns a mask of the points with no point of tree within tol.
+    '''
+    if tree.n == 0:
+        return np.ones(points.shape[0], dtype=bool)
+    dist = tree.query(points, k=1, distance_upper_bound=tol, workers=-1)[0]
+    return np.isinf(dist)
+
+
+def changedPoints(oldData, newData, tol=None, oldTree=None, newTree=None):
+    '''
+    Returns the points of newData that are not in oldData and the points
+    of oldData that are not in newData, i.e. the added, moved and removed
+    points, stacked. Points within tol of each other are the same point.
+    tol defaults to 1e-6 times the size of newData. oldTree and newTree
+    are optional cKDTrees of the clouds.
+    '''
+    if (oldData is newData) or ((oldData.shape == newData.shape) and np.array_equal(oldData, newData)):
+        return np.zeros((0, newData.shape[1]), dtype=newData.dtype)
+
+    if tol is None:
+        tol = _DEFAULT_TOLERANCE * float(np.linalg.norm(newData.max(0) - newData.min(0)))
+    if oldTree is None:
+        oldTree = cKDTree(oldData)
+    if newTree is None:
+        newTree = cKDTree(newData)
+
+    return np.vstack([
+        newData[_unmatched(newData, oldTree, tol)],
+        oldData[_unmatched(oldData, newTree, tol)].astype(newData.dtype),
+    ])
+
+
+def nodesNearPoints(GF, params, points, GD, radius=0.0, basisCache=None):
+    '''
+    Returns the sorted numbers of the nodes of the elements of GF, with
+    parameters params, near points: the elements with a sample point of
+    discretisation GD within radius of a point, and the element of the
+    sample point closest to each point.
+    '''
+    if points.shape[0] == 0:
+        return np.zeros(0, dtype=int)
+    if basisCache is None:
+        basisCache = meshfitting.getConfigBasisCache({})
+
+    params = np.asarray(params, dtype=float)
+    A, rowElements = MeshSampler(GF, basisCache).evaluationMatrix(GD, params)
+    ep = A.dot(params.reshape((params.shape[0], -1)).T)
+    sampleTree = cKDTree(ep)
+
+    near = np.zeros(ep.shape[0], dtype=bool)
+    near[sampleTree.query(points, k=1)[1]] = True
+    if radius > 0.0:
+        for rows in sampleTree.query_ball_point(points, radius):
+            near[rows] = True
+
+    elements = np.unique(rowElements[near])
+    return np.unique(A[np.isin(rowElements, elements)].nonzero()[1])
+
+
+def fitIncremental(GF, params, oldData, newData, newDataWeights, config, callback=None, dataTree=None,
+                   cancelToken=None, trace=None, oldDataTree=None, elementErrors=False):
+    '''
+    Re-fit GF, previously fitted to the prepared point cloud oldData with
+    parameters params, to the prepared point cloud newData, optimising only
+    the nodes near the changed points. dataTree and oldDataTree are
+    optional indices of newData and oldData from meshfitting.buildDataTree.
+    The other arguments are as for meshfitting.fitMesh, and the
+    'incremental tolerance' and 'incremental radius' configs set the
+    tolerance of changedPoints and the radius of nodesNearPoints. Nodes
+    fixed in config stay fixed. If no points changed, only the errors of
+    params are evaluated.
+
+    Returns the outputs of meshfitting.fitMesh with elementErrors, plus the
+    number of changed points and the number of nodes optimised, or None
+    without fitting if more than MAX_CHANGED_FRACTION of the points or
+    the nodes changed, for a full fit instead.
+    '''
+    tol = eval(config.get('incremental tolerance', FIT_CONFIG_DEFAULTS['incremental tolerance']))
+    radius = float(eval(config.get('incremental radius', FIT_CONFIG_DEFAULTS['incremental radius'])))
+    fitkwargs = meshfitting.mapFitConfigs(config)
+
+    changed = changedPoints(oldData, newData, tol, oldDataTree, dataTree)
+    freeNodes = nodesNearPoints(
+        GF, params, changed, fitkwargs['GD'], radius, meshfitting.getConfigBasisCache(config)
+    )
+    freeNodes = np.setdiff1d(freeNodes, fitkwargs['fixed_nodes'])
+    nNodes = np.shape(params)[1]
+    if (changed.shape[0] > MAX_CHANGED_FRACTION * newData.shape[0]) or \
+            (len(freeNodes) > MAX_CHANGED_FRACTION * nNodes):
+        return None
+    fixedNodes = np.setdiff1d(np.arange(nNodes), freeNodes)
+
+    config = dict(config)
+    config['fixed nodes'] = ','.join(str(n) for n in fixedNodes)
+    fitOutput = meshfitting.fitMesh(
+        meshfitting.shareTopology(GF, params), newData, newDataWeights, config, callback, dataTree,
+        cancelToken, trace, elementErrors
+    )
+    return fitOutput + (changed.shape[0], len(freeNodes))
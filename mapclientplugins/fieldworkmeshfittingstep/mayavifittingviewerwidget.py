@@ -18,12 +18,13 @@ This file is part of MAP Client. (http://launchpad.net/mapclient)
     along with MAP Client.  If not, see <http://www.gnu.org/licenses/>..
 '''
 import os
+import threading
 
 os.environ['ETS_TOOLKIT'] = 'qt'
 
 from PySide6.QtWidgets import QDialog, QAbstractItemView, QTableWidgetItem
 from PySide6.QtCore import Qt
-from PySide6.QtCore import QThread, Signal
+from PySide6.QtCore import QThread, QTimer, Signal
 
 from mapclientplugins.fieldworkmeshfittingstep.ui_mayavifittingviewerwidget import Ui_Dialog
 from traits.api import on_trait_change
@@ -31,19 +32,70 @@ from traits.api import on_trait_change
 from gias3.mapclientpluginutilities.viewers import MayaviViewerObjectsContainer, MayaviViewerFieldworkModel, colours
 from gias3.mapclientpluginutilities.viewers.mayaviviewerdatapoints import MayaviViewerDataPoints
 
-import copy
+from mapclientplugins.fieldworkmeshfittingstep.meshfitting import shareTopology
+from mapclientplugins.fieldworkmeshfittingstep.pointlod import PointCloudLOD
+from mapclientplugins.fieldworkmeshfittingstep.sweep import SWEEP_ARGS
+
+
+class _LatestOutput(object):
+    '''
+    Holds the newest fit output emitted by the fit thread until the viewer
+    takes it. Emitting replaces any output not yet taken, so the viewer
+    only renders the newest, and never waits on the viewer.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._output = None
+
+    def emit(self, output):
+        with self._lock:
+            self._output = output
+
+    def take(self):
+        '''
+        Returns the newest output not yet taken, or None.
+        '''
+        with self._lock:
+            output, self._output = self._output, None
+        return output
+
+
+class _LODDataPoints(MayaviViewerDataPoints):
+    '''
+    Data points rendered within a point budget, with more points drawn in
+    the view as it is zoomed in. See pointlod.PointCloudLOD.
+    '''
+
+    def __init__(self, name, coordinates, budget, render_args=None):
+        self._lod = PointCloudLOD(coordinates, budget)
+        self._view = None
+        super(_LODDataPoints, self).__init__(name, coordinates[self._lod.initial()], render_args=render_args)
+
+    def refine(self, camera):
+        '''
+        Draw the points selected for the view of camera, if it has changed.
+        '''
+        view = (tuple(camera.position), tuple(camera.focal_point), camera.view_angle)
+        if (self.sceneObject is None) or (view == self._view):
+            return
+
+        self._view = view
+        d = self._lod.points[self._lod.visible(*view)]
+        self._coordinates = d
+        self.sceneObject.points.mlab_source.reset(x=d[:, 0], y=d[:, 1], z=d[:, 2])
 
 
 class _ExecThread(QThread):
     finalUpdate = Signal(tuple)
-    update = Signal(tuple)
 
     def __init__(self, func):
         QThread.__init__(self)
         self.func = func
+        self.latest = _LatestOutput()
 
     def run(self):
-        output = self.func(self.update)
+        output = self.func(self.latest)
         self.finalUpdate.emit(output)
 
 
@@ -59,14 +111,18 @@ class MayaviFittingViewerWidget(QDialog):
     _GFFittedRenderArgs = {'color': (1, 1, 0)}
     _GFD = [15, 15]
 
+    # columns of the sweep runs table after the swept arguments
+    _sweepTableColumns = ('rmse', 'normal discontinuity', 'seconds', 'pareto')
+
     _fitParamTableRows = ('fit mode', 'mesh discretisation', 'sobelov discretisation', \
                           'sobelov weight', 'normal discretisation', 'normal weight', \
                           'max iterations', 'max sub-iterations', 'xtol', 'kdtree args', \
                           'n closest points', 'verbose', 'fixed nodes', 'GUI')
 
-    def __init__(self, data, GFUnfitted, config, fitFunc, resetCallback, parent=None):
+    def __init__(self, data, GFUnfitted, config, fitFunc, resetCallback, selectSweepFunc=None, parent=None):
         '''
-        Constructor
+        Constructor. selectSweepFunc(index) outputs run index of the last
+        sweep, returning its fit output as fitFunc does.
         '''
         QDialog.__init__(self, parent)
         self._ui = Ui_Dialog()
@@ -78,18 +134,25 @@ class MayaviFittingViewerWidget(QDialog):
         self.selectedObjectName = None
         self._data = data
         self._GFUnfitted = GFUnfitted
-        self._GFFitted = copy.deepcopy(self._GFUnfitted)
+        self._GFFitted = shareTopology(self._GFUnfitted)
         self._fitFunc = fitFunc
         self._config = config
         self._resetCallback = resetCallback
+        self._selectSweepFunc = selectSweepFunc
+        self._ui.sweepGroup.setVisible(False)
 
         self._worker = _ExecThread(self._fitFunc)
         self._worker.finalUpdate.connect(self._fitUpdate)
-        self._worker.update.connect(self._fitCallback)
+
+        # live previews of the fit are rendered from the newest output at
+        # most 'preview rate' times per second
+        self._previewTimer = QTimer(self)
+        self._previewTimer.timeout.connect(self._fitCallback)
 
         # create self._objects
         self._objects = MayaviViewerObjectsContainer()
-        self._objects.addObject('data', MayaviViewerDataPoints('data', self._data, render_args=self._dataRenderArgs))
+        budget = eval(self._config.get('render point budget', 'None'))
+        self._objects.addObject('data', _LODDataPoints('data', self._data, budget, render_args=self._dataRenderArgs))
         self._objects.addObject('GF Unfitted', MayaviViewerFieldworkModel('GF Unfitted', self._GFUnfitted, self._GFD,
                                                                           render_args=self._GFUnfittedRenderArgs))
         self._objects.addObject('GF Fitted', MayaviViewerFieldworkModel('GF Fitted', self._GFFitted, self._GFD,
@@ -100,6 +163,18 @@ class MayaviFittingViewerWidget(QDialog):
         self._initialiseSettings()
         self._refresh()
 
+        # the data points in view are re-selected once the camera has
+        # stopped moving
+        self._lodTimer = QTimer(self)
+        self._lodTimer.setSingleShot(True)
+        self._lodTimer.setInterval(200)
+        self._lodTimer.timeout.connect(self._refineDataPoints)
+        # the camera is only created when the scene is activated
+        self._cameraObserved = False
+        self._scene.on_trait_change(self._observeCamera, 'activated')
+        if self._scene.camera is not None:
+            self._observeCamera()
+
         # self.testPlot()
         # self.drawObjects()
 
@@ -115,6 +190,7 @@ class MayaviFittingViewerWidget(QDialog):
         self._ui.resetButton.clicked.connect(self._reset)
         self._ui.abortButton.clicked.connect(self._abort)
         self._ui.acceptButton.clicked.connect(self._accept)
+        self._ui.sweepSelectButton.clicked.connect(self._selectSweepRun)
 
         # connect up changes to params table
         self._ui.fitParamsTableWidget.itemChanged.connect(self._fitParamsTableChanged)
@@ -195,14 +271,32 @@ class MayaviFittingViewerWidget(QDialog):
         for name in self._objects.getObjectNames():
             self._objects.getObject(name).draw(self._scene)
 
+    def _observeCamera(self):
+        if self._cameraObserved or (self._scene.camera is None):
+            return
+
+        self._cameraObserved = True
+        self._scene.camera.add_observer('ModifiedEvent', lambda obj, event: self._lodTimer.start())
+        self._lodTimer.start()
+
+    def _refineDataPoints(self):
+        self._objects.getObject('data').refine(self._scene.camera)
+
     def _fitUpdate(self, fitOutput):
-        GFFitted, GFParamsFitted, RMSEFitted, errorsFitted = fitOutput
-        self._GFFitted = copy.deepcopy(GFFitted)
+        GFFitted, GFParamsFitted, RMSEFitted, errorsFitted, fitTrace = fitOutput
+
+        # previews still pending are older than the final output
+        self._previewTimer.stop()
+        self._worker.latest.take()
 
         # update error fields
         self._ui.RMSELineEdit.setText(str(RMSEFitted))
-        self._ui.meanErrorLineEdit.setText(str(errorsFitted.mean()))
-        self._ui.SDLineEdit.setText(str(errorsFitted.std()))
+        # summarised in chunks when the fit output was set
+        self._ui.meanErrorLineEdit.setText(str(fitTrace.errors['mean']))
+        self._ui.SDLineEdit.setText(str(fitTrace.errors['sd']))
+
+        self._updateTraceTable(fitTrace)
+        self._updateSweepTable(fitTrace)
 
         # update fitted GF
         fittedObj = self._objects.getObject('GF Fitted')
@@ -213,12 +307,82 @@ class MayaviFittingViewerWidget(QDialog):
         # unlock reg ui
         self._fitUnlockUI()
 
+    def _updateTraceTable(self, fitTrace):
+        columns = fitTrace.columns()
+        rows = fitTrace.rows()
+        totals = fitTrace.totals()
+        table = self._ui.fitTraceTableWidget
+        table.clear()
+        table.setColumnCount(len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        otherPhases = [k for k in totals if k not in columns]
+        table.setRowCount(len(rows) + 1 + len(otherPhases))
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                if isinstance(value, float):
+                    value = '{:.4g}'.format(value)
+                table.setItem(r, c, QTableWidgetItem('' if value is None else str(value)))
+
+        # total time of each iteration phase, then the time spent in each
+        # phase outside iterations
+        r = len(rows)
+        table.setItem(r, 0, QTableWidgetItem('total'))
+        for c, name in enumerate(columns):
+            if name in totals:
+                table.setItem(r, c, QTableWidgetItem('{:.4g}'.format(totals[name])))
+        for name in otherPhases:
+            r += 1
+            table.setItem(r, 0, QTableWidgetItem(name))
+            table.setItem(r, 1, QTableWidgetItem('{:.4g}'.format(totals[name])))
+        table.resizeColumnsToContents()
+
+    def _updateSweepTable(self, fitTrace):
+        # only shown after a sweep
+        table = self._ui.sweepTableWidget
+        table.clear()
+        if not fitTrace.sweep:
+            table.setRowCount(0)
+            self._ui.sweepGroup.setVisible(False)
+            return
+
+        runs = fitTrace.sweep['runs']
+        columns = [a for a in SWEEP_ARGS if any(a in run for run in runs)] + list(self._sweepTableColumns)
+        table.setColumnCount(len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.setRowCount(len(runs))
+        for r, run in enumerate(runs):
+            for c, name in enumerate(columns):
+                value = run.get(name)
+                if isinstance(value, float):
+                    value = '{:.4g}'.format(value)
+                table.setItem(r, c, QTableWidgetItem('' if value is None else str(value)))
+        table.selectRow(fitTrace.sweep['selected'])
+        table.resizeColumnsToContents()
+        self._ui.sweepGroup.setVisible(True)
+
+    def _selectSweepRun(self):
+        row = self._ui.sweepTableWidget.currentRow()
+        if (row < 0) or (self._selectSweepFunc is None):
+            return
+
+        # later fits with unchanged runs output the same run
+        self._config['sweep selection'] = str(row)
+        self._fitUpdate(self._selectSweepFunc(row))
+
     def _fitLockUI(self):
+        rate = eval(self._config.get('preview rate', 'None'))
+        if rate:
+            self._previewTimer.start(max(1, int(1000.0 / rate)))
+
         self._ui.fitParamsTableWidget.setEnabled(False)
         self._ui.fitButton.setEnabled(False)
         self._ui.resetButton.setEnabled(False)
         self._ui.acceptButton.setEnabled(False)
+        # the fit thread still updates the scene, so a running fit is
+        # stopped before aborting
         self._ui.abortButton.setEnabled(False)
+        self._ui.stopButton.setEnabled(True)
+        self._ui.sweepSelectButton.setEnabled(False)
 
     def _fitUnlockUI(self):
         self._ui.fitParamsTableWidget.setEnabled(True)
@@ -226,13 +390,22 @@ class MayaviFittingViewerWidget(QDialog):
         self._ui.resetButton.setEnabled(True)
         self._ui.acceptButton.setEnabled(True)
         self._ui.abortButton.setEnabled(True)
+        self._ui.stopButton.setEnabled(False)
+        self._ui.sweepSelectButton.setEnabled(
+            (self._selectSweepFunc is not None) and (self._ui.sweepTableWidget.rowCount() > 0)
+        )
+
+    def _fitCallback(self):
+        output = self._worker.latest.take()
+        if output is None:
+            return
 
-    def _fitCallback(self, output):
         GFParamsFitted = output[1]
         fittedObj = self._objects.getObject('GF Fitted')
         fittedObj.updateGeometry(GFParamsFitted, self._scene)
         fittedTableItem = self._ui.tableWidget.item(2, self.objectTableHeaderColumns['visible'])
-        fittedTableItem.setCheckState(Qt.Checked)
+        if fittedTableItem.checkState() != Qt.Checked:
+            fittedTableItem.setCheckState(Qt.Checked)
 
     def _reset(self):
         self._resetCallback()
@@ -245,6 +418,12 @@ class MayaviFittingViewerWidget(QDialog):
         self._ui.RMSELineEdit.clear()
         self._ui.meanErrorLineEdit.clear()
         self._ui.SDLineEdit.clear()
+        self._ui.fitTraceTableWidget.clear()
+        self._ui.fitTraceTableWidget.setRowCount(0)
+        self._ui.sweepTableWidget.clear()
+        self._ui.sweepTableWidget.setRowCount(0)
+        self._ui.sweepGroup.setVisible(False)
+        self._ui.sweepSelectButton.setEnabled(False)
 
     def _accept(self):
         self._close()
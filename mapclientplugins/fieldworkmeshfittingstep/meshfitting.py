@@ -0,0 +1,409 @@
+'''
+Qt-free mesh fitting core shared by the MAP Client step and the batch
+fitting entry point.
+'''
+import copy
+import os
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from mapclientplugins.fieldworkmeshfittingstep import basiscache
+from mapclientplugins.fieldworkmeshfittingstep import convergence
+from mapclientplugins.fieldworkmeshfittingstep import downsampling
+from mapclientplugins.fieldworkmeshfittingstep import errorstats
+from mapclientplugins.fieldworkmeshfittingstep import resultcache
+from mapclientplugins.fieldworkmeshfittingstep import surfacefitting
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import elementNumbers, flatFunction
+
+# maps config keys to fitting function argument names
+FIT_CONFIG_DICT = {}
+FIT_CONFIG_DICT['mesh discretisation'] = 'GD'
+FIT_CONFIG_DICT['sobelov discretisation'] = 'sob_d'
+FIT_CONFIG_DICT['sobelov weight'] = 'sob_w'
+FIT_CONFIG_DICT['normal discretisation'] = 'normal_d'
+FIT_CONFIG_DICT['normal weight'] = 'normal_w'
+FIT_CONFIG_DICT['max sub-iterations'] = 'it_max_per_it'
+FIT_CONFIG_DICT['xtol'] = 'xtol'
+FIT_CONFIG_DICT['max iterations'] = 'it_max'
+FIT_CONFIG_DICT['fit mode'] = 'g_obj_type'
+FIT_CONFIG_DICT['n closest points'] = 'n_closest_points'
+FIT_CONFIG_DICT['kdtree args'] = 'tree_args'
+FIT_CONFIG_DICT['verbose'] = 'fit_verbose'
+FIT_CONFIG_DICT['fixed nodes'] = 'fixed_nodes'
+FIT_CONFIG_DICT['precision'] = 'precision'
+FIT_CONFIG_DICT['adaptive discretisation'] = 'adaptive_gd'
+FIT_CONFIG_DICT['query workers'] = 'query_workers'
+FIT_CONFIG_DICT['query chunk size'] = 'query_chunk'
+
+# fitting function arguments that do not change the result of a fit
+_NON_RESULT_ARGS = ('fit_verbose', 'query_workers', 'query_chunk')
+
+# default values of the fitting configs, as strings like the step config
+FIT_CONFIG_DEFAULTS = {}
+FIT_CONFIG_DEFAULTS['mesh discretisation'] = '5.0'
+FIT_CONFIG_DEFAULTS['sobelov discretisation'] = '[8,8]'
+FIT_CONFIG_DEFAULTS['sobelov weight'] = '[1e-6, 1e-6, 1e-6, 1e-6, 2e-6]'
+FIT_CONFIG_DEFAULTS['normal discretisation'] = '8'
+FIT_CONFIG_DEFAULTS['normal weight'] = '50.0'
+FIT_CONFIG_DEFAULTS['max sub-iterations'] = '3'
+FIT_CONFIG_DEFAULTS['xtol'] = '1e-6'
+FIT_CONFIG_DEFAULTS['max iterations'] = '5'
+FIT_CONFIG_DEFAULTS['fit mode'] = 'DPEP'
+FIT_CONFIG_DEFAULTS['n closest points'] = '1'
+FIT_CONFIG_DEFAULTS['kdtree args'] = '{}'
+FIT_CONFIG_DEFAULTS['verbose'] = 'True'
+FIT_CONFIG_DEFAULTS['fixed nodes'] = 'None'
+FIT_CONFIG_DEFAULTS['basis cache size'] = '32'
+FIT_CONFIG_DEFAULTS['basis cache dir'] = 'None'
+FIT_CONFIG_DEFAULTS['fit schedule'] = 'None'
+FIT_CONFIG_DEFAULTS['downsample spacing'] = 'None'
+FIT_CONFIG_DEFAULTS['downsample points'] = 'None'
+FIT_CONFIG_DEFAULTS['plateau iterations'] = '3'
+FIT_CONFIG_DEFAULTS['plateau tolerance'] = 'None'
+FIT_CONFIG_DEFAULTS['timeout'] = 'None'
+FIT_CONFIG_DEFAULTS['result cache dir'] = 'None'
+FIT_CONFIG_DEFAULTS['result cache size'] = '1024'
+FIT_CONFIG_DEFAULTS['precision'] = 'float64'
+FIT_CONFIG_DEFAULTS['sweep'] = 'None'
+FIT_CONFIG_DEFAULTS['sweep processes'] = 'None'
+FIT_CONFIG_DEFAULTS['sweep selection'] = 'knee'
+FIT_CONFIG_DEFAULTS['incremental'] = 'False'
+FIT_CONFIG_DEFAULTS['incremental tolerance'] = 'None'
+FIT_CONFIG_DEFAULTS['incremental radius'] = '0.0'
+FIT_CONFIG_DEFAULTS['adaptive discretisation'] = 'None'
+FIT_CONFIG_DEFAULTS['query workers'] = 'None'
+FIT_CONFIG_DEFAULTS['query chunk size'] = '262144'
+FIT_CONFIG_DEFAULTS['element errors'] = 'False'
+
+
+def parseFixedNodes(inputStr):
+    '''
+    Parse a string of comma-separated node numbers and ranges, e.g.
+    "0-10,15,20-22", into a list of node numbers.
+    '''
+    fixedNodes = []
+    if (inputStr == 'none') or (inputStr == 'None') or (len(inputStr) == 0):
+        return fixedNodes
+
+    words = inputStr.split(',')
+    for w in words:
+        if '-' in w:
+            x0, x1 = w.split('-')
+            fixedNodes += range(int(x0), int(x1) + 1)
+        else:
+            fixedNodes.append(int(w))
+
+    return fixedNodes
+
+
+def mapFitConfigs(config):
+    '''
+    Map a step-style config dict of strings to keyword arguments of the
+    fitting function. Config keys not given fall back to
+    FIT_CONFIG_DEFAULTS.
+    '''
+    fitkwargs = {}
+    for k, v in list(FIT_CONFIG_DICT.items()):
+        value = config.get(k, FIT_CONFIG_DEFAULTS[k])
+        if k in ('fit mode', 'precision'):
+            fitkwargs[v] = value
+        elif k == 'fixed nodes':
+            fitkwargs[v] = parseFixedNodes(value)
+        else:
+            fitkwargs[v] = eval(value)
+
+    return fitkwargs
+
+
+def parseFitSchedule(inputStr):
+    '''
+    Parse a fit schedule string into a list of stages. Each stage is a
+    dict of fitting function arguments (the values of FIT_CONFIG_DICT,
+    e.g. GD, sob_w, normal_w, it_max, n_closest_points) that override the
+    configured values for that stage. An empty schedule gives one stage
+    using the configured values.
+    '''
+    if (inputStr == 'none') or (inputStr == 'None') or (len(inputStr) == 0):
+        return [{}]
+
+    stages = eval(inputStr)
+    if isinstance(stages, dict):
+        stages = [stages]
+
+    validArgs = set(FIT_CONFIG_DICT.values())
+    for stage in stages:
+        invalidArgs = set(stage.keys()) - validArgs
+        if invalidArgs:
+            raise ValueError('Invalid fit schedule arguments: {}'.format(', '.join(sorted(invalidArgs))))
+
+    return list(stages)
+
+
+def getConfigBasisCache(config):
+    '''
+    Returns the process basis cache sized and located according to the
+    'basis cache size' and 'basis cache dir' configs.
+    '''
+    maxEntries = int(eval(config.get('basis cache size', FIT_CONFIG_DEFAULTS['basis cache size'])))
+    cacheDir = config.get('basis cache dir', FIT_CONFIG_DEFAULTS['basis cache dir']).strip()
+    if (cacheDir == 'none') or (cacheDir == 'None') or (len(cacheDir) == 0):
+        cacheDir = None
+
+    return basiscache.getBasisCache(maxEntries, cacheDir)
+
+
+def getConfigResultCache(config):
+    '''
+    Returns a result cache in the 'result cache dir' config directory,
+    capped at 'result cache size' MB, or None if no directory is
+    configured.
+    '''
+    cacheDir = config.get('result cache dir', FIT_CONFIG_DEFAULTS['result cache dir']).strip()
+    if (cacheDir == 'none') or (cacheDir == 'None') or (len(cacheDir) == 0):
+        return None
+
+    maxMB = float(eval(config.get('result cache size', FIT_CONFIG_DEFAULTS['result cache size'])))
+    return resultcache.ResultCache(cacheDir, int(maxMB * 2 ** 20))
+
+
+def fitConfigKey(config):
+    '''
+    Returns a key of the configs that affect the result of a fit, after
+    parsing and filling in defaults, so that equivalent configs written
+    differently give the same key.
+    '''
+    fitkwargs = mapFitConfigs(config)
+    stages = parseFitSchedule(config.get('fit schedule', FIT_CONFIG_DEFAULTS['fit schedule']))
+    for kwargs in [fitkwargs] + stages:
+        for arg in _NON_RESULT_ARGS:
+            kwargs.pop(arg, None)
+    return basiscache.makeKey(
+        sorted(fitkwargs.items()),
+        stages,
+        getDownsampleConfig(config),
+        eval(config.get('plateau iterations', FIT_CONFIG_DEFAULTS['plateau iterations'])),
+        eval(config.get('plateau tolerance', FIT_CONFIG_DEFAULTS['plateau tolerance'])),
+    )
+
+
+def getDownsampleConfig(config):
+    '''
+    Returns the (spacing, number of points) downsampling targets in
+    config. Both are None if the point cloud is not to be downsampled.
+    '''
+    spacing = eval(config.get('downsample spacing', FIT_CONFIG_DEFAULTS['downsample spacing']))
+    nPoints = eval(config.get('downsample points', FIT_CONFIG_DEFAULTS['downsample points']))
+    if spacing is not None:
+        spacing = float(spacing)
+    if nPoints is not None:
+        nPoints = int(nPoints)
+
+    return spacing, nPoints
+
+
+def getPrecision(config):
+    '''
+    Returns the dtype of the 'precision' config that point clouds are
+    fitted in.
+    '''
+    precision = config.get('precision', FIT_CONFIG_DEFAULTS['precision']).strip()
+    if precision not in surfacefitting.PRECISIONS:
+        raise ValueError('Invalid precision: ' + precision)
+    return np.dtype(precision)
+
+
+def prepareData(data, dataWeights, config):
+    '''
+    Downsample the point cloud data according to the 'downsample spacing'
+    or 'downsample points' configs. Spacing takes precedence if both are
+    given.
+
+    Returns the points, in the configured precision, and weights to fit.
+    Weights of the downsampled points are the root of the summed squared
+    weights of the points they replace, see downsampling.voxelDownsample,
+    so the downsampled cloud has the same influence on the fit as the
+    original.
+    '''
+    spacing, nPoints = getDownsampleConfig(config)
+    if (spacing is not None) or (nPoints is not None):
+        data, dataWeights = downsampling.voxelDownsample(data, spacing=spacing, nPoints=nPoints, weights=dataWeights)
+
+    return loadArray(data, getPrecision(config)), dataWeights
+
+
+def loadArray(arrayIn, dtype=float):
+    '''
+    Returns arrayIn as a C-contiguous array of dtype, copying it only if
+    its dtype or memory layout is different. dtype None keeps the dtype of
+    arrayIn. Arrays that already are, e.g. np.memmap arrays, are used as
+    they are. arrayIn can also be the path of a .npy file, which is
+    memory-mapped read-only, or of a text file. None is returned as None.
+    '''
+    if isinstance(arrayIn, str):
+        if os.path.splitext(arrayIn)[1].lower() == '.npy':
+            arrayIn = np.load(arrayIn, mmap_mode='r')
+        else:
+            arrayIn = np.loadtxt(arrayIn)
+    elif arrayIn is None:
+        return None
+
+    return np.require(arrayIn, dtype=dtype, requirements='C')
+
+
+def buildDataTree(data):
+    '''
+    Build the spatial index of the point cloud data used for closest point
+    searches during fitting.
+    '''
+    return cKDTree(data)
+
+
+def needsDataTree(config):
+    '''
+    Returns True if a stage of the fit configured by config searches for
+    the closest data points, i.e. is an EPDP or 2WAY fit, so uses the
+    index of the data from buildDataTree. DPEP fits only index the mesh.
+    '''
+    mode = config.get('fit mode', FIT_CONFIG_DEFAULTS['fit mode'])
+    stages = parseFitSchedule(config.get('fit schedule', FIT_CONFIG_DEFAULTS['fit schedule']))
+    return any(stage.get('g_obj_type', mode) in ('EPDP', surfacefitting.TWO_WAY) for stage in stages)
+
+
+def shareTopology(GF, params=None):
+    '''
+    Returns a GeometricField sharing the mesh topology (ensemble field
+    function, point maps and triangulator) of GF, with its own copy of the
+    field parameters, or of params if given.
+
+    Much cheaper than copy.deepcopy(GF) on large meshes, so the step keeps
+    only parameter arrays between fits and uses this to make fields from
+    them when they are needed. The shared topology must not be modified.
+    '''
+    if params is None:
+        params = GF.field_parameters
+    shared = copy.copy(GF)
+    shared.field_parameters = np.array(params, dtype=float)
+    shared.points = [copy.copy(p) for p in GF.points]
+    for ensI, pointI in GF.ensemble_to_points_map.items():
+        shared.points[pointI].field_parameters = shared.field_parameters[:, ensI].copy()
+
+    return shared
+
+
+def fitMesh(GF, data, dataWeights, config, callback=None, dataTree=None, cancelToken=None, trace=None,
+            elementErrors=False):
+    '''
+    Fit GF to the point cloud data using the fitting configs in config.
+    dataTree is an optional index of data from buildDataTree to reuse
+    between fits of the same data. cancelToken is an optional
+    convergence.CancellationToken to stop the fit from another thread.
+    trace is an optional fittrace.FitTrace to record the time spent in each
+    iteration in.
+
+    If a fit schedule is configured, its stages are fitted in order, each
+    starting from the mesh fitted by the previous stage.
+
+    Each stage stops early if its RMS error improves by less than the
+    'plateau tolerance' over 'plateau iterations' iterations. The fit
+    stops if it is cancelled or runs longer than the 'timeout' in seconds.
+    Stages return the parameters of their best iteration.
+
+    Returns the fitted GF, the fitted parameters, the RMS error and the
+    error of each data point of the last stage, same as the outputs of the
+    step. If elementErrors is True, the errorstats.elementErrors dict of
+    the errors aggregated by their closest element is also returned.
+    '''
+    fitkwargs = mapFitConfigs(config)
+    fitkwargs['GF'] = GF
+    fitkwargs['data'] = data
+    fitkwargs['data_weights'] = dataWeights
+    fitkwargs['full_errors'] = True
+    fitkwargs['fit_output_callback'] = callback
+    fitkwargs['basis_cache'] = getConfigBasisCache(config)
+    fitkwargs['data_tree'] = dataTree
+    fitkwargs['error_elements'] = elementErrors
+
+    plateauIterations = int(eval(config.get('plateau iterations', FIT_CONFIG_DEFAULTS['plateau iterations'])))
+    plateauTolerance = eval(config.get('plateau tolerance', FIT_CONFIG_DEFAULTS['plateau tolerance']))
+    timeout = eval(config.get('timeout', FIT_CONFIG_DEFAULTS['timeout']))
+    deadline = None if timeout is None else time.time() + timeout
+
+    # call fitting functions
+    stages = parseFitSchedule(config.get('fit schedule', FIT_CONFIG_DEFAULTS['fit schedule']))
+    for stageI, stage in enumerate(stages):
+        stagekwargs = dict(fitkwargs)
+        stagekwargs.update(stage)
+        monitor = convergence.ConvergenceMonitor(
+            plateauIterations, plateauTolerance, token=cancelToken, deadline=deadline
+        )
+        stagekwargs['monitor'] = monitor
+        if trace is not None:
+            trace.stage = stageI
+        stagekwargs['trace'] = trace
+        stageOutput = surfacefitting.fitSurfacePerItSearch(**stagekwargs)
+        if trace is not None:
+            trace.stopReason = monitor.stopReason
+        if monitor.stopReason in (convergence.CANCELLED, convergence.TIMEOUT):
+            break
+
+    return _fitOutputs(stageOutput, elementErrors)
+
+
+def _fitOutputs(fitOutput, elementErrors):
+    '''
+    Returns the full errors output of surfacefitting.fitSurfacePerItSearch
+    as the outputs of fitMesh.
+    '''
+    # the errors are fitting outputs, so are converted without a copy
+    (GFFitted, paramsFitted, RMSEFitted, errorsFitted) = fitOutput[:4]
+    errorsFitted = errorstats.sqrtInPlace(errorsFitted)
+    if not elementErrors:
+        return GFFitted, paramsFitted, RMSEFitted, errorsFitted
+
+    return (GFFitted, paramsFitted, RMSEFitted, errorsFitted,
+            errorstats.elementErrors(errorsFitted, fitOutput[4], elementNumbers(flatFunction(GFFitted))))
+
+
+def evaluateErrors(GF, params, data, config, dataTree=None, elementErrors=False):
+    '''
+    Returns the outputs of fitMesh for the mesh GF with parameters params
+    and the point cloud data, without fitting: the errors of one closest
+    point search, with the configs of the last fit stage. GF is not
+    modified. Used to give the errors of a fit to a downsampled cloud
+    against the full cloud.
+    '''
+    fitkwargs = mapFitConfigs(config)
+    fitkwargs.update(parseFitSchedule(config.get('fit schedule', FIT_CONFIG_DEFAULTS['fit schedule']))[-1])
+    fitkwargs['GF'] = shareTopology(GF, params)
+    fitkwargs['data'] = data
+    fitkwargs['data_tree'] = dataTree
+    fitkwargs['full_errors'] = True
+    fitkwargs['error_elements'] = elementErrors
+    fitkwargs['basis_cache'] = getConfigBasisCache(config)
+    fitkwargs['fit_verbose'] = False
+    # with every node fixed, only the errors are evaluated
+    fitkwargs['fixed_nodes'] = np.arange(np.shape(params)[1])
+    fitkwargs['it_max'] = 1
+    return _fitOutputs(surfacefitting.fitSurfacePerItSearch(**fitkwargs), elementErrors)
+
+
+def isDownsampled(config):
+    '''
+    Returns True if config downsamples the point cloud before fitting.
+    '''
+    return getDownsampleConfig(config) != (None, None)
+
+
+def shareQueryWorkers(config, processes):
+    '''
+    Returns config for a fit run in one of processes concurrent processes:
+    if its 'query workers' is None, a copy with the cores shared between
+    the processes, rather than each fit searching with all of them.
+    '''
+    if config.get('query workers', FIT_CONFIG_DEFAULTS['query workers']) != 'None':
+        return config
+    config = dict(config)
+    config['query workers'] = str(max(1, os.cpu_count() // processes))
+    return config
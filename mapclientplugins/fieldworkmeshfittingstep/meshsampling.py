@@ -0,0 +1,383 @@
+'''
+Sampling of fieldwork meshes for fitting: element xi sample sets, and
+sparse matrices of basis function values and derivatives at those xi.
+
+Each matrix A maps the ensemble point parameters of one field coordinate
+to values at the sample points, i.e. X[:,c] = A.dot(P[c]). Sample sets and
+matrices only depend on the mesh topology and the discretisation, so they
+are stored in a basiscache.BasisCache and shared between fits. Those of
+per-element discretisations, which depend on the mesh geometry or adapt
+during a fit, are rarely reused by other fits, so are only kept in a small
+cache of the sampler.
+'''
+import hashlib
+
+import numpy as np
+from scipy import sparse
+from gias3.fieldwork.field import geometric_field_fitter as GFF
+from gias3.fieldwork.field.tools import discretisation
+
+from mapclientplugins.fieldworkmeshfittingstep.basiscache import BasisCache, makeKey
+
+# number of points sampled along each element edge to estimate its length
+_EDGE_LENGTH_SAMPLES = 5
+
+# number of entries of per-element discretisations kept by a MeshSampler
+_SAMPLER_CACHE_ENTRIES = 4
+
+
+def flatFunction(GF):
+    '''
+    Returns the flattened ensemble field function of GF without modifying
+    GF.
+    '''
+    F = GF.ensemble_field_function
+    if not F.is_flat():
+        F = F.flatten()[0]
+    return F
+
+
+def _elementBasisMap(F, elementNumber):
+    '''
+    Returns arrays of basis function index, ensemble point and weight for
+    each element basis function to ensemble point mapping.
+    '''
+    emap = F.mapper._element_to_ensemble_map[elementNumber]
+    basisI = []
+    ensI = []
+    weights = []
+    for n in range(len(emap)):
+        for e, w in zip(*emap[n]):
+            basisI.append(n)
+            ensI.append(e)
+            weights.append(w)
+
+    return np.array(basisI, dtype=int), np.array(ensI, dtype=int), np.array(weights, dtype=float)
+
+
+class _ElementEvaluator(object):
+    '''
+    Evaluates one element of the flat ensemble field function F with
+    parameters params, of shape (dimensions, number of ensemble points),
+    for the discretisation functions of gias3.
+    '''
+
+    def __init__(self, F, elementNumber, params):
+        self.element = F.mesh.elements[elementNumber]
+        self._basis = F.basis[self.element.type]
+        self._basisI, ensI, weights = _elementBasisMap(F, elementNumber)
+        self._weightedParams = weights[:, np.newaxis] * params[:, ensI].T
+
+    def eval(self, xi):
+        b = self._basis.eval(np.transpose(np.asarray(xi, dtype=float)))
+        return b[self._basisI, :].T.dot(self._weightedParams)
+
+
+def elementNumbers(F):
+    '''
+    Returns the sorted element numbers of the flat ensemble field function
+    F, in the order of the elements of MeshSampler matrices.
+    '''
+    return np.sort(list(F.mesh.elements.keys()))
+
+
+def meshTopologyKey(F):
+    '''
+    Returns a key identifying the element types and connectivity of the
+    flat ensemble field function F.
+    '''
+    elems = []
+    for elementNumber in np.sort(list(F.mesh.elements.keys())):
+        basisI, ensI, weights = _elementBasisMap(F, elementNumber)
+        elems.append((int(elementNumber), F.mesh.elements[elementNumber].type,
+                      tuple(basisI), tuple(ensI), tuple(weights)))
+
+    return makeKey(F.get_number_of_ensemble_points(), elems)
+
+
+def _assembleMatrix(F, elementNumbers, elemXi, nEnsemblePoints, evalBasis):
+    '''
+    Assemble a sparse matrix of basis values at the xi of each element.
+    evalBasis(basis, xi) should return an array of shape (nBasis, nXi).
+    '''
+    rows = []
+    cols = []
+    vals = []
+    row = 0
+    basisValues = {}
+    for elementNumber, xi in zip(elementNumbers, elemXi):
+        nPoints = xi.shape[0]
+        if nPoints == 0:
+            continue
+
+        element = F.mesh.elements[elementNumber]
+        bKey = (element.type, xi.shape, xi.tobytes())
+        b = basisValues.get(bKey)
+        if b is None:
+            b = evalBasis(F.basis[element.type], xi)
+            basisValues[bKey] = b
+
+        basisI, ensI, weights = _elementBasisMap(F, elementNumber)
+        rows.append(np.repeat(row + np.arange(nPoints), len(basisI)))
+        cols.append(np.tile(ensI, nPoints))
+        vals.append((b[basisI, :] * weights[:, np.newaxis]).T.ravel())
+        row += nPoints
+
+    A = sparse.coo_matrix(
+        (np.hstack(vals), (np.hstack(rows), np.hstack(cols))),
+        shape=(row, nEnsemblePoints)
+    )
+    return A.tocsr()
+
+
+class MeshSampler(object):
+    '''
+    Creates and caches the sample sets and basis matrices of a mesh.
+
+    inputs
+    ------
+    GF : the GeometricField to sample.
+    cache : a basiscache.BasisCache.
+    '''
+
+    def __init__(self, GF, cache):
+        self.GF = GF
+        self.F = flatFunction(GF)
+        self.cache = cache
+        self._samplerCache = BasisCache(_SAMPLER_CACHE_ENTRIES)
+        self.elements = elementNumbers(self.F)
+        self.nEnsemblePoints = self.F.get_number_of_ensemble_points()
+        self.topologyKey = meshTopologyKey(self.F)
+
+    def _edgeLengthMatrix(self):
+        '''
+        Matrix evaluating points along every element edge, and the index
+        of the element of each edge.
+        '''
+
+        def build():
+            s = np.linspace(0.0, 1.0, _EDGE_LENGTH_SAMPLES)
+            edgeXi = []
+            edgeElements = []
+            for ei, elementNumber in enumerate(self.elements):
+                element = self.F.mesh.elements[elementNumber]
+                xi = [edge.get_elem_coord(s) for edge in element.edges]
+                edgeXi.append(np.vstack(xi))
+                edgeElements += [ei] * len(xi)
+
+            A = _assembleMatrix(self.F, self.elements, edgeXi, self.nEnsemblePoints,
+                                lambda basis, x: basis.eval(x.T))
+            return A, np.array(edgeElements, dtype=int)
+
+        return self.cache.getOrBuild(makeKey(self.topologyKey, 'edge lengths', _EDGE_LENGTH_SAMPLES), build)
+
+    def _getCache(self, shared):
+        '''
+        Returns the shared cache, or the sampler cache for the sample sets
+        of float and adaptive discretisations, which change between
+        iterations, so that they do not evict shared entries or fill the
+        disk cache.
+        '''
+        return self.cache if shared else self._samplerCache
+
+    def elementDivisions(self, d, params=None):
+        '''
+        Returns the number of points in each xi direction of each element
+        for the discretisation d. If d is a float, each element is given
+        a regular grid with enough points that points along its longest
+        edge are at most d apart in the geometry given by params. This is
+        used for float Sobolev discretisations and the starting divisions
+        of adaptive discretisations. Float mesh discretisations are sampled
+        by geodesicXi instead.
+        '''
+        if isinstance(d, float):
+            if params is None:
+                params = self.GF.get_field_parameters()
+            A, edgeElements = self._edgeLengthMatrix()
+            X = A.dot(params.reshape((3, -1)).T).reshape((-1, _EDGE_LENGTH_SAMPLES, 3))
+            edgeLengths = np.sqrt(((X[:, 1:, :] - X[:, :-1, :]) ** 2.0).sum(2)).sum(1)
+            maxLengths = np.zeros(len(self.elements), dtype=float)
+            np.maximum.at(maxLengths, edgeElements, edgeLengths)
+            n = np.maximum(np.ceil(maxLengths / d).astype(int) + 1, 2)
+            return [(int(ni), int(ni)) for ni in n]
+        else:
+            return [tuple(int(di) for di in d)] * len(self.elements)
+
+    def sampleXi(self, divisions, shared=True):
+        '''
+        Returns a list of the xi sample points of each element given the
+        output of elementDivisions. shared is False to keep them out of
+        the shared cache.
+        '''
+
+        def build():
+            xiSets = {}
+            elemXi = []
+            for elementNumber, div in zip(self.elements, divisions):
+                element = self.F.mesh.elements[elementNumber]
+                xi = xiSets.get((element.type, div))
+                if xi is None:
+                    xi = element.generate_eval_grid(div).reshape((-1, element.dimensions))
+                    xiSets[(element.type, div)] = xi
+                elemXi.append(xi)
+            return elemXi
+
+        return self._getCache(shared).getOrBuild(makeKey(self.topologyKey, 'xi', tuple(divisions)), build)
+
+    def geodesicXi(self, d, params=None):
+        '''
+        Returns a list of the xi sample points of each element for the
+        float discretisation d, as gias3's
+        GeometricField.discretiseElementRegularGeoD gives them: each
+        element is subdivided until no neighbouring points are more than d
+        apart in the geometry given by params.
+        '''
+        if params is None:
+            params = self.GF.get_field_parameters()
+        params = np.asarray(params, dtype=float)
+        params = params.reshape((params.shape[0], -1))
+        elemXi = []
+        for elementNumber in self.elements:
+            xi = discretisation.discretiseRegularGeoD(d, _ElementEvaluator(self.F, elementNumber, params))
+            # sorted, as they are returned in set order
+            elemXi.append(xi[np.lexsort(xi.T[::-1])])
+        return elemXi
+
+    def evaluationMatrix(self, d, params=None):
+        '''
+        Returns the sparse matrix evaluating the mesh at the sample points
+        of discretisation d, and the element index of each sample point.
+        '''
+        if not isinstance(d, float):
+            return self.divisionsMatrix(self.elementDivisions(d, params))
+
+        elemXi = self.geodesicXi(d, params)
+
+        def build():
+            A = _assembleMatrix(self.F, self.elements, elemXi, self.nEnsemblePoints,
+                                lambda basis, x: basis.eval(x.T))
+            rowElements = np.repeat(np.arange(len(self.elements)), [xi.shape[0] for xi in elemXi])
+            return A, rowElements
+
+        # the subdivision only changes when the geometry changes enough
+        xiHash = hashlib.sha1(np.vstack(elemXi).tobytes()).hexdigest()
+        key = makeKey(self.topologyKey, 'geodesic', tuple(xi.shape[0] for xi in elemXi), xiHash)
+        return self._samplerCache.getOrBuild(key, build)
+
+    def divisionsMatrix(self, divisions, shared=True):
+        '''
+        Returns the sparse matrix evaluating the mesh at the sample points
+        of the given number of points in each xi direction of each
+        element, and the element index of each sample point. shared is
+        False to keep them out of the shared cache, e.g. for divisions
+        that adapt during a fit.
+        '''
+        divisions = [tuple(int(di) for di in div) for div in divisions]
+
+        def build():
+            elemXi = self.sampleXi(divisions, shared)
+            A = _assembleMatrix(self.F, self.elements, elemXi, self.nEnsemblePoints,
+                                lambda basis, x: basis.eval(x.T))
+            rowElements = np.repeat(np.arange(len(self.elements)), [xi.shape[0] for xi in elemXi])
+            return A, rowElements
+
+        key = makeKey(self.topologyKey, 'evaluation', tuple(divisions))
+        return self._getCache(shared).getOrBuild(key, build)
+
+    def derivativeMatrices(self, d, params=None):
+        '''
+        Returns a list of sparse matrices evaluating each first and second
+        derivative of the mesh at the sample points of discretisation d.
+        '''
+        return self._derivativeMatrices(self.elementDivisions(d, params), not isinstance(d, float))
+
+    def _derivativeMatrices(self, divisions, shared=True):
+
+        def build():
+            elemXi = self.sampleXi(divisions, shared)
+            element = self.F.mesh.elements[self.elements[0]]
+            nDerivs = int(element.dimensions ** 2 + 1)
+            return [
+                _assembleMatrix(self.F, self.elements, elemXi, self.nEnsemblePoints,
+                                lambda basis, x, k=k: basis.eval_derivatives(x.T, None)[k])
+                for k in range(nDerivs)
+            ]
+
+        key = makeKey(self.topologyKey, 'derivatives', tuple(divisions))
+        return self._getCache(shared).getOrBuild(key, build)
+
+    def sobolevMatrix(self, d, w, params=None):
+        '''
+        Returns a sparse matrix R factoring the Sobolev quadratic form of
+        discretisation d with a weight w[k] for each derivative matrix A_k
+        of derivativeMatrices: for the parameters p of one field
+        coordinate, |R.p|**2 is the sum of w[k] * |A_k.p|**2. R has a
+        block of rows for each element, the triangular factor of the
+        quadratic form of its sample points, so it has at most as many rows
+        as there are element basis functions, however fine d is.
+        '''
+        divisions = self.elementDivisions(d, params)
+        shared = not isinstance(d, float)
+        derivMatrices = self._derivativeMatrices(divisions, shared)
+        w = np.broadcast_to(np.asarray(w, dtype=float), (len(derivMatrices),))
+
+        def build():
+            scaled = [sparse.csr_matrix(np.sqrt(wk) * A) for wk, A in zip(w, derivMatrices)]
+            rowStarts = np.cumsum([0] + [xi.shape[0] for xi in self.sampleXi(divisions, shared)])
+            rows = []
+            cols = []
+            vals = []
+            nRows = 0
+            for start, end in zip(rowStarts[:-1], rowStarts[1:]):
+                blocks = [A[start:end].tocoo() for A in scaled]
+                elemCols = np.unique(np.hstack([b.col for b in blocks]))
+                M = np.zeros((len(blocks) * (end - start), len(elemCols)))
+                for k, b in enumerate(blocks):
+                    np.add.at(M, (k * (end - start) + b.row, np.searchsorted(elemCols, b.col)), b.data)
+                R = np.linalg.qr(M, mode='r')
+                r, c = np.nonzero(R)
+                rows.append(nRows + r)
+                cols.append(elemCols[c])
+                vals.append(R[r, c])
+                nRows += R.shape[0]
+
+            return sparse.csr_matrix(
+                (np.hstack(vals), (np.hstack(rows), np.hstack(cols))), shape=(nRows, self.nEnsemblePoints)
+            )
+
+        key = makeKey(self.topologyKey, 'sobolev', tuple(divisions), tuple(float(wk) for wk in w))
+        return self._getCache(shared).getOrBuild(key, build)
+
+    def edgeDerivativeMatrices(self, d):
+        '''
+        Returns sparse matrices evaluating the xi1 and xi2 derivatives at d
+        points along each edge shared by two elements, on each side of the
+        edge: (A1dxi1, A1dxi2, A2dxi1, A2dxi2). Row i of the side 1
+        matrices and row i of the side 2 matrices are the same point.
+        '''
+
+        def build():
+            smoother = GFF.normalSmoother2(self.F)
+            edgeElements1 = []
+            edgeElements2 = []
+            edgeXi1 = []
+            edgeXi2 = []
+            for enum1, edge1, enum2, edge2, direction in smoother.commonEdges:
+                edgeElements1.append(enum1)
+                edgeXi1.append(edge1.get_elem_coord(np.linspace(0.0, 1.0, d)))
+                edgeElements2.append(enum2)
+                if direction < 0:
+                    edgeXi2.append(edge2.get_elem_coord(np.linspace(1.0, 0.0, d)))
+                else:
+                    edgeXi2.append(edge2.get_elem_coord(np.linspace(0.0, 1.0, d)))
+
+            matrices = []
+            for elems, elemXi in ((edgeElements1, edgeXi1), (edgeElements2, edgeXi2)):
+                for deriv in ((1, 0), (0, 1)):
+                    matrices.append(
+                        _assembleMatrix(self.F, elems, elemXi, self.nEnsemblePoints,
+                                        lambda basis, x, deriv=deriv: basis.eval_derivatives(x.T, deriv))
+                    )
+            return tuple(matrices)
+
+        return self.cache.getOrBuild(makeKey(self.topologyKey, 'edge derivatives', d), build)
@@ -0,0 +1,135 @@
+'''
+Level of detail selection of large point clouds for rendering.
+
+Points are put in a progressive order in which every prefix is spread
+evenly over the cloud: the first point of each cell of an octree over the
+cloud comes before the points of finer cells. Rendering a prefix gives a
+spatially stratified subsample, and zooming in renders more of the order
+inside the view, within the same point budget. Only the rendered points
+are subsampled, the full cloud is still fitted.
+'''
+import numpy as np
+
+# octree depth of the progressive order
+LEVELS = 10
+
+# multiple of the remaining budget of points tested per chunk when
+# selecting points in view
+_CHUNK_FACTOR = 4
+
+
+def _spreadBits(x):
+    '''
+    Spread the low 10 bits of each integer in x to every third bit.
+    '''
+    x = (x | (x << 16)) & 0x030000FF
+    x = (x | (x << 8)) & 0x0300F00F
+    x = (x | (x << 4)) & 0x030C30C3
+    x = (x | (x << 2)) & 0x09249249
+    return x
+
+
+def mortonCodes(points, levels=LEVELS):
+    '''
+    Returns the Morton code of the cell containing each point in a grid of
+    2**levels cells along each side of the bounding cube of points. levels
+    is at most 10.
+    '''
+    lo = points.min(0)
+    span = float((points.max(0) - lo).max())
+    if span == 0.0:
+        span = 1.0
+    n = 2 ** levels
+    cells = np.minimum(((points - lo) * (n / span)).astype(np.int32), n - 1)
+    return (_spreadBits(cells[:, 0]) << 2) | (_spreadBits(cells[:, 1]) << 1) | _spreadBits(cells[:, 2])
+
+
+def progressiveOrder(points, levels=LEVELS, seed=0):
+    '''
+    Returns an ordering of points in which the first point of every octree
+    cell of each level comes before the other points of the next level, so
+    that every prefix of the order is spread evenly over the cloud. Points
+    of the same level are in random order.
+    '''
+    points = np.asarray(points)
+    nPoints = points.shape[0]
+    if nPoints == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    codes = mortonCodes(points, levels)
+    sortI = np.argsort(codes, kind='stable')
+    codes = codes[sortI]
+
+    # the first point of a cell at level l is where the sorted codes of
+    # the cells at level l change, i.e. where the highest differing bit of
+    # consecutive codes is in the bits of level l or coarser
+    pointLevels = np.empty(nPoints, dtype=np.int8)
+    pointLevels[0] = 0
+    diff = codes[1:] ^ codes[:-1]
+    highBit = np.frexp(diff)[1] - 1
+    pointLevels[1:] = np.where(diff == 0, levels + 1, levels - highBit // 3)
+
+    # shuffle, then stably sort the small integer levels, which numpy does
+    # in linear time
+    shuffle = np.random.RandomState(seed).permutation(nPoints)
+    return sortI[shuffle[np.argsort(pointLevels[shuffle], kind='stable')]]
+
+
+def inView(points, position, focalPoint, viewAngle, margin=1.5):
+    '''
+    Returns a mask of the points in front of a camera at position looking
+    at focalPoint within its view cone of viewAngle degrees, widened by
+    margin to cover the corners of non-square views.
+    '''
+    direction = np.asarray(focalPoint, dtype=float) - position
+    direction /= np.linalg.norm(direction)
+    v = points - position
+    depth = v.dot(direction)
+    offAxis = np.sqrt(np.maximum((v * v).sum(1) - depth * depth, 0.0))
+    return (depth > 0.0) & (offAxis <= depth * np.tan(np.radians(0.5 * viewAngle) * margin))
+
+
+class PointCloudLOD(object):
+    '''
+    Selects the points of a cloud to render within a point budget.
+
+    inputs
+    ------
+    points : nx3 array of the full point cloud. Not copied.
+    budget : maximum number of points to render. None to render all.
+    '''
+
+    def __init__(self, points, budget):
+        self.points = points
+        self.budget = budget
+        if (budget is None) or (budget >= points.shape[0]):
+            self.order = np.arange(points.shape[0])
+        else:
+            self.order = progressiveOrder(points)
+
+    def initial(self):
+        '''
+        Returns the indices of the points to render before zooming in.
+        '''
+        return self.order[:self.budget]
+
+    def visible(self, position, focalPoint, viewAngle):
+        '''
+        Returns the indices of the first budget points of the progressive
+        order in the view of a camera, see inView. Zooming in shows denser
+        points of a smaller region.
+        '''
+        if (self.budget is None) or (self.budget >= self.points.shape[0]):
+            return self.order
+
+        selected = []
+        nSelected = 0
+        start = 0
+        while (nSelected < self.budget) and (start < len(self.order)):
+            chunk = self.order[start:start + _CHUNK_FACTOR * (self.budget - nSelected)]
+            start += len(chunk)
+            chunk = chunk[inView(self.points[chunk], position, focalPoint, viewAngle)]
+            selected.append(chunk[:self.budget - nSelected])
+            nSelected += len(selected[-1])
+
+        return np.hstack(selected)
@@ -0,0 +1,145 @@
+'''
+Persistent cache of fit results, so that re-running a workflow with
+unchanged inputs does not re-fit.
+
+Results are stored on disk under an input key, built from hashes of the
+point cloud, data weights, starting mesh parameters and mesh topology, and
+a config key built from the normalised fitting configs. An entry with the
+same input key but a different config key is a near hit, whose fitted
+parameters are a good starting point for the new fit.
+'''
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from mapclientplugins.fieldworkmeshfittingstep.basiscache import makeKey
+
+# how a fit used the cache
+HIT = 'hit'
+WARM_START = 'warm start'
+
+
+def hashArray(a):
+    '''
+    Returns a hex digest of the dtype, shape and contents of array a, or
+    None if a is None.
+    '''
+    if a is None:
+        return None
+    a = np.ascontiguousarray(a)
+    h = hashlib.sha1(repr((a.dtype.str, a.shape)).encode('utf-8'))
+    h.update(a.view(np.uint8).ravel())
+    return h.hexdigest()
+
+
+def makeInputKey(dataHash, params, topologyKey):
+    '''
+    Make the input key of a fit from the hash of its point cloud and
+    weights, its starting parameters, and its mesh topology key.
+    '''
+    return makeKey(dataHash, hashArray(params), topologyKey)
+
+
+class ResultCache(object):
+    '''
+    LRU cache of fit results on disk.
+
+    Each entry is a dict of the fitted parameters and errors stored in a
+    file named by its input and config keys. Reading an entry marks it as
+    recently used. When the files take more than maxBytes, the least
+    recently used are removed.
+
+    inputs
+    ------
+    cacheDir : directory to store entries in.
+    maxBytes : maximum total size of the entry files.
+    '''
+
+    def __init__(self, cacheDir, maxBytes=2 ** 30):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.nearHits = 0
+        self.misses = 0
+
+    def get(self, inputKey, configKey):
+        '''
+        Returns the entry for the input and config keys, or None if it is
+        not cached.
+        '''
+        entry = self._load(self._path(inputKey, configKey))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def getNearest(self, inputKey):
+        '''
+        Returns the most recently used entry with the input key and any
+        config, or None if there is none.
+        '''
+        files = [f for f in self._files() if os.path.basename(f).startswith(inputKey + '-')]
+        for path in sorted(files, key=os.path.getmtime, reverse=True):
+            entry = self._load(path)
+            if entry is not None:
+                self.nearHits += 1
+                return entry
+        return None
+
+    def put(self, inputKey, configKey, entry):
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+        # write to a temporary file first so that concurrent readers never
+        # see a partial entry
+        path = self._path(inputKey, configKey)
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, path)
+        self._evict(keep=path)
+
+    def clear(self):
+        for f in self._files():
+            os.remove(f)
+
+    def _path(self, inputKey, configKey):
+        return os.path.join(self.cacheDir, '{}-{}.fit.pkl'.format(inputKey, configKey))
+
+    def _files(self):
+        if not os.path.isdir(self.cacheDir):
+            return []
+        return [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir) if f.endswith('.fit.pkl')]
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # mark as recently used
+        os.utime(path, None)
+        return entry
+
+    def _evict(self, keep):
+        files = sorted(self._files(), key=os.path.getmtime)
+        sizes = [os.path.getsize(f) for f in files]
+        total = sum(sizes)
+        for f, size in zip(files, sizes):
+            if total <= self.maxBytes:
+                break
+            if f == keep:
+                continue
+            try:
+                os.remove(f)
+                total -= size
+            except OSError:
+                pass
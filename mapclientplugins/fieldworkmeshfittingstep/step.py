@@ -3,14 +3,22 @@ MAP Client Plugin Step
 '''
 import json
 
-from PySide6 import QtGui
-
 from mapclient.mountpoints.workflowstep import WorkflowStepMountPoint
-from mapclientplugins.fieldworkmeshfittingstep.configuredialog import ConfigureDialog
-from mapclientplugins.fieldworkmeshfittingstep.mayavifittingviewerwidget import MayaviFittingViewerWidget
 
-import copy
-from gias3.fieldwork.field.tools import fitting_tools
+# the GUI modules, which import Qt widgets, Mayavi and the Qt resources,
+# are only imported when the step's icon, viewer or configure dialog is
+# first needed, so that headless runs do not load them
+from mapclientplugins.fieldworkmeshfittingstep import errorstats
+from mapclientplugins.fieldworkmeshfittingstep import incremental
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep import resultcache
+from mapclientplugins.fieldworkmeshfittingstep import sweep
+from mapclientplugins.fieldworkmeshfittingstep.basiscache import makeKey
+from mapclientplugins.fieldworkmeshfittingstep.convergence import CancellationToken, CANCELLED, TIMEOUT
+from mapclientplugins.fieldworkmeshfittingstep.fittrace import FitTrace
+from mapclientplugins.fieldworkmeshfittingstep.meshfitting import FIT_CONFIG_DICT, FIT_CONFIG_DEFAULTS
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import flatFunction, meshTopologyKey
+
 import numpy as np
 
 
@@ -21,44 +29,22 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
     '''
 
     # maps config keys to fitting function argument names
-    _fitConfigDict = {}
-    _fitConfigDict['mesh discretisation'] = 'GD'
-    _fitConfigDict['sobelov discretisation'] = 'sob_d'
-    _fitConfigDict['sobelov weight'] = 'sob_w'
-    _fitConfigDict['normal discretisation'] = 'normal_d'
-    _fitConfigDict['normal weight'] = 'normal_w'
-    _fitConfigDict['max sub-iterations'] = 'it_max_per_it'
-    _fitConfigDict['xtol'] = 'xtol'
-    _fitConfigDict['max iterations'] = 'it_max'
-    _fitConfigDict['fit mode'] = 'g_obj_type'
-    _fitConfigDict['n closest points'] = 'n_closest_points'
-    _fitConfigDict['kdtree args'] = 'tree_args'
-    _fitConfigDict['verbose'] = 'fit_verbose'
-    _fitConfigDict['fixed nodes'] = 'fixed_nodes'
+    _fitConfigDict = FIT_CONFIG_DICT
 
     _configDefaults = {}
     _configDefaults['identifier'] = ''
-    _configDefaults['mesh discretisation'] = '5.0'
-    _configDefaults['sobelov discretisation'] = '[8,8]'
-    _configDefaults['sobelov weight'] = '[1e-6, 1e-6, 1e-6, 1e-6, 2e-6]'
-    _configDefaults['normal discretisation'] = '8'
-    _configDefaults['normal weight'] = '50.0'
-    _configDefaults['max sub-iterations'] = '3'
-    _configDefaults['xtol'] = '1e-6'
-    _configDefaults['max iterations'] = '5'
-    _configDefaults['fit mode'] = 'DPEP'
-    _configDefaults['n closest points'] = '1'
-    _configDefaults['kdtree args'] = '{}'
-    _configDefaults['verbose'] = 'True'
-    _configDefaults['fixed nodes'] = 'None'
+    _configDefaults.update(FIT_CONFIG_DEFAULTS)
     _configDefaults['GUI'] = 'True'
+    _configDefaults['preview rate'] = '10'
+    _configDefaults['render point budget'] = '200000'
+
+    _iconImage = None
 
     def __init__(self, location):
         super(FieldworkMeshFittingStep, self).__init__('Fieldwork Mesh Fitting', location)
         self._configured = False  # A step cannot be executed until it has been configured.
         self._category = 'Fitting'
         # Add any other initialisation code here:
-        self._icon = QtGui.QImage(':/fieldworkmeshfittingstep/images/fieldworkmeshfittingicon.png')
         # Ports:
         # data cloud (2d numpy array)
         self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
@@ -95,21 +81,67 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
                       'http://physiomeproject.org/workflow/1.0/rdf-schema#provides',
                       'numpy#array1d'))
 
+        # fit timing trace (dict)
+        self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
+                      'http://physiomeproject.org/workflow/1.0/rdf-schema#provides',
+                      'python#dict'))
+
+        # error aggregated by element (dict, optional)
+        self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
+                      'http://physiomeproject.org/workflow/1.0/rdf-schema#provides',
+                      'python#dict'))
+
         self._config = {}
         for k, v in list(self._configDefaults.items()):
             self._config[k] = v
 
         self.data = None
         self.dataWeights = None
+        self.fitData = None
+        self.fitDataWeights = None
+        self.dataTree = None
+        self._fullDataTree = None
+        self._fitDataKey = None
+        self._dataHash = None
+        self._topologyKey = None
+        # the input GF is never modified. Fits run on self.GF, which shares
+        # its topology. Only parameter arrays are kept between fits, and the
+        # fitted GF is made from them when an output port asks for it.
         self.GFUnfitted = None
         self.GF = None
+        self.GFParamsUnfitted = None
         self.GFFitted = None
         self.RMSEFitted = None
         self.GFParamsFitted = None
         self.fitErrors = None
-
+        self.elementErrors = None
+        self.fitTrace = None
+        self.sweepResults = None
+        self._sweepKey = None
+        # the prepared data, its index and the mesh topology of the last
+        # fit, for incremental re-fits
+        self._fittedData = None
+        self._fittedDataTree = None
+        self._fittedTopologyKey = None
+
+        self._cancelToken = CancellationToken()
         self._widget = None
 
+    @property
+    def _icon(self):
+        '''
+        The step icon, loaded from the Qt resources when first shown.
+        '''
+        if self._iconImage is None:
+            from PySide6 import QtGui
+            from mapclientplugins.fieldworkmeshfittingstep import resources_rc  # noqa: F401
+            self._iconImage = QtGui.QImage(':/fieldworkmeshfittingstep/images/fieldworkmeshfittingicon.png')
+        return self._iconImage
+
+    @_icon.setter
+    def _icon(self, icon):
+        self._iconImage = icon
+
     def execute(self):
         '''
         Add your code here that will kick off the execution of the step.
@@ -118,84 +150,294 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
         '''
         # Put your execute step code here before calling the '_doneExecution' method.
         if self._config['GUI'] == 'True':
-            self._widget = MayaviFittingViewerWidget(self.data, self.GFUnfitted, self._config, self._fit, self._reset)
+            from mapclientplugins.fieldworkmeshfittingstep.mayavifittingviewerwidget import MayaviFittingViewerWidget
+
+            self._widget = MayaviFittingViewerWidget(
+                self.data, self.GFUnfitted, self._config, self._fit, self._reset, self.selectSweepResult
+            )
             # self._widget._ui.registerButton.clicked.connect(self._register)
             self._widget._ui.acceptButton.clicked.connect(self._doneExecution)
             self._widget._ui.abortButton.clicked.connect(self._abort)
             self._widget._ui.resetButton.clicked.connect(self._reset)
+            self._widget._ui.stopButton.clicked.connect(self._stop)
             self._setCurrentWidget(self._widget)
 
         elif self._config['GUI'] == 'False':
             self._fit()
-            self.GFFitted = copy.deepcopy(self.GF)
             self._doneExecution()
 
-    def _mapFitConfigs(self):
-
-        fitkwargs = {}
-        fitkwargs['GF'] = self.GF
-        fitkwargs['data'] = self.data
-        fitkwargs['data_weights'] = self.dataWeights
-        fitkwargs['full_errors'] = True
-        for k, v in list(self._fitConfigDict.items()):
-            if k == 'fit mode':
-                fitkwargs[v] = self._config[k]
-            elif k == 'fixed nodes':
-                inputStr = self._config[k]
-                fixedNodes = []
-                if (inputStr == 'none') or (inputStr == 'None') or (len(inputStr) == 0):
-                    pass
-                else:
-                    words = inputStr.split(',')
-                    for w in words:
-                        if '-' in w:
-                            x0, x1 = w.split('-')
-                            fixedNodes += range(int(x0), int(x1) + 1)
-                        else:
-                            fixedNodes.append(int(w))
-
-                fitkwargs[v] = fixedNodes
-
-                # inputStr = self._config[k]
-                # if inputStr=='None':
-                #     fitkwargs[v]=None
-                # else:
-                #     fixedNodes = []
-                #     words = inputStr.split(',')
-                #     for w in words:
-                #         if '-' in w:
-                #             x0,x1 = w.split('-')
-                #             fixedNodes += range(int(x0), int(x1)+1)
-                #         else:
-                #             fixedNodes.append(int(w))
-                #     fitkwargs[v] = fixedNodes
-            else:
-                fitkwargs[v] = eval(self._config[k])
-
-        return fitkwargs
-
     def _fit(self, callbackSignal=None):
 
-        # parse configurations
-        fitkwargs = self._mapFitConfigs()
-
+        # callbackSignal is anything with an emit method, e.g. the GUI's
+        # holder of the newest fit output
         if callbackSignal is not None:
             def callback(output):
                 callbackSignal.emit(output)
         else:
             callback = None
 
-        fitkwargs['fit_output_callback'] = callback
+        self.fitTrace = FitTrace()
+        with self.fitTrace.phase('prepare data'):
+            self._updateFitData()
+        self._cancelToken.reset()
+
+        runs = sweep.parseSweep(self._config.get('sweep', FIT_CONFIG_DEFAULTS['sweep']))
+        if runs:
+            return self._sweepFit(runs)
+
+        if self._canFitIncrementally():
+            fitOutput = self._fitIncremental(callback)
+            if fitOutput is not None:
+                return fitOutput
+
+        cache = meshfitting.getConfigResultCache(self._config)
+        if cache is not None:
+            with self.fitTrace.phase('result cache'):
+                inputKey = self._resultCacheInputKey()
+                configKey = meshfitting.fitConfigKey(self._config)
+                cached = cache.get(inputKey, configKey)
+                if cached is None:
+                    cached = cache.getNearest(inputKey)
+                    if cached is not None:
+                        # warm start from the result of another config
+                        self.GF = meshfitting.shareTopology(self.GFUnfitted, cached['params'])
+                        self.fitTrace.resultCache = resultcache.WARM_START
+                else:
+                    self.fitTrace.resultCache = resultcache.HIT
+                    self.GF = meshfitting.shareTopology(self.GFUnfitted, cached['params'])
+
+            if self.fitTrace.resultCache == resultcache.HIT:
+                if self._elementErrorsEnabled() and (cached.get('element errors') is None):
+                    # stored without element errors, so refit from it
+                    self.fitTrace.resultCache = resultcache.WARM_START
+                else:
+                    self._setFittedData()
+                    elementErrors = cached.get('element errors') if self._elementErrorsEnabled() else None
+                    return self._setFitOutputs(
+                        self.GF, cached['params'], cached['rms'], cached['errors'], elementErrors
+                    )
 
         # call fitting functions
-        (GFFitted, paramsFitted, RMSEFitted, errorsFitted) = fitting_tools.fitSurfacePerItSearch(**fitkwargs)
+        fitOutput = meshfitting.fitMesh(
+            self.GF, self.fitData, self.fitDataWeights, self._config, callback, self._configDataTree(),
+            self._cancelToken, self.fitTrace, self._elementErrorsEnabled()
+        )
+        fitOutput = self._fullDataErrors(fitOutput)
+
+        # results of stopped fits depend on timing, so are not cached
+        if (cache is not None) and (self.fitTrace.stopReason not in (CANCELLED, TIMEOUT)):
+            with self.fitTrace.phase('result cache'):
+                cached = {'params': fitOutput[1], 'rms': fitOutput[2], 'errors': fitOutput[3]}
+                if len(fitOutput) > 4:
+                    cached['element errors'] = fitOutput[4]
+                cache.put(inputKey, configKey, cached)
+
+        self._setFittedData()
+        return self._setFitOutputs(*fitOutput)
+
+    def _elementErrorsEnabled(self):
+        return bool(eval(self._config.get('element errors', FIT_CONFIG_DEFAULTS['element errors'])))
+
+    def _canFitIncrementally(self):
+        '''
+        An incremental re-fit is possible if it is configured, and there is
+        a fit of the same mesh topology to different data to start from.
+        '''
+        return (
+            eval(self._config.get('incremental', FIT_CONFIG_DEFAULTS['incremental'])) and
+            (self.GFParamsFitted is not None) and
+            (self._fittedData is not None) and
+            (self._fittedData is not self.fitData) and
+            (self._fittedTopologyKey == self._getTopologyKey())
+        )
+
+    def _fitIncremental(self, callback):
+        '''
+        Re-fit the last fitted parameters to the current data, optimising
+        only the nodes near the points that differ from the last fitted
+        data. Returns None if too much changed for an incremental re-fit.
+        '''
+        output = incremental.fitIncremental(
+            self.GFUnfitted, self.GFParamsFitted, self._fittedData, self.fitData, self.fitDataWeights,
+            self._config, callback, self._getDataTree(), self._cancelToken, self.fitTrace, self._fittedDataTree,
+            self._elementErrorsEnabled()
+        )
+        if output is None:
+            return None
+        fitOutput, (nChanged, nFree) = output[:-2], output[-2:]
+        self.fitTrace.incremental = {'changed points': nChanged, 'free nodes': nFree}
+        self.GF = fitOutput[0]
+        self._setFittedData()
+        return self._setFitOutputs(*self._fullDataErrors(fitOutput))
+
+    def _fullDataErrors(self, fitOutput):
+        '''
+        Returns fitOutput with its RMS error and errors, and element errors,
+        replaced by those of the full point cloud if the fit was to a
+        downsampled cloud, so that the errors output has an error for each
+        input point.
+        '''
+        if not meshfitting.isDownsampled(self._config):
+            return fitOutput
+        with self.fitTrace.phase('full data errors'):
+            errorOutput = meshfitting.evaluateErrors(
+                fitOutput[0], fitOutput[1], self.data, self._config, self._configFullDataTree(),
+                self._elementErrorsEnabled()
+            )
+        return tuple(fitOutput[:2]) + tuple(errorOutput[2:])
+
+    def _setFittedData(self):
+        self._fittedData = self.fitData
+        self._fittedDataTree = self.dataTree
+        self._fittedTopologyKey = self._getTopologyKey()
+
+    def _sweepFit(self, runs):
+        '''
+        Fit each run of the configured sweep, and output the run chosen by
+        the 'sweep selection' config. The runs are only refitted if they,
+        the fitting configs, the data or the starting parameters have
+        changed, so changing the selection alone does not refit.
+        '''
+        key = makeKey(self._resultCacheInputKey(), meshfitting.fitConfigKey(self._config), runs)
+        if (self.sweepResults is None) or (key != self._sweepKey):
+            processes = eval(self._config.get('sweep processes', FIT_CONFIG_DEFAULTS['sweep processes']))
+            with self.fitTrace.phase('sweep'):
+                results = sweep.sweepFit(
+                    self.GF, self.fitData, self.fitDataWeights, self._config, runs, self._configDataTree(), processes,
+                    self._cancelToken
+                )
+            if self._cancelToken.isCancelled():
+                # keep the finished runs, but refit the sweep next time
+                self.fitTrace.stopReason = CANCELLED
+                self._sweepKey = None
+                if not results:
+                    self.sweepResults = None
+                    return self._setFitOutputs(*meshfitting.evaluateErrors(
+                        self.GF, self.GF.field_parameters, self.data, self._config, self._configFullDataTree(),
+                        self._elementErrorsEnabled()
+                    ))
+            else:
+                self._sweepKey = key
+            self.sweepResults = results
+
+        selection = sweep.parseSelection(self._config.get('sweep selection', FIT_CONFIG_DEFAULTS['sweep selection']))
+        if isinstance(selection, int) and (self._sweepKey is None):
+            # a run past those finished before a cancel selects the last
+            selection = min(selection, len(self.sweepResults) - 1)
+        return self.selectSweepResult(selection)
 
-        self.GFFitted = copy.deepcopy(GFFitted)
+    def selectSweepResult(self, selection):
+        '''
+        Output the run of the last sweep chosen by selection, a run index
+        or one of the sweep.SELECT_ criteria. Can be called again to output
+        another run without refitting.
+        '''
+        index = sweep.selectResult(self.sweepResults, selection)
+        result = self.sweepResults[index]
+        self.fitTrace.sweep = {'runs': sweep.summarise(self.sweepResults), 'selected': index}
+        fitOutput = (
+            meshfitting.shareTopology(self.GFUnfitted, result['params']), result['params'], result['rmse'],
+            result['errors']
+        )
+        return self._setFitOutputs(*self._fullDataErrors(fitOutput))
+
+    def _setFitOutputs(self, GFFitted, paramsFitted, RMSEFitted, errorsFitted, elementErrors=None):
+        self.GFFitted = None
         self.GFParamsFitted = paramsFitted
         self.RMSEFitted = RMSEFitted
-        self.fitErrors = np.sqrt(errorsFitted)
+        self.fitErrors = errorsFitted
+        self.elementErrors = elementErrors
+        with self.fitTrace.phase('error summary'):
+            self.fitTrace.errors = errorstats.summariseErrors(errorsFitted)
+
+        return GFFitted, self.GFParamsFitted, self.RMSEFitted, self.fitErrors, self.fitTrace
+
+    def _getGFFitted(self):
+        '''
+        Make the fitted GF from the fitted parameters on first request.
+        '''
+        if (self.GFFitted is None) and (self.GFParamsFitted is not None):
+            self.GFFitted = meshfitting.shareTopology(self.GFUnfitted, self.GFParamsFitted)
+        return self.GFFitted
+
+    def _resultCacheInputKey(self):
+        '''
+        Returns the result cache input key of the data, data weights, and
+        the mesh topology and current parameters. Hashes of the data and
+        topology are kept until they change.
+        '''
+        if self._dataHash is None:
+            self._dataHash = makeKey(resultcache.hashArray(self.data), resultcache.hashArray(self.dataWeights))
+        return resultcache.makeInputKey(self._dataHash, self.GF.field_parameters, self._getTopologyKey())
+
+    def _getTopologyKey(self):
+        '''
+        Returns the key of the input mesh topology, kept until the mesh
+        changes.
+        '''
+        if self._topologyKey is None:
+            self._topologyKey = meshTopologyKey(flatFunction(self.GFUnfitted))
+        return self._topologyKey
+
+    def _updateFitData(self):
+        '''
+        Downsample the data cloud if configured and convert it to the
+        fitting precision. Only redone if the data, data weights,
+        downsampling or precision configs have changed.
+        '''
+        if self.data is None:
+            return
 
-        return self.GFFitted, self.GFParamsFitted, self.RMSEFitted, self.fitErrors
+        key = (meshfitting.getDownsampleConfig(self._config), meshfitting.getPrecision(self._config))
+        if (self.fitData is not None) and (key == self._fitDataKey):
+            return
+
+        fitData, self.fitDataWeights = meshfitting.prepareData(self.data, self.dataWeights, self._config)
+        if fitData is not self.fitData:
+            self.dataTree = None
+        self.fitData = fitData
+        self._fitDataKey = key
+
+    def _getDataTree(self):
+        '''
+        Build the index of the points to be fitted on first request, as
+        only EPDP and 2WAY fits and incremental re-fits use it.
+        '''
+        if self.dataTree is None:
+            with self.fitTrace.phase('data index'):
+                self.dataTree = meshfitting.buildDataTree(self.fitData)
+        return self.dataTree
+
+    def _configDataTree(self):
+        '''
+        Returns the index of the points to be fitted if the configured fit
+        uses it, else None.
+        '''
+        if meshfitting.needsDataTree(self._config):
+            return self._getDataTree()
+        return None
+
+    def _configFullDataTree(self):
+        '''
+        Returns the index of the full point cloud if the configured fit
+        uses one, else None. It is the index of the points to be fitted
+        if they are the full cloud, else built on first request and kept
+        until the data changes.
+        '''
+        if not meshfitting.needsDataTree(self._config):
+            return None
+        if self.fitData is self.data:
+            return self._getDataTree()
+        if self._fullDataTree is None:
+            with self.fitTrace.phase('data index'):
+                self._fullDataTree = meshfitting.buildDataTree(self.data)
+        return self._fullDataTree
+
+    def _stop(self):
+        '''
+        Stop a running fit. The fit returns its best parameters so far.
+        '''
+        self._cancelToken.cancel()
 
     def _abort(self):
         # self._doneExecution()
@@ -205,8 +447,9 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
         self.GFFitted = None
         self.GFParamsFitted = None
         self.RMSEFitted = None
-        self.FitErrors = None
-        self.GF = copy.deepcopy(self.GFUnfitted)
+        self.fitErrors = None
+        self.elementErrors = None
+        self.GF = meshfitting.shareTopology(self.GFUnfitted, self.GFParamsUnfitted)
 
     def setPortData(self, index, dataIn):
         '''
@@ -215,12 +458,33 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
         uses port for this step then the index can be ignored.
         '''
         if index == 0:
-            self.data = np.array(dataIn, dtype=float)  # ju#pointcoordinates
+            # not copied if already a contiguous array, e.g. a memmap. .npy
+            # paths are memory-mapped. Converted to the fitting precision
+            # when preparing the data to fit.
+            data = meshfitting.loadArray(dataIn, None)  # ju#pointcoordinates
+            # only rebuild the data index if the data has changed
+            if (self.data is None) or ((data is not self.data) and (not np.array_equal(data, self.data))):
+                self.data = data
+                self._dataHash = None
+                self.fitData = None
+                self.dataTree = None
+                self._fullDataTree = None
+                self._updateFitData()
         elif index == 1:
-            self.GF = dataIn  # ju#fieldworkmodel
-            self.GFUnfitted = copy.deepcopy(self.GF)
+            self.GFUnfitted = dataIn  # ju#fieldworkmodel
+            self.GFParamsUnfitted = self.GFUnfitted.get_field_parameters()
+            self._topologyKey = None
+            # a new mesh, e.g. of the next subject, is never re-fitted
+            # incrementally from the fit of the previous one
+            self._reset()
+            self._fittedData = None
+            self._fittedDataTree = None
+            self._fittedTopologyKey = None
         else:
-            self.dataWeights = np.array(dataIn, dtype=float)  # numpyarray1d - dataWeights
+            self.dataWeights = meshfitting.loadArray(dataIn)  # numpyarray1d - dataWeights
+            self._fitDataKey = None
+            self._dataHash = None
+            self._updateFitData()
 
     def getPortData(self, index):
         '''
@@ -229,13 +493,17 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
         provides port for this step then the index can be ignored.
         '''
         if index == 3:
-            return self.GFFitted  # ju#fieldworkmodel
+            return self._getGFFitted()  # ju#fieldworkmodel
         elif index == 4:
             return self.GFParamsFitted  # ju#fieldworkmodelparameters
         elif index == 5:
             return self.RMSEFitted  # float
-        else:
+        elif index == 6:
             return self.fitErrors  # numpyarray1d
+        elif index == 7:
+            return None if self.fitTrace is None else self.fitTrace.toDict()  # dict
+        else:
+            return self.elementErrors  # dict
 
     def configure(self):
         '''
@@ -245,6 +513,8 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
         then set:
             self._configured = True
         '''
+        from mapclientplugins.fieldworkmeshfittingstep.configuredialog import ConfigureDialog
+
         dlg = ConfigureDialog(self._main_window)
         dlg.identifierOccursCount = self._identifierOccursCount
         dlg.setConfig(self._config)
@@ -283,7 +553,6 @@ class FieldworkMeshFittingStep(WorkflowStepMountPoint):
         '''
         self._config.update(json.loads(string))
 
-        d = ConfigureDialog()
-        d.identifierOccursCount = self._identifierOccursCount
-        d.setConfig(self._config)
-        self._configured = d.validate()
+        # the check of ConfigureDialog.validate on a freshly set config,
+        # without creating the dialog
+        self._configured = self._identifierOccursCount(self._config['identifier']) <= 1
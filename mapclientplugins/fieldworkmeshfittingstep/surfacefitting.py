@@ -0,0 +1,670 @@
+'''
+Fitting of fieldwork surface meshes to point clouds with closest point
+correspondences searched once per iteration.
+
+This follows the objective of gias3 fitting_tools.fitSurfacePerItSearch
+(squared distance, Sobolev and normal smoothing residuals) but takes its
+sample sets and basis matrices from a meshsampling.MeshSampler, so that
+they are built once and reused across iterations and fits. The same
+matrices give the analytic sparse Jacobian of each residual term, so each
+inner least-squares problem is solved with a sparse trust region solver
+instead of finite differencing.
+
+Jacobians are with respect to the flattened parameters P.ravel(), where P
+has shape (3, n), and are assembled from per-coordinate blocks.
+
+Fixed nodes are removed from the optimisation. Each matrix is reduced to
+the columns of the free nodes, the contribution of the fixed nodes is
+folded into a constant offset, and rows that only depend on fixed nodes
+are dropped because their residuals cannot change.
+
+Unlike gias3, the Sobolev penalty is the quadratic form P^T K P of the
+weighted squared derivatives, rather than squares of the weighted sums
+at each sample point. Its residuals are R.P for a per-element factor R
+with R^T R = K, so its Jacobian is constant.
+
+With precision='float32', the data, mesh sample points, correspondences
+and data term residuals and Jacobian are computed in single precision.
+They are converted to double precision when combined with the penalty
+terms, so the solver works in double precision.
+
+In 2WAY mode the squared distances of both directions, data to mesh
+(DPEP) and mesh to data (EPDP), are residuals of one objective. The data
+index is built once per fit and the mesh sample index once per
+iteration, and the two directions are queried concurrently.
+'''
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import least_squares
+from scipy.spatial import cKDTree
+
+from mapclientplugins.fieldworkmeshfittingstep.basiscache import BasisCache
+from mapclientplugins.fieldworkmeshfittingstep.convergence import FitStopped
+from mapclientplugins.fieldworkmeshfittingstep.fittrace import FitTrace
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import MeshSampler
+
+TWO_WAY = '2WAY'
+FIT_MODES = ('EPDP', 'DPEP', TWO_WAY)
+PRECISIONS = ('float64', 'float32')
+
+# in adaptive discretisation, elements with an RMS error below this
+# fraction of the fit's RMS error are coarsened
+_COARSEN_BELOW = 0.5
+
+# default number of neighbours found per closest point query. Larger
+# searches are split into chunks to bound the temporary arrays of each
+# query, including the double precision copies of single precision points
+# that cKDTree makes.
+QUERY_CHUNK = 2 ** 18
+
+
+def _norms(v):
+    return v / np.sqrt((v * v).sum(1))[:, np.newaxis]
+
+
+def _rowScale(v, A):
+    return sparse.diags(v).dot(A)
+
+
+def _geomJacobian(Ap, pairW, e):
+    '''
+    Jacobian of pairW * |Ap.P - target|**2 given the residual vectors
+    e = Ap.P - target.
+    '''
+    return sparse.hstack([_rowScale(2.0 * pairW * e[:, c], Ap) for c in range(e.shape[1])], format='csr')
+
+
+def _splitNodes(nEns, fixedNodes):
+    '''
+    Returns the sorted indices of the free and of the fixed nodes.
+    '''
+    if fixedNodes is None:
+        fixedNodes = []
+    fixedNodes = np.unique(np.asarray(fixedNodes, dtype=int))
+    return np.setdiff1d(np.arange(nEns), fixedNodes), fixedNodes
+
+
+def _reduceMatrices(matrices, freeNodes, fixedNodes, P):
+    '''
+    Reduce sparse matrices evaluating quantities at the same sample points
+    from the nx3 parameter array P to the free nodes.
+
+    Returns the indices of the rows that depend on free nodes, the
+    matrices of those rows and the free node columns, and the constant
+    contribution of the fixed nodes to each of those rows, so that
+    M.dot(P)[rows] == reduced.dot(P[freeNodes]) + offset.
+    '''
+    matrices = [sparse.csc_matrix(M) for M in matrices]
+    dependent = np.zeros(matrices[0].shape[0], dtype=bool)
+    for M in matrices:
+        dependent |= M[:, freeNodes].getnnz(axis=1) > 0
+    rows = np.where(dependent)[0]
+
+    reduced = [M[:, freeNodes].tocsr()[rows] for M in matrices]
+    offsets = [M[:, fixedNodes].tocsr()[rows].dot(P[fixedNodes]) for M in matrices]
+    return rows, reduced, offsets
+
+
+def makeSobelovPenalty(sobMatrix, offset=None):
+    '''
+    Returns a function of the nx3 parameter array giving the Sobolev
+    residuals R.P of each coordinate, stacked, where sobMatrix R factors
+    the Sobolev quadratic form, see MeshSampler.sobolevMatrix. Their sum
+    of squares is the weighted sum of squared derivatives over the
+    Sobolev sample points. offset is the optional constant offset of a
+    reduced matrix, see _reduceMatrices.
+    '''
+
+    def obj(P):
+        R = sobMatrix.dot(P)
+        if offset is not None:
+            R = R + offset
+        return R.T.ravel()
+
+    return obj
+
+
+def makeSobelovPenaltyJacobian(sobMatrix, dims=3):
+    '''
+    Returns a function of the nx3 parameter array giving the sparse
+    Jacobian of the Sobolev penalty, which is constant.
+    '''
+    J = sparse.block_diag([sobMatrix] * dims, format='csr')
+
+    def jac(P):
+        return J
+
+    return jac
+
+
+def _stackMatrices(matrices, offsets=None):
+    '''
+    Returns matrices evaluating quantities at the same sample points
+    stacked into one matrix, and their offsets stacked likewise, so that
+    they are evaluated by one product, see _evaluateStacked.
+    '''
+    stacked = sparse.vstack(matrices, format='csr')
+    if offsets is None:
+        return stacked, None
+    return stacked, np.vstack(offsets)
+
+
+def _evaluateStacked(stacked, P, offset, nMatrices):
+    '''
+    Returns the product of stacked matrices with the nx3 parameter array
+    P, plus their offset if given, as an array of shape (nMatrices,
+    points, 3).
+    '''
+    D = stacked.dot(P)
+    if offset is not None:
+        D += offset
+    return D.reshape((nMatrices, -1, P.shape[1]))
+
+
+def makeNormalPenalty(edgeMatrices, offsets=None):
+    '''
+    Returns a function of the nx3 parameter array giving 1 - n1.n2 for
+    the normals n1 and n2 either side of each shared edge sample point.
+    offsets are the optional constant offsets of reduced matrices, see
+    _reduceMatrices.
+    '''
+    stacked, offset = _stackMatrices(edgeMatrices, offsets)
+
+    def obj(P):
+        a1, b1, a2, b2 = _evaluateStacked(stacked, P, offset, 4)
+        n1 = _norms(np.cross(a1, b1))
+        n2 = _norms(np.cross(a2, b2))
+        return 1.0 - (n1 * n2).sum(1)
+
+    return obj
+
+
+def _normalSideGradients(a, b, nOther):
+    '''
+    Returns the gradients of -n.nOther with respect to the xi1 and xi2
+    derivatives a and b of one side of each edge point, where n is the
+    normal of that side.
+    '''
+    u = np.cross(a, b)
+    uNorm = np.sqrt((u * u).sum(1))
+    n = u / uNorm[:, np.newaxis]
+    # gradient of -n.nOther with respect to u
+    g = -(nOther - n * (n * nOther).sum(1)[:, np.newaxis]) / uNorm[:, np.newaxis]
+    return np.cross(b, g), np.cross(g, a)
+
+
+def makeNormalPenaltyJacobian(edgeMatrices, offsets=None, dims=3):
+    '''
+    Returns a function of the nx3 parameter array giving the sparse
+    Jacobian of the normal penalty.
+
+    Each nonzero of the edge matrices contributes to the row of its edge
+    point in the block of each coordinate, scaled by the gradient of the
+    penalty with respect to the derivative it evaluates. The sparsity
+    pattern of the Jacobian, and where each contribution goes in it, are
+    found once, so each evaluation only sums the contributions.
+    '''
+    stacked, offset = _stackMatrices(edgeMatrices, offsets)
+    nPoints, nCols = edgeMatrices[0].shape
+    nJacCols = dims * nCols
+    S = stacked.tocoo()
+    jacRows = np.tile(S.row % nPoints, dims).astype(np.int64)
+    jacCols = (np.arange(dims)[:, np.newaxis] * nCols + S.col).ravel()
+    positions, entries = np.unique(jacRows * nJacCols + jacCols, return_inverse=True)
+    indices = positions % nJacCols
+    indptr = np.searchsorted(positions // nJacCols, np.arange(nPoints + 1))
+
+    def jac(P):
+        a1, b1, a2, b2 = _evaluateStacked(stacked, P, offset, 4)
+        n1 = _norms(np.cross(a1, b1))
+        n2 = _norms(np.cross(a2, b2))
+        # gradients in the order of the stacked matrices
+        grads = np.vstack(_normalSideGradients(a1, b1, n2) + _normalSideGradients(a2, b2, n1))
+        contributions = (grads[S.row] * S.data[:, np.newaxis]).T.ravel()
+        data = np.bincount(entries, weights=contributions, minlength=len(positions))
+        return sparse.csr_matrix((data, indices, indptr), shape=(nPoints, nJacCols))
+
+    return jac
+
+
+def _query(tree, points, k, treeArgs, chunk):
+    '''
+    Query tree for the k closest points to each of points, in chunks of
+    at most chunk neighbours. Each chunk is written into the output arrays
+    as it is found, so the temporary memory of the search is bounded by
+    the chunk rather than the number of points.
+    '''
+    nPoints = points.shape[0]
+    step = max(1, int(chunk) // k) if chunk else nPoints
+    if nPoints <= step:
+        return tree.query(points, k=k, **treeArgs)
+
+    shape = (nPoints,) if k == 1 else (nPoints, k)
+    dist = np.empty(shape, dtype=float)
+    index = np.empty(shape, dtype=np.intp)
+    for i in range(0, nPoints, step):
+        dist[i:i + step], index[i:i + step] = tree.query(points[i:i + step], k=k, **treeArgs)
+    return dist, index
+
+
+def _correspondences(mode, ep, data, dataTree, dataWeights, nClosestPoints, treeArgs, queryChunk, epRows=None):
+    '''
+    Find closest point correspondences between mesh sample points ep and
+    data. dataTree is a cKDTree of data. Weights are of the precision of
+    data. treeArgs are the keyword arguments of cKDTree.query, and
+    queryChunk the number of neighbours found per query, see _query.
+    epRows are optional indices of the sample points to query in EPDP
+    mode, by default all.
+
+    Returns the sample point index, data point index, and weight of each
+    correspondence, the query point index of each correspondence, and the
+    number of query points. Query points are the sample points for EPDP and
+    the data points for DPEP. In 2WAY mode, the data point correspondences
+    come first, and the sample points follow the data points as query
+    points. The sample point correspondences are weighted so that each
+    direction has the same total weight.
+    '''
+    if mode == TWO_WAY:
+        # the directions query different trees, so they cannot share a
+        # query call. cKDTree releases the GIL while querying, so they are
+        # queried in parallel instead, sharing the query threads.
+        workers = treeArgs.get('workers', 1)
+        if workers < 1:
+            workers = os.cpu_count()
+        if workers < 2:
+            epdp = _correspondences(
+                'EPDP', ep, data, dataTree, dataWeights, nClosestPoints, treeArgs, queryChunk, epRows
+            )
+            dpep = _correspondences('DPEP', ep, data, dataTree, dataWeights, nClosestPoints, treeArgs, queryChunk)
+        else:
+            epdpArgs = dict(treeArgs, workers=workers // 2)
+            dpepArgs = dict(treeArgs, workers=workers - workers // 2)
+            with ThreadPoolExecutor(1) as pool:
+                epdp = pool.submit(
+                    _correspondences, 'EPDP', ep, data, dataTree, dataWeights, nClosestPoints, epdpArgs,
+                    queryChunk, epRows
+                )
+                dpep = _correspondences(
+                    'DPEP', ep, data, dataTree, dataWeights, nClosestPoints, dpepArgs, queryChunk
+                )
+                epdp = epdp.result()
+
+        # scaled by the total weights of the pairs, not their numbers, so
+        # that the directions have the same total weight with data weights
+        nData = dpep[4]
+        epdpTotal = float(epdp[2].sum(dtype=float))
+        epdpW = epdp[2] * (float(dpep[2].sum(dtype=float)) / epdpTotal if epdpTotal > 0.0 else 0.0)
+        return (
+            np.hstack((dpep[0], epdp[0])),
+            np.hstack((dpep[1], epdp[1])),
+            np.hstack((dpep[2], epdpW.astype(data.dtype))),
+            np.hstack((dpep[3], epdp[3] + nData)),
+            nData + epdp[4],
+        )
+    elif mode == 'EPDP':
+        if epRows is None:
+            epRows = np.arange(ep.shape[0])
+        dist, dataI = _query(dataTree, ep[epRows], 1, treeArgs, queryChunk)
+        epI = epRows
+        queryI = epI
+        nQuery = ep.shape[0]
+        pairW = np.ones(len(epI), dtype=data.dtype)
+    else:
+        k = max(1, int(nClosestPoints))
+        dist, epI = _query(cKDTree(ep), data, k, treeArgs, queryChunk)
+        nQuery = data.shape[0]
+        dataI = np.repeat(np.arange(nQuery), k)
+        queryI = dataI
+        pairW = np.full(nQuery * k, 1.0 / k, dtype=data.dtype)
+        dist = dist.ravel()
+        epI = epI.ravel()
+
+    if dataWeights is not None:
+        pairW = pairW * np.asarray(dataWeights, dtype=data.dtype)[dataI]
+
+    # pairs with no point found within the search distance are dropped
+    found = np.isfinite(dist)
+    return epI[found], dataI[found], pairW[found], queryI[found], nQuery
+
+
+def _evaluationTime(trace):
+    '''
+    Time spent so far in residual and Jacobian evaluation and assembly in
+    the current iteration of trace.
+    '''
+    return trace.iterationTime('data term', 'sobolev', 'normal', 'solver')
+
+
+def _pairErrors(ep, epI, data, dataI):
+    '''
+    Returns the unweighted squared distance of each correspondence.
+    '''
+    return ((ep[epI] - data[dataI]) ** 2.0).sum(1)
+
+
+def _queryErrors(sqDist, queryI, nQuery):
+    '''
+    Returns the squared distance of each query point, averaged over its
+    closest points, and the RMS distance.
+    '''
+    nPairs = np.bincount(queryI, minlength=nQuery)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fE = np.bincount(queryI, weights=sqDist, minlength=nQuery) / nPairs
+    fE[nPairs == 0] = np.nan
+    return fE, np.sqrt(fE[np.isfinite(fE)].mean())
+
+
+def _fitErrors(mode, sqDist, queryI, nQuery, nData):
+    '''
+    Returns the errors of the query points and the RMS error, as
+    _queryErrors. In 2WAY mode the errors are those of the nData data
+    points, and the RMS error is of both directions with equal weight.
+    '''
+    fE, fitRMS = _queryErrors(sqDist, queryI, nQuery)
+    if mode == TWO_WAY:
+        dataE = fE[:nData]
+        sampleE = fE[nData:]
+        fitRMS = np.sqrt(0.5 * (np.nanmean(dataE) + np.nanmean(sampleE)))
+        fE = dataE
+    return fE, fitRMS
+
+
+def _errorElements(epI, queryI, nQuery, rowElements, elements, nErrors):
+    '''
+    Returns the number of the element of the closest sample point of each
+    of the first nErrors query points, or -1 for query points without
+    correspondences. The correspondences of each query point are
+    contiguous and closest first.
+    '''
+    first = np.ones(len(queryI), dtype=bool)
+    first[1:] = queryI[1:] != queryI[:-1]
+    errorElements = np.full(nQuery, -1, dtype=int)
+    errorElements[queryI[first]] = np.asarray(elements)[rowElements[epI[first]]]
+    return errorElements[:nErrors]
+
+
+def _elementErrors(sqDist, pairElements, nElements):
+    '''
+    Returns the RMS distance of the correspondences of each element, NaN
+    for elements without correspondences.
+    '''
+    nPairs = np.bincount(pairElements, minlength=nElements)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(np.bincount(pairElements, weights=sqDist, minlength=nElements) / nPairs)
+
+
+def _adaptDivisions(divisions, elementRMS, fitRMS, limits):
+    '''
+    Returns the divisions of each element refined where its RMS error is
+    above fitRMS, and coarsened where it is below _COARSEN_BELOW times
+    fitRMS or it has no correspondences, within the (min, max) limits.
+    '''
+    minDiv, maxDiv = limits
+    adapted = []
+    for div, e in zip(divisions, elementRMS):
+        if e > fitRMS:
+            div = tuple(min(maxDiv, n + max(1, n // 2)) for n in div)
+        elif not (e >= _COARSEN_BELOW * fitRMS):
+            div = tuple(max(minDiv, n - 1) for n in div)
+        adapted.append(div)
+    return adapted
+
+
+def fitSurfacePerItSearch(g_obj_type, GF, data, GD, sob_d, sob_w, normal_d, normal_w,
+                          fixed_nodes=None, xtol=1e-6, it_max=10, it_max_per_it=3,
+                          data_weights=None, n_closest_points=1, tree_args=None,
+                          fit_verbose=False, full_errors=False, fit_output_callback=None,
+                          basis_cache=None, data_tree=None, monitor=None, trace=None,
+                          precision='float64', adaptive_gd=None, query_workers=None,
+                          query_chunk=QUERY_CHUNK, error_elements=False):
+    '''
+    Fit the surface mesh GF to data, searching for closest points once per
+    iteration. Arguments are as for the gias3 function of the same name,
+    plus basis_cache, a basiscache.BasisCache to get sample sets and basis
+    matrices from, data_tree, a prebuilt cKDTree of data, and monitor, a
+    convergence.ConvergenceMonitor. If data_tree is not given, one is built
+    for the fit.
+
+    If monitor is given, the fit stops when the monitor detects a plateau,
+    cancellation or timeout, and the best iteration is returned. A cancel
+    or timeout during an iteration discards that iteration.
+
+    If trace, a fittrace.FitTrace, is given, the time spent in each phase
+    of each iteration is recorded in it.
+
+    precision is 'float64', or 'float32' to store data and sample points
+    and evaluate the data term in single precision.
+
+    Closest points are searched for with query_workers threads, by
+    default all cores, and in chunks of at most query_chunk neighbours,
+    or in one query if query_chunk is None. A 'workers' item of tree_args
+    overrides query_workers.
+
+    adaptive_gd is an optional (min, max) number of sample points in each
+    xi direction of an element. If given, each element starts with the
+    divisions of GD, and after each iteration elements whose RMS error is
+    above that of the fit are sampled more densely, and elements well
+    below it are sampled more coarsely, so that the number of sample
+    points follows the error.
+
+    If error_elements and full_errors are True, the number of the element
+    closest to the point of each error is also returned, -1 for points
+    without correspondences.
+
+    Each inner problem is solved by scipy least_squares with the analytic
+    sparse Jacobian, for about it_max_per_it iterations.
+
+    returns (GF, fitted parameters, RMS error[, errors[, error elements]])
+    where errors are the squared distance of each query point, not scaled
+    by data_weights, or of each data point in 2WAY mode. The parameters of
+    GF are only set to the fitted parameters on return, so the GF passed
+    to fit_output_callback holds the starting parameters.
+    '''
+    if g_obj_type not in FIT_MODES:
+        raise ValueError('gObjType ' + g_obj_type + ' not supported in fitSurfacePerItSearch')
+    if precision not in PRECISIONS:
+        raise ValueError('precision ' + precision + ' not supported in fitSurfacePerItSearch')
+    dtype = np.dtype(precision)
+
+    treeArgs = {'workers': -1 if query_workers is None else int(query_workers)}
+    treeArgs.update({} if tree_args is None else tree_args)
+    if basis_cache is None:
+        basis_cache = BasisCache()
+    if trace is None:
+        trace = FitTrace()
+
+    with trace.phase('setup'):
+        data = np.asarray(data, dtype=dtype)
+        # errors are of the data points, or of the sample points in EPDP
+        nErrors = None if g_obj_type == 'EPDP' else data.shape[0]
+        if data_tree is None and g_obj_type in ('EPDP', TWO_WAY):
+            data_tree = cKDTree(data)
+        sampler = MeshSampler(GF, basis_cache)
+        P0 = GF.get_field_parameters()
+        dims, nEns = P0.shape[:2]
+        P = P0.reshape((dims, nEns)).copy()
+
+        # fixed nodes are removed from the optimisation. If all nodes are
+        # fixed, only the errors of the starting parameters are evaluated.
+        freeNodes, fixedNodes = _splitNodes(nEns, fixed_nodes)
+        nFree = len(freeNodes)
+        reduced = (len(fixedNodes) > 0) and (nFree > 0)
+
+        # the Sobolev penalty is a constant quadratic form of the
+        # parameters, factored once per topology, discretisation and weights
+        sobMatrix = sampler.sobolevMatrix(sob_d, sob_w, P)
+        edgeMatrices = sampler.edgeDerivativeMatrices(normal_d)
+        sobOffset = None
+        edgeOffsets = None
+        if reduced:
+            (sobMatrix,), (sobOffset,) = _reduceMatrices([sobMatrix], freeNodes, fixedNodes, P.T)[1:]
+            edgeMatrices, edgeOffsets = _reduceMatrices(edgeMatrices, freeNodes, fixedNodes, P.T)[1:]
+        sobObj = makeSobelovPenalty(sobMatrix, sobOffset)
+        sobJac = makeSobelovPenaltyJacobian(sobMatrix, dims)
+        nObj = makeNormalPenalty(edgeMatrices, edgeOffsets)
+        nJac = makeNormalPenaltyJacobian(edgeMatrices, edgeOffsets)
+
+        if adaptive_gd is not None:
+            minDiv, maxDiv = adaptive_gd
+            divisions = [tuple(min(max(n, minDiv), maxDiv) for n in div) for div in sampler.elementDivisions(GD, P)]
+
+    fitOutput = None
+    fitRMSOld = None
+    sampleA = None
+    reducedA = None
+    for it in range(it_max):
+        trace.startIteration(it)
+        with trace.phase('evaluate'):
+            if adaptive_gd is None:
+                A64, rowElements = sampler.evaluationMatrix(GD, P)
+            else:
+                A64, rowElements = sampler.divisionsMatrix(divisions, shared=False)
+            if A64 is not sampleA:
+                # converted to the fitting precision once per sample set
+                sampleA = A64
+                A = A64.astype(dtype, copy=False)
+            ep = A.dot(P.T.astype(dtype))
+            if reduced and (A is not reducedA):
+                # reduce each new sample set. Sample points only on fixed
+                # nodes do not move, so their closest data points in EPDP
+                # mode are found once per sample set.
+                reducedA = A
+                activeRows, (Afree,), (AOffset,) = _reduceMatrices([A], freeNodes, fixedNodes, P.T.astype(dtype))
+                sampleRows = np.full(A.shape[0], -1)
+                sampleRows[activeRows] = np.arange(len(activeRows))
+                fixedPairs = None
+
+        with trace.phase('search'):
+            if reduced and (g_obj_type == 'EPDP'):
+                if fixedPairs is None:
+                    fixedPairs = _correspondences(
+                        g_obj_type, ep, data, data_tree, data_weights, n_closest_points, treeArgs, query_chunk,
+                        np.where(sampleRows < 0)[0]
+                    )
+                activePairs = _correspondences(
+                    g_obj_type, ep, data, data_tree, data_weights, n_closest_points, treeArgs, query_chunk,
+                    activeRows
+                )
+                epI, dataI, pairW, queryI = [np.hstack(p) for p in zip(fixedPairs[:4], activePairs[:4])]
+                nQuery = ep.shape[0]
+            else:
+                epI, dataI, pairW, queryI, nQuery = _correspondences(
+                    g_obj_type, ep, data, data_tree, data_weights, n_closest_points, treeArgs, query_chunk
+                )
+
+            if reduced:
+                # pairs with fixed sample points have constant residuals
+                rows = sampleRows[epI]
+                objPairs = rows >= 0
+                rows = rows[objPairs]
+                Ap = Afree[rows]
+                target = data[dataI[objPairs]] - AOffset[rows]
+                objW = pairW[objPairs]
+            else:
+                Ap = A[epI]
+                target = data[dataI]
+                objW = pairW
+
+        if nFree == 0:
+            with trace.phase('errors'):
+                sqDist = _pairErrors(A.dot(P.T), epI, data, dataI)
+                fE, fitRMS = _fitErrors(g_obj_type, sqDist, queryI, nQuery, data.shape[0])
+                fitOutput = (GF, P.reshape((dims, nEns, 1)).copy(), fitRMS, fE)
+                if error_elements:
+                    fitOutput += (_errorElements(epI, queryI, nQuery, rowElements, sampler.elements, nErrors),)
+            trace.endIteration(samples=ep.shape[0], pairs=0, rmse=fitRMS)
+            break
+
+        def obj(x):
+            if monitor is not None:
+                monitor.check()
+            Pn = x.reshape((dims, nFree)).T
+            with trace.phase('data term'):
+                gErr = objW * ((Ap.dot(Pn.astype(dtype)) - target) ** 2.0).sum(1)
+            with trace.phase('sobolev'):
+                sErr = sobObj(Pn)
+            with trace.phase('normal'):
+                nErr = normal_w * nObj(Pn)
+            return np.hstack((gErr, sErr, nErr))
+
+        def jac(x):
+            if monitor is not None:
+                monitor.check()
+            Pn = x.reshape((dims, nFree)).T
+            with trace.phase('data term'):
+                gJ = _geomJacobian(Ap, objW, Ap.dot(Pn.astype(dtype)) - target)
+            with trace.phase('sobolev'):
+                sJ = sobJac(Pn)
+            with trace.phase('normal'):
+                nJ = normal_w * nJac(Pn)
+            with trace.phase('solver'):
+                J = sparse.vstack((gJ, sJ, nJ), format='csr')
+            return J
+
+        # a sub-iteration is one Jacobian evaluation, as with the finite
+        # difference budget of len(x0)*it_max_per_it evaluations in gias3.
+        # Allow an extra evaluation per sub-iteration for rejected steps.
+        x0 = P[:, freeNodes].ravel()
+        evalTime0 = _evaluationTime(trace)
+        t0 = time.perf_counter()
+        try:
+            result = least_squares(
+                obj, x0, jac=jac, method='trf', tr_solver='lsmr', xtol=xtol, max_nfev=2 * it_max_per_it
+            )
+        except FitStopped:
+            trace.addTime('solver', time.perf_counter() - t0 - (_evaluationTime(trace) - evalTime0))
+            trace.endIteration(samples=ep.shape[0], pairs=Ap.shape[0])
+            if (fitOutput is None) and ((monitor is None) or (monitor.best is None)):
+                # stopped before any iteration finished, so return the
+                # starting parameters
+                sqDist = _pairErrors(A.dot(P.T), epI, data, dataI)
+                fE, fitRMS = _fitErrors(g_obj_type, sqDist, queryI, nQuery, data.shape[0])
+                fitOutput = (GF, P.reshape((dims, nEns, 1)).copy(), fitRMS, fE)
+                if error_elements:
+                    fitOutput += (_errorElements(epI, queryI, nQuery, rowElements, sampler.elements, nErrors),)
+            break
+        trace.addTime('solver', time.perf_counter() - t0 - (_evaluationTime(trace) - evalTime0))
+
+        with trace.phase('errors'):
+            P = P.copy()
+            P[:, freeNodes] = result.x.reshape((dims, nFree))
+            sqDist = _pairErrors(A.dot(P.T), epI, data, dataI)
+            fE, fitRMS = _fitErrors(g_obj_type, sqDist, queryI, nQuery, data.shape[0])
+            Opt = P.reshape((dims, nEns, 1)).copy()
+            fitOutput = (GF, Opt, fitRMS, fE)
+            if error_elements:
+                fitOutput += (_errorElements(epI, queryI, nQuery, rowElements, sampler.elements, nErrors),)
+            if adaptive_gd is not None:
+                elementRMS = _elementErrors(sqDist, rowElements[epI], len(divisions))
+                divisions = _adaptDivisions(divisions, elementRMS, fitRMS, adaptive_gd)
+
+        trace.endIteration(
+            nfev=result.nfev, njev=result.njev, samples=ep.shape[0], pairs=Ap.shape[0], rmse=fitRMS
+        )
+
+        if fit_verbose:
+            sys.stdout.write('\nit: %(i)i\tRMSE: %(RMSE)8.6f\n' % {'i': it, 'RMSE': fitRMS})
+
+        if fit_output_callback is not None:
+            fit_output_callback(fitOutput)
+
+        if (monitor is not None) and monitor.update(fitOutput):
+            break
+
+        if (fitRMSOld is not None) and (abs(fitRMSOld - fitRMS) / fitRMSOld < xtol):
+            break
+        fitRMSOld = fitRMS
+
+    if (monitor is not None) and (monitor.best is not None):
+        fitOutput = monitor.best
+    GF.set_field_parameters(fitOutput[1].copy())
+
+    if full_errors:
+        return fitOutput
+    else:
+        return fitOutput[:3]
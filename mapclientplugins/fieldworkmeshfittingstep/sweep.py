@@ -0,0 +1,260 @@
+'''
+Sweeps of the smoothing weights and mesh discretisation, to choose them by
+comparing fits rather than by trial and error.
+
+Each run of a sweep fits the same starting mesh to the same point cloud
+with its own sob_w, normal_w and GD. Runs are fitted concurrently in a
+pool of spawned processes that are given the prepared point cloud and its
+search index once, rather than with every run. A cancelled sweep returns
+the runs finished so far. The RMS error, normal
+discontinuity and wall time of each run are compared, and the runs on the
+Pareto front of RMS error against normal discontinuity are marked.
+
+The sweep is given in the 'sweep' config as either a grid, a dict of lists
+of values of each fitting argument, e.g.
+
+    {'sob_w': [1e-6, 1e-5, 1e-4], 'normal_w': [10.0, 50.0], 'GD': [[5,5], [8,8]]}
+
+or a list of runs, each a dict or a (sob_w, normal_w, GD) tuple. Arguments
+not given take their configured values.
+'''
+import itertools
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep import surfacefitting
+from mapclientplugins.fieldworkmeshfittingstep.meshfitting import FIT_CONFIG_DICT, FIT_CONFIG_DEFAULTS
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import MeshSampler
+
+# fitting arguments that can be swept, in the order of sweep tuples
+SWEEP_ARGS = ('sob_w', 'normal_w', 'GD')
+
+# ways of selecting the output run of a sweep, besides its index
+SELECT_KNEE = 'knee'  # Pareto run closest to the best RMS error and normal discontinuity
+SELECT_RMSE = 'rmse'  # lowest RMS error
+SELECT_SMOOTHEST = 'smoothest'  # lowest normal discontinuity
+
+# config keys of the fitting arguments
+_ARG_CONFIG_KEYS = dict((v, k) for k, v in FIT_CONFIG_DICT.items())
+
+# seconds between checks for cancellation while waiting for a pool run
+_CANCEL_POLL_SECONDS = 0.2
+
+
+def parseSweep(inputStr):
+    '''
+    Parse a sweep string into a list of runs, each a dict of the fitting
+    arguments in SWEEP_ARGS it sets. An empty sweep gives an empty list.
+    '''
+    if (inputStr == 'none') or (inputStr == 'None') or (len(inputStr) == 0):
+        return []
+
+    sweep = eval(inputStr)
+    if isinstance(sweep, dict):
+        args = [a for a in SWEEP_ARGS if a in sweep]
+        runs = [dict(zip(args, values)) for values in itertools.product(*[sweep[a] for a in args])]
+        invalidArgs = set(sweep.keys()) - set(SWEEP_ARGS)
+    else:
+        runs = [r if isinstance(r, dict) else dict(zip(SWEEP_ARGS, r)) for r in sweep]
+        invalidArgs = set(a for r in runs for a in r.keys()) - set(SWEEP_ARGS)
+
+    if invalidArgs:
+        raise ValueError('Invalid sweep arguments: {}'.format(', '.join(sorted(invalidArgs))))
+
+    return runs
+
+
+def runConfig(config, run):
+    '''
+    Returns a copy of the step config with the fitting arguments of run.
+    '''
+    config = dict(config)
+    for arg, value in run.items():
+        config[_ARG_CONFIG_KEYS[arg]] = repr(value)
+    return config
+
+
+def normalDiscontinuity(GF, params, normalD, basisCache=None):
+    '''
+    Returns the RMS of 1 - n1.n2 for the surface normals n1 and n2 either
+    side of normalD points along each edge shared by two elements of GF
+    with parameters params. 0 for a mesh that is smooth across its element
+    boundaries.
+    '''
+    if basisCache is None:
+        basisCache = meshfitting.getConfigBasisCache({})
+    edgeMatrices = MeshSampler(GF, basisCache).edgeDerivativeMatrices(normalD)
+    if edgeMatrices[0].shape[0] == 0:
+        return 0.0
+    P = np.asarray(params, dtype=float).reshape((3, -1)).T
+    penalty = surfacefitting.makeNormalPenalty(edgeMatrices)(P)
+    return float(np.sqrt((penalty ** 2.0).mean()))
+
+
+def fitRun(GF, data, dataWeights, dataTree, config, run, cancelToken=None):
+    '''
+    Fit GF to the prepared point cloud data with the fitting arguments of
+    run. GF is not modified. If cancelToken is cancelled, the fit stops
+    with its best parameters so far.
+
+    Returns a dict of the run arguments, 'rmse', 'normal discontinuity',
+    'seconds', and the fitted 'params' and per-point 'errors'.
+    '''
+    config = runConfig(config, run)
+    t0 = time.perf_counter()
+    GFFitted, params, rms, errors = meshfitting.fitMesh(
+        meshfitting.shareTopology(GF), data, dataWeights, config, dataTree=dataTree, cancelToken=cancelToken
+    )
+    seconds = time.perf_counter() - t0
+
+    normalD = eval(config.get('normal discretisation', FIT_CONFIG_DEFAULTS['normal discretisation']))
+    result = dict(run)
+    result.update({
+        'rmse': float(rms),
+        'normal discontinuity': normalDiscontinuity(GF, params, normalD, meshfitting.getConfigBasisCache(config)),
+        'seconds': seconds,
+        'params': params,
+        'errors': errors,
+    })
+    return result
+
+
+# fit inputs of a sweep worker process, set once by _initWorker
+_worker = {}
+
+
+def _initWorker(GF, data, dataWeights, dataTree, config):
+    _worker.update(GF=GF, data=data, dataWeights=dataWeights, dataTree=dataTree, config=config)
+
+
+def _fitWorkerRun(run):
+    w = _worker
+    return fitRun(w['GF'], w['data'], w['dataWeights'], w['dataTree'], w['config'], run)
+
+
+def sweepFit(GF, data, dataWeights, config, runs, dataTree=None, processes=None, cancelToken=None):
+    '''
+    Fit each run of a sweep in a pool of processes.
+
+    inputs
+    ------
+    GF : starting GeometricField of every run. Not modified.
+    data : prepared point cloud, see meshfitting.prepareData.
+    dataWeights : weights of the prepared point cloud, or None.
+    config : dict of step config strings that the runs override.
+    runs : list of dicts of fitting arguments, see parseSweep.
+    dataTree : optional index of data from meshfitting.buildDataTree.
+    processes : number of worker processes. Defaults to the number of
+        cores.
+    cancelToken : optional convergence.CancellationToken. Checked
+        between runs, and while waiting for the pool; when cancelled, the
+        pool is terminated. A run fitted in this process stops with its
+        best parameters so far.
+
+    returns
+    -------
+    A list of the fitRun results of runs, in the same order. If the sweep
+    was cancelled, only of the runs finished before, which may be none.
+    '''
+    runs = list(runs)
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(1, min(processes, len(runs)))
+
+    if processes == 1:
+        results = []
+        for run in runs:
+            if _isCancelled(cancelToken):
+                break
+            results.append(fitRun(GF, data, dataWeights, dataTree, config, run, cancelToken))
+        return results
+
+    config = meshfitting.shareQueryWorkers(config, processes)
+
+    # spawned rather than forked, as sweeps run from a Qt thread
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with context.Pool(processes, _initWorker, (GF, data, dataWeights, dataTree, config)) as pool:
+        resultIter = pool.imap(_fitWorkerRun, runs)
+        while (len(results) < len(runs)) and not _isCancelled(cancelToken):
+            try:
+                results.append(resultIter.next(_CANCEL_POLL_SECONDS))
+            except multiprocessing.TimeoutError:
+                pass
+        pool.terminate()
+    return results
+
+
+def _isCancelled(cancelToken):
+    return (cancelToken is not None) and cancelToken.isCancelled()
+
+
+def paretoFront(results):
+    '''
+    Returns the indices of the results that no other result beats in both
+    RMS error and normal discontinuity.
+    '''
+    costs = np.array([(r['rmse'], r['normal discontinuity']) for r in results]).reshape((-1, 2))
+    front = []
+    for i, c in enumerate(costs):
+        dominated = np.all(costs <= c, axis=1) & np.any(costs < c, axis=1)
+        if not dominated.any():
+            front.append(i)
+    return front
+
+
+def selectResult(results, selection=SELECT_KNEE):
+    '''
+    Returns the index of the result chosen by selection: SELECT_KNEE,
+    SELECT_RMSE, SELECT_SMOOTHEST, or the index of a result.
+
+    The knee is the Pareto result closest to the best RMS error and normal
+    discontinuity of the front, each scaled by its range over the front.
+    '''
+    if isinstance(selection, int):
+        if not 0 <= selection < len(results):
+            raise ValueError('Invalid sweep selection: {} of {} runs'.format(selection, len(results)))
+        return selection
+    elif selection == SELECT_RMSE:
+        return int(np.argmin([r['rmse'] for r in results]))
+    elif selection == SELECT_SMOOTHEST:
+        return int(np.argmin([r['normal discontinuity'] for r in results]))
+    elif selection == SELECT_KNEE:
+        front = paretoFront(results)
+        costs = np.array([(results[i]['rmse'], results[i]['normal discontinuity']) for i in front])
+        span = costs.max(0) - costs.min(0)
+        span[span == 0.0] = 1.0
+        distances = np.sqrt((((costs - costs.min(0)) / span) ** 2.0).sum(1))
+        return front[int(np.argmin(distances))]
+    else:
+        raise ValueError('Invalid sweep selection: ' + str(selection))
+
+
+def parseSelection(inputStr):
+    '''
+    Parse a 'sweep selection' config string into a selection for
+    selectResult.
+    '''
+    inputStr = inputStr.strip()
+    try:
+        return int(inputStr)
+    except ValueError:
+        return inputStr
+
+
+def summarise(results):
+    '''
+    Returns the results without their parameters and errors, each marked
+    with whether it is on the Pareto front, for reporting.
+    '''
+    front = set(paretoFront(results))
+    summary = []
+    for i, r in enumerate(results):
+        s = dict((k, v) for k, v in r.items() if k not in ('params', 'errors'))
+        s['pareto'] = i in front
+        summary.append(s)
+    return summary
@@ -16,14 +16,15 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
 from PySide6.QtWidgets import (QAbstractButton, QApplication, QDialog, QDialogButtonBox,
-    QFormLayout, QGridLayout, QGroupBox, QLabel,
-    QLineEdit, QSizePolicy, QWidget)
+    QFormLayout, QFrame, QGridLayout, QGroupBox,
+    QLabel, QLineEdit, QScrollArea, QSizePolicy,
+    QVBoxLayout, QWidget)
 
 class Ui_Dialog(object):
     def setupUi(self, Dialog):
         if not Dialog.objectName():
             Dialog.setObjectName(u"Dialog")
-        Dialog.resize(418, 543)
+        Dialog.resize(450, 600)
         self.gridLayout = QGridLayout(Dialog)
         self.gridLayout.setObjectName(u"gridLayout")
         self.buttonBox = QDialogButtonBox(Dialog)
@@ -33,7 +34,17 @@ class Ui_Dialog(object):
 
         self.gridLayout.addWidget(self.buttonBox, 1, 0, 1, 1)
 
-        self.configGroupBox = QGroupBox(Dialog)
+        self.scrollArea = QScrollArea(Dialog)
+        self.scrollArea.setObjectName(u"scrollArea")
+        self.scrollArea.setFrameShape(QFrame.NoFrame)
+        self.scrollArea.setWidgetResizable(True)
+        self.scrollAreaWidgetContents = QWidget()
+        self.scrollAreaWidgetContents.setObjectName(u"scrollAreaWidgetContents")
+        self.scrollAreaWidgetContents.setGeometry(QRect(0, 0, 416, 1100))
+        self.scrollLayout = QVBoxLayout(self.scrollAreaWidgetContents)
+        self.scrollLayout.setObjectName(u"scrollLayout")
+        self.scrollLayout.setContentsMargins(0, 0, 0, 0)
+        self.configGroupBox = QGroupBox(self.scrollAreaWidgetContents)
         self.configGroupBox.setObjectName(u"configGroupBox")
         self.formLayout = QFormLayout(self.configGroupBox)
         self.formLayout.setObjectName(u"formLayout")
@@ -187,8 +198,242 @@ class Ui_Dialog(object):
 
         self.formLayout.setWidget(1, QFormLayout.FieldRole, self.lineEdit14)
 
+        self.label15 = QLabel(self.configGroupBox)
+        self.label15.setObjectName(u"label15")
 
-        self.gridLayout.addWidget(self.configGroupBox, 0, 0, 1, 1)
+        self.formLayout.setWidget(15, QFormLayout.LabelRole, self.label15)
+
+        self.lineEdit15 = QLineEdit(self.configGroupBox)
+        self.lineEdit15.setObjectName(u"lineEdit15")
+
+        self.formLayout.setWidget(15, QFormLayout.FieldRole, self.lineEdit15)
+
+        self.label16 = QLabel(self.configGroupBox)
+        self.label16.setObjectName(u"label16")
+
+        self.formLayout.setWidget(16, QFormLayout.LabelRole, self.label16)
+
+        self.lineEdit16 = QLineEdit(self.configGroupBox)
+        self.lineEdit16.setObjectName(u"lineEdit16")
+
+        self.formLayout.setWidget(16, QFormLayout.FieldRole, self.lineEdit16)
+
+        self.label17 = QLabel(self.configGroupBox)
+        self.label17.setObjectName(u"label17")
+
+        self.formLayout.setWidget(17, QFormLayout.LabelRole, self.label17)
+
+        self.lineEdit17 = QLineEdit(self.configGroupBox)
+        self.lineEdit17.setObjectName(u"lineEdit17")
+
+        self.formLayout.setWidget(17, QFormLayout.FieldRole, self.lineEdit17)
+
+        self.label18 = QLabel(self.configGroupBox)
+        self.label18.setObjectName(u"label18")
+
+        self.formLayout.setWidget(18, QFormLayout.LabelRole, self.label18)
+
+        self.lineEdit18 = QLineEdit(self.configGroupBox)
+        self.lineEdit18.setObjectName(u"lineEdit18")
+
+        self.formLayout.setWidget(18, QFormLayout.FieldRole, self.lineEdit18)
+
+        self.label19 = QLabel(self.configGroupBox)
+        self.label19.setObjectName(u"label19")
+
+        self.formLayout.setWidget(19, QFormLayout.LabelRole, self.label19)
+
+        self.lineEdit19 = QLineEdit(self.configGroupBox)
+        self.lineEdit19.setObjectName(u"lineEdit19")
+
+        self.formLayout.setWidget(19, QFormLayout.FieldRole, self.lineEdit19)
+
+        self.label20 = QLabel(self.configGroupBox)
+        self.label20.setObjectName(u"label20")
+
+        self.formLayout.setWidget(20, QFormLayout.LabelRole, self.label20)
+
+        self.lineEdit20 = QLineEdit(self.configGroupBox)
+        self.lineEdit20.setObjectName(u"lineEdit20")
+
+        self.formLayout.setWidget(20, QFormLayout.FieldRole, self.lineEdit20)
+
+        self.label21 = QLabel(self.configGroupBox)
+        self.label21.setObjectName(u"label21")
+
+        self.formLayout.setWidget(21, QFormLayout.LabelRole, self.label21)
+
+        self.lineEdit21 = QLineEdit(self.configGroupBox)
+        self.lineEdit21.setObjectName(u"lineEdit21")
+
+        self.formLayout.setWidget(21, QFormLayout.FieldRole, self.lineEdit21)
+
+        self.label22 = QLabel(self.configGroupBox)
+        self.label22.setObjectName(u"label22")
+
+        self.formLayout.setWidget(22, QFormLayout.LabelRole, self.label22)
+
+        self.lineEdit22 = QLineEdit(self.configGroupBox)
+        self.lineEdit22.setObjectName(u"lineEdit22")
+
+        self.formLayout.setWidget(22, QFormLayout.FieldRole, self.lineEdit22)
+
+        self.label23 = QLabel(self.configGroupBox)
+        self.label23.setObjectName(u"label23")
+
+        self.formLayout.setWidget(23, QFormLayout.LabelRole, self.label23)
+
+        self.lineEdit23 = QLineEdit(self.configGroupBox)
+        self.lineEdit23.setObjectName(u"lineEdit23")
+
+        self.formLayout.setWidget(23, QFormLayout.FieldRole, self.lineEdit23)
+
+        self.label24 = QLabel(self.configGroupBox)
+        self.label24.setObjectName(u"label24")
+
+        self.formLayout.setWidget(24, QFormLayout.LabelRole, self.label24)
+
+        self.lineEdit24 = QLineEdit(self.configGroupBox)
+        self.lineEdit24.setObjectName(u"lineEdit24")
+
+        self.formLayout.setWidget(24, QFormLayout.FieldRole, self.lineEdit24)
+
+        self.label25 = QLabel(self.configGroupBox)
+        self.label25.setObjectName(u"label25")
+
+        self.formLayout.setWidget(25, QFormLayout.LabelRole, self.label25)
+
+        self.lineEdit25 = QLineEdit(self.configGroupBox)
+        self.lineEdit25.setObjectName(u"lineEdit25")
+
+        self.formLayout.setWidget(25, QFormLayout.FieldRole, self.lineEdit25)
+
+        self.label26 = QLabel(self.configGroupBox)
+        self.label26.setObjectName(u"label26")
+
+        self.formLayout.setWidget(26, QFormLayout.LabelRole, self.label26)
+
+        self.lineEdit26 = QLineEdit(self.configGroupBox)
+        self.lineEdit26.setObjectName(u"lineEdit26")
+
+        self.formLayout.setWidget(26, QFormLayout.FieldRole, self.lineEdit26)
+
+        self.label27 = QLabel(self.configGroupBox)
+        self.label27.setObjectName(u"label27")
+
+        self.formLayout.setWidget(27, QFormLayout.LabelRole, self.label27)
+
+        self.lineEdit27 = QLineEdit(self.configGroupBox)
+        self.lineEdit27.setObjectName(u"lineEdit27")
+
+        self.formLayout.setWidget(27, QFormLayout.FieldRole, self.lineEdit27)
+
+        self.label28 = QLabel(self.configGroupBox)
+        self.label28.setObjectName(u"label28")
+
+        self.formLayout.setWidget(28, QFormLayout.LabelRole, self.label28)
+
+        self.lineEdit28 = QLineEdit(self.configGroupBox)
+        self.lineEdit28.setObjectName(u"lineEdit28")
+
+        self.formLayout.setWidget(28, QFormLayout.FieldRole, self.lineEdit28)
+
+        self.label29 = QLabel(self.configGroupBox)
+        self.label29.setObjectName(u"label29")
+
+        self.formLayout.setWidget(29, QFormLayout.LabelRole, self.label29)
+
+        self.lineEdit29 = QLineEdit(self.configGroupBox)
+        self.lineEdit29.setObjectName(u"lineEdit29")
+
+        self.formLayout.setWidget(29, QFormLayout.FieldRole, self.lineEdit29)
+
+        self.label30 = QLabel(self.configGroupBox)
+        self.label30.setObjectName(u"label30")
+
+        self.formLayout.setWidget(30, QFormLayout.LabelRole, self.label30)
+
+        self.lineEdit30 = QLineEdit(self.configGroupBox)
+        self.lineEdit30.setObjectName(u"lineEdit30")
+
+        self.formLayout.setWidget(30, QFormLayout.FieldRole, self.lineEdit30)
+
+        self.label31 = QLabel(self.configGroupBox)
+        self.label31.setObjectName(u"label31")
+
+        self.formLayout.setWidget(31, QFormLayout.LabelRole, self.label31)
+
+        self.lineEdit31 = QLineEdit(self.configGroupBox)
+        self.lineEdit31.setObjectName(u"lineEdit31")
+
+        self.formLayout.setWidget(31, QFormLayout.FieldRole, self.lineEdit31)
+
+        self.label32 = QLabel(self.configGroupBox)
+        self.label32.setObjectName(u"label32")
+
+        self.formLayout.setWidget(32, QFormLayout.LabelRole, self.label32)
+
+        self.lineEdit32 = QLineEdit(self.configGroupBox)
+        self.lineEdit32.setObjectName(u"lineEdit32")
+
+        self.formLayout.setWidget(32, QFormLayout.FieldRole, self.lineEdit32)
+
+        self.label33 = QLabel(self.configGroupBox)
+        self.label33.setObjectName(u"label33")
+
+        self.formLayout.setWidget(33, QFormLayout.LabelRole, self.label33)
+
+        self.lineEdit33 = QLineEdit(self.configGroupBox)
+        self.lineEdit33.setObjectName(u"lineEdit33")
+
+        self.formLayout.setWidget(33, QFormLayout.FieldRole, self.lineEdit33)
+
+        self.label34 = QLabel(self.configGroupBox)
+        self.label34.setObjectName(u"label34")
+
+        self.formLayout.setWidget(34, QFormLayout.LabelRole, self.label34)
+
+        self.lineEdit34 = QLineEdit(self.configGroupBox)
+        self.lineEdit34.setObjectName(u"lineEdit34")
+
+        self.formLayout.setWidget(34, QFormLayout.FieldRole, self.lineEdit34)
+
+        self.label35 = QLabel(self.configGroupBox)
+        self.label35.setObjectName(u"label35")
+
+        self.formLayout.setWidget(35, QFormLayout.LabelRole, self.label35)
+
+        self.lineEdit35 = QLineEdit(self.configGroupBox)
+        self.lineEdit35.setObjectName(u"lineEdit35")
+
+        self.formLayout.setWidget(35, QFormLayout.FieldRole, self.lineEdit35)
+
+        self.label36 = QLabel(self.configGroupBox)
+        self.label36.setObjectName(u"label36")
+
+        self.formLayout.setWidget(36, QFormLayout.LabelRole, self.label36)
+
+        self.lineEdit36 = QLineEdit(self.configGroupBox)
+        self.lineEdit36.setObjectName(u"lineEdit36")
+
+        self.formLayout.setWidget(36, QFormLayout.FieldRole, self.lineEdit36)
+
+        self.label37 = QLabel(self.configGroupBox)
+        self.label37.setObjectName(u"label37")
+
+        self.formLayout.setWidget(37, QFormLayout.LabelRole, self.label37)
+
+        self.lineEdit37 = QLineEdit(self.configGroupBox)
+        self.lineEdit37.setObjectName(u"lineEdit37")
+
+        self.formLayout.setWidget(37, QFormLayout.FieldRole, self.lineEdit37)
+
+
+        self.scrollLayout.addWidget(self.configGroupBox)
+
+        self.scrollArea.setWidget(self.scrollAreaWidgetContents)
+
+        self.gridLayout.addWidget(self.scrollArea, 0, 0, 1, 1)
 
 
         self.retranslateUi(Dialog)
@@ -216,5 +461,28 @@ class Ui_Dialog(object):
         self.label12.setText(QCoreApplication.translate("Dialog", u"verbose:  ", None))
         self.label13.setText(QCoreApplication.translate("Dialog", u"fixed nodes:  ", None))
         self.label14.setText(QCoreApplication.translate("Dialog", u"GUI:", None))
+        self.label15.setText(QCoreApplication.translate("Dialog", u"Basis cache size:  ", None))
+        self.label16.setText(QCoreApplication.translate("Dialog", u"Basis cache dir:  ", None))
+        self.label17.setText(QCoreApplication.translate("Dialog", u"Fit schedule:  ", None))
+        self.label18.setText(QCoreApplication.translate("Dialog", u"Downsample spacing:  ", None))
+        self.label19.setText(QCoreApplication.translate("Dialog", u"Downsample points:  ", None))
+        self.label20.setText(QCoreApplication.translate("Dialog", u"Plateau iterations:  ", None))
+        self.label21.setText(QCoreApplication.translate("Dialog", u"Plateau tolerance:  ", None))
+        self.label22.setText(QCoreApplication.translate("Dialog", u"Timeout:  ", None))
+        self.label23.setText(QCoreApplication.translate("Dialog", u"Result cache dir:  ", None))
+        self.label24.setText(QCoreApplication.translate("Dialog", u"Result cache size (MB):  ", None))
+        self.label25.setText(QCoreApplication.translate("Dialog", u"Precision:  ", None))
+        self.label26.setText(QCoreApplication.translate("Dialog", u"Sweep:  ", None))
+        self.label27.setText(QCoreApplication.translate("Dialog", u"Sweep processes:  ", None))
+        self.label28.setText(QCoreApplication.translate("Dialog", u"Sweep selection:  ", None))
+        self.label29.setText(QCoreApplication.translate("Dialog", u"Preview rate:  ", None))
+        self.label30.setText(QCoreApplication.translate("Dialog", u"Render point budget:  ", None))
+        self.label31.setText(QCoreApplication.translate("Dialog", u"Incremental:  ", None))
+        self.label32.setText(QCoreApplication.translate("Dialog", u"Incremental tolerance:  ", None))
+        self.label33.setText(QCoreApplication.translate("Dialog", u"Incremental radius:  ", None))
+        self.label34.setText(QCoreApplication.translate("Dialog", u"Adaptive discretisation:  ", None))
+        self.label35.setText(QCoreApplication.translate("Dialog", u"Query workers:  ", None))
+        self.label36.setText(QCoreApplication.translate("Dialog", u"Query chunk size:  ", None))
+        self.label37.setText(QCoreApplication.translate("Dialog", u"Element errors:  ", None))
     # retranslateUi
 
@@ -15,11 +15,11 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QDialog, QFormLayout, QFrame,
-    QGridLayout, QGroupBox, QHBoxLayout, QHeaderView,
-    QLabel, QLayout, QLineEdit, QPushButton,
-    QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem,
-    QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QAbstractItemView, QApplication, QDialog, QFormLayout,
+    QFrame, QGridLayout, QGroupBox, QHBoxLayout,
+    QHeaderView, QLabel, QLayout, QLineEdit,
+    QPushButton, QSizePolicy, QSpacerItem, QTableWidget,
+    QTableWidgetItem, QVBoxLayout, QWidget)
 
 from gias3.mapclientpluginutilities.viewers.mayaviscenewidget import MayaviSceneWidget
 
@@ -145,6 +145,12 @@ class Ui_Dialog(object):
 
         self.fitButtonsGroup.addWidget(self.abortButton, 1, 0, 1, 1)
 
+        self.stopButton = QPushButton(self.widget)
+        self.stopButton.setObjectName(u"stopButton")
+        self.stopButton.setEnabled(False)
+
+        self.fitButtonsGroup.addWidget(self.stopButton, 2, 0, 1, 2)
+
 
         self.verticalLayout.addLayout(self.fitButtonsGroup)
 
@@ -203,6 +209,40 @@ class Ui_Dialog(object):
 
         self.verticalLayout.addWidget(self.errorGroup)
 
+        self.traceGroup = QGroupBox(self.widget)
+        self.traceGroup.setObjectName(u"traceGroup")
+        self.traceLayout = QVBoxLayout(self.traceGroup)
+        self.traceLayout.setObjectName(u"traceLayout")
+        self.fitTraceTableWidget = QTableWidget(self.traceGroup)
+        self.fitTraceTableWidget.setObjectName(u"fitTraceTableWidget")
+        self.fitTraceTableWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        self.traceLayout.addWidget(self.fitTraceTableWidget)
+
+
+        self.verticalLayout.addWidget(self.traceGroup)
+
+        self.sweepGroup = QGroupBox(self.widget)
+        self.sweepGroup.setObjectName(u"sweepGroup")
+        self.sweepLayout = QVBoxLayout(self.sweepGroup)
+        self.sweepLayout.setObjectName(u"sweepLayout")
+        self.sweepTableWidget = QTableWidget(self.sweepGroup)
+        self.sweepTableWidget.setObjectName(u"sweepTableWidget")
+        self.sweepTableWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.sweepTableWidget.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.sweepTableWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
+
+        self.sweepLayout.addWidget(self.sweepTableWidget)
+
+        self.sweepSelectButton = QPushButton(self.sweepGroup)
+        self.sweepSelectButton.setObjectName(u"sweepSelectButton")
+        self.sweepSelectButton.setEnabled(False)
+
+        self.sweepLayout.addWidget(self.sweepSelectButton)
+
+
+        self.verticalLayout.addWidget(self.sweepGroup)
+
         self.screenshotgroup = QGroupBox(self.widget)
         self.screenshotgroup.setObjectName(u"screenshotgroup")
         self.screenshotgroup.setAlignment(Qt.AlignLeading|Qt.AlignLeft|Qt.AlignVCenter)
@@ -337,7 +377,11 @@ class Ui_Dialog(object):
         self.resetButton.setText(QCoreApplication.translate("Dialog", u"Reset", None))
         self.acceptButton.setText(QCoreApplication.translate("Dialog", u"Accept", None))
         self.abortButton.setText(QCoreApplication.translate("Dialog", u"Abort", None))
+        self.stopButton.setText(QCoreApplication.translate("Dialog", u"Stop", None))
         self.errorGroup.setTitle(QCoreApplication.translate("Dialog", u"Fitting Errors", None))
+        self.traceGroup.setTitle(QCoreApplication.translate("Dialog", u"Fit Trace", None))
+        self.sweepGroup.setTitle(QCoreApplication.translate("Dialog", u"Sweep Runs", None))
+        self.sweepSelectButton.setText(QCoreApplication.translate("Dialog", u"Select Run", None))
         self.RMSELabel.setText(QCoreApplication.translate("Dialog", u"RMS:", None))
         self.meanErrorLabel.setText(QCoreApplication.translate("Dialog", u"Mean:", None))
         self.SDLabel.setText(QCoreApplication.translate("Dialog", u"S.D.:", None))
@@ -32,4 +32,9 @@ setup(name=u'mapclientplugins.fieldworkmeshfittingstep',
     include_package_data=True,
     zip_safe=False,
     install_requires=requires,
+    entry_points={
+        'console_scripts': [
+            'fieldworkmeshfit-batch = mapclientplugins.fieldworkmeshfittingstep.batchfit:main',
+        ],
+    },
     )
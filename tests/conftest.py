@@ -0,0 +1,9 @@
+'''
+Puts the repository root, for the package when it is not installed, and
+the benchmarks directory, for its synthetic meshes, on sys.path.
+'''
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [_ROOT, os.path.join(_ROOT, 'benchmarks')]
@@ -0,0 +1,81 @@
+'''
+Tests of the basis cache: LRU eviction in memory and on disk, and the
+stability of its keys.
+'''
+import os
+
+import synthetic
+from mapclientplugins.fieldworkmeshfittingstep import basiscache
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import flatFunction, meshTopologyKey
+
+
+def test_make_key():
+    assert basiscache.makeKey('a', [5, 5], 1.0) == basiscache.makeKey('a', [5, 5], 1.0)
+    assert basiscache.makeKey('a', [5, 5]) != basiscache.makeKey('a', [5, 6])
+    assert basiscache.makeKey('a', 'b') != basiscache.makeKey('ab')
+
+
+def test_memory_lru_eviction():
+    cache = basiscache.BasisCache(maxEntries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # reading a makes b the least recently used
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_get_or_build():
+    cache = basiscache.BasisCache()
+    built = []
+
+    def builder():
+        built.append(1)
+        return 'value'
+
+    assert cache.getOrBuild('k', builder) == 'value'
+    assert cache.getOrBuild('k', builder) == 'value'
+    assert len(built) == 1
+
+
+def test_disk_entries(tmp_path):
+    cacheDir = str(tmp_path / 'basis')
+    cache = basiscache.BasisCache(maxEntries=2, cacheDir=cacheDir)
+    for i, key in enumerate('abc'):
+        cache.put(key, i)
+        # distinct times, so that the oldest file is the first put
+        path = os.path.join(cacheDir, key + '.pkl')
+        if os.path.exists(path):
+            os.utime(path, (1000.0 + i, 1000.0 + i))
+
+    assert sorted(os.listdir(cacheDir)) == ['b.pkl', 'c.pkl']
+
+    # a new cache on the same directory loads entries from disk
+    other = basiscache.BasisCache(maxEntries=2, cacheDir=cacheDir)
+    assert 'c' in other
+    assert other.get('c') == 2
+    assert len(other) == 1
+
+    other.clear()
+    assert os.listdir(cacheDir) == []
+    assert 'c' not in other
+
+
+def test_topology_key():
+    '''
+    Meshes with the same topology share a key whatever their node
+    positions; meshes with different topologies do not.
+    '''
+    GF = synthetic.makeMesh('sphere', 3, elements=(1, 1))
+    moved = synthetic.makeMesh('sphere', 3, elements=(1, 1))
+    moved.set_field_parameters(moved.get_field_parameters() * 2.0)
+    finer = synthetic.makeMesh('sphere', 3, elements=(2, 2))
+
+    key = meshTopologyKey(flatFunction(GF))
+    assert meshTopologyKey(flatFunction(moved)) == key
+    assert meshTopologyKey(flatFunction(finer)) != key
@@ -0,0 +1,67 @@
+'''
+Tests of the convergence monitor: plateau detection, the best iteration,
+cancellation and time limits.
+'''
+import time
+
+import numpy as np
+import pytest
+
+from mapclientplugins.fieldworkmeshfittingstep import convergence
+
+
+def _update(monitor, rms):
+    return monitor.update((None, np.array([rms]), rms))
+
+
+def test_plateau():
+    monitor = convergence.ConvergenceMonitor(window=2, tol=0.01)
+    assert [_update(monitor, rms) for rms in (10.0, 5.0, 4.0, 3.99)] == [False, False, False, False]
+    # 3.98 is within 1% of 4.0, two iterations before
+    assert _update(monitor, 3.98)
+    assert monitor.stopReason == convergence.PLATEAU
+
+
+def test_zero_error_plateau():
+    monitor = convergence.ConvergenceMonitor(window=1, tol=0.01)
+    assert not _update(monitor, 0.0)
+    assert _update(monitor, 0.0)
+    assert monitor.stopReason == convergence.PLATEAU
+
+
+def test_no_plateau_without_tolerance():
+    monitor = convergence.ConvergenceMonitor(window=1, tol=None)
+    assert not any(_update(monitor, 1.0) for _ in range(5))
+    assert monitor.stopReason is None
+
+
+def test_best_iteration():
+    monitor = convergence.ConvergenceMonitor()
+    params = np.array([1.0])
+    monitor.update((None, params, 2.0))
+    params[0] = 2.0
+    monitor.update((None, params, 3.0))
+    # the best parameters are copied, not changed by later iterations
+    assert monitor.bestRMS == 2.0
+    assert monitor.best[1][0] == 1.0
+
+
+def test_cancellation():
+    token = convergence.CancellationToken()
+    monitor = convergence.ConvergenceMonitor(token=token)
+    monitor.check()
+    token.cancel()
+    with pytest.raises(convergence.FitStopped):
+        monitor.check()
+    assert _update(monitor, 1.0)
+    assert monitor.stopReason == convergence.CANCELLED
+
+    token.reset()
+    assert not token.isCancelled()
+
+
+def test_timeout():
+    monitor = convergence.ConvergenceMonitor(deadline=time.time() - 1.0)
+    with pytest.raises(convergence.FitStopped) as stopped:
+        monitor.check()
+    assert stopped.value.reason == convergence.TIMEOUT
@@ -0,0 +1,44 @@
+'''
+Tests of the closest point correspondences of each fit mode.
+'''
+import numpy as np
+import pytest
+
+from mapclientplugins.fieldworkmeshfittingstep import surfacefitting as sf
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.RandomState(0)
+    ep = rng.uniform(size=(300, 3))
+    data = rng.uniform(size=(1000, 3))
+    # non-uniform weights, e.g. of a downsampled cloud
+    dataWeights = rng.uniform(0.1, 5.0, size=1000)
+    return ep, data, sf.cKDTree(data), dataWeights
+
+
+@pytest.mark.parametrize('workers', [1, 2, -1])
+def test_two_way_directions_have_equal_total_weight(points, workers):
+    ep, data, dataTree, dataWeights = points
+    epI, dataI, pairW, queryI, nQuery = sf._correspondences(
+        sf.TWO_WAY, ep, data, dataTree, dataWeights, 1, {'workers': workers}, None
+    )
+    assert nQuery == len(data) + len(ep)
+    dpep = queryI < len(data)
+    assert dpep.sum() == len(data)
+    np.testing.assert_allclose(pairW[dpep].sum(), dataWeights.sum())
+    np.testing.assert_allclose(pairW[~dpep].sum(), pairW[dpep].sum())
+
+
+def test_two_way_matches_each_direction(points):
+    ep, data, dataTree, dataWeights = points
+    twoWay = sf._correspondences(sf.TWO_WAY, ep, data, dataTree, dataWeights, 1, {'workers': 2}, None)
+    dpep = sf._correspondences('DPEP', ep, data, dataTree, dataWeights, 1, {}, None)
+    epdp = sf._correspondences('EPDP', ep, data, dataTree, dataWeights, 1, {}, None)
+    nData = len(data)
+    for i in range(2):
+        np.testing.assert_array_equal(twoWay[i], np.hstack((dpep[i], epdp[i])))
+    np.testing.assert_array_equal(twoWay[3], np.hstack((dpep[3], epdp[3] + nData)))
+    # EPDP pairs keep their relative weights
+    epdpW = twoWay[2][nData:]
+    np.testing.assert_allclose(epdpW / epdpW.sum(), epdp[2] / epdp[2].sum())
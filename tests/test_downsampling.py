@@ -0,0 +1,80 @@
+'''
+Tests of voxel downsampling: the centroids and weights of the voxels, and
+that a fit to a downsampled cloud is as smooth as a fit to the full cloud.
+'''
+import numpy as np
+import pytest
+
+import synthetic
+from mapclientplugins.fieldworkmeshfittingstep import downsampling
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import MeshSampler
+
+
+def test_centroids_and_unit_weights():
+    # two voxels of spacing 1: three points in one, one in the other
+    data = np.array([[0.1, 0.1, 0.1], [0.3, 0.5, 0.1], [0.2, 0.3, 0.7], [1.5, 0.5, 0.5]])
+    points, weights = downsampling.voxelDownsample(data, spacing=1.0)
+
+    order = np.argsort(points[:, 0])
+    np.testing.assert_allclose(points[order], [[0.2, 0.3, 0.3], [1.5, 0.5, 0.5]])
+    # each voxel counts as its points do in the least squares objective
+    np.testing.assert_allclose(weights[order], [np.sqrt(3.0), 1.0])
+
+
+def test_weights_are_root_sum_of_squares():
+    rng = np.random.RandomState(0)
+    data = rng.uniform(0.0, 4.0, size=(1000, 3))
+    pointWeights = rng.uniform(0.5, 2.0, 1000)
+    points, weights = downsampling.voxelDownsample(data, spacing=1.0, weights=pointWeights)
+
+    # sum of the squared weights of each voxel, computed point by point
+    voxels = np.floor((data - data.min(0)) / 1.0).astype(int)
+    expected = {}
+    for v, w in zip(map(tuple, voxels), pointWeights):
+        expected[v] = expected.get(v, 0.0) + w * w
+    assert len(points) == len(expected)
+    np.testing.assert_allclose(np.sort(weights ** 2), np.sort(list(expected.values())))
+    np.testing.assert_allclose((weights ** 2).sum(), (pointWeights ** 2).sum())
+
+
+def test_point_count_target():
+    data = np.random.RandomState(1).uniform(size=(5000, 3))
+    points, weights = downsampling.voxelDownsample(data, nPoints=500)
+    assert 100 < len(points) <= 500
+    np.testing.assert_allclose((weights ** 2).sum(), len(data))
+
+    # a target above the number of points leaves the cloud as it is
+    points, weights = downsampling.voxelDownsample(data, nPoints=10000)
+    np.testing.assert_array_equal(points, data)
+    np.testing.assert_array_equal(weights, np.ones(len(data)))
+
+
+def test_requires_spacing_or_count():
+    with pytest.raises(ValueError):
+        downsampling.voxelDownsample(np.zeros((3, 3)))
+
+
+def test_downsampled_fit_smoothing():
+    '''
+    A fit to a downsampled cloud balances the data term against the
+    smoothing penalty as a fit to the full cloud does, so their fitted
+    meshes have about the same Sobolev norm. Weighting each voxel by its
+    number of points instead would about double it.
+    '''
+    GF = synthetic.makeMesh('femur', 3, elements=(4, 3))
+    data = synthetic.makePointCloud('femur', 50000)
+    config = {
+        'verbose': 'False', 'max iterations': '6', 'mesh discretisation': '[5,5]', 'fit mode': 'DPEP',
+        'sobelov discretisation': '[4,4]', 'sobelov weight': '1.0', 'normal weight': '0.0',
+    }
+    sobMatrix = MeshSampler(GF, meshfitting.getConfigBasisCache({})).sobolevMatrix([4, 4], [1.0] * 5)
+
+    def sobolevNorm(data, dataWeights):
+        params = meshfitting.fitMesh(meshfitting.shareTopology(GF), data, dataWeights, config)[1]
+        return (sobMatrix.dot(params.reshape((3, -1)).T) ** 2.0).sum()
+
+    full = sobolevNorm(data, None)
+    points, weights = meshfitting.prepareData(data, None, dict(config, **{'downsample spacing': '4.0'}))
+    assert len(points) < len(data) / 10
+    assert abs(sobolevNorm(points, weights) / full - 1.0) < 0.15
@@ -0,0 +1,79 @@
+'''
+Tests of the chunked error summaries: moments and percentiles against
+numpy, independence of the chunk size, and per-element aggregation.
+'''
+import numpy as np
+import pytest
+
+from mapclientplugins.fieldworkmeshfittingstep import errorstats
+
+
+@pytest.fixture(scope='module')
+def errors():
+    rng = np.random.RandomState(0)
+    errors = rng.lognormal(mean=0.0, sigma=1.0, size=100000)
+    errors[:100] = 0.0
+    return errors
+
+
+def test_moments(errors):
+    summary = errorstats.summariseErrors(errors, chunk=7919)
+    assert summary['count'] == len(errors)
+    assert summary['missing'] == 0
+    np.testing.assert_allclose(summary['mean'], errors.mean(), rtol=1e-10)
+    np.testing.assert_allclose(summary['sd'], errors.std(), rtol=1e-10)
+    np.testing.assert_allclose(summary['rms'], np.sqrt((errors ** 2).mean()), rtol=1e-10)
+    assert summary['max'] == errors.max()
+
+
+@pytest.mark.parametrize('q', [0, 1, 50, 90, 95, 99, 100])
+def test_percentile_accuracy(errors, q):
+    summary = errorstats.ErrorSummary()
+    summary.add(errors)
+    # the estimate is within the relative accuracy of the order statistics
+    # either side of the rank
+    lower = np.percentile(errors, q, method='lower')
+    higher = np.percentile(errors, q, method='higher')
+    value = summary.percentile(q)
+    assert lower * (1.0 - 0.01) <= value <= higher * (1.0 + 0.01)
+
+
+def test_chunking(errors):
+    whole = errorstats.summariseErrors(errors, chunk=len(errors))
+    for chunk in (1000, 4096, 33333):
+        chunked = errorstats.summariseErrors(errors, chunk=chunk)
+        assert chunked.keys() == whole.keys()
+        for key in whole:
+            np.testing.assert_allclose(chunked[key], whole[key], rtol=1e-10)
+
+
+def test_non_finite_errors_are_missing():
+    summary = errorstats.summariseErrors(np.array([1.0, np.nan, 3.0, np.inf]), chunk=3)
+    assert summary['count'] == 2
+    assert summary['missing'] == 2
+    assert summary['mean'] == 2.0
+    assert summary['max'] == 3.0
+
+    empty = errorstats.summariseErrors(np.array([np.nan]))
+    assert empty['count'] == 0
+    assert np.isnan(empty['mean']) and np.isnan(empty['p50'])
+
+
+def test_sqrt_in_place():
+    sqErrors = np.array([4.0, 9.0, 16.0, 0.0, 1.0])
+    out = errorstats.sqrtInPlace(sqErrors, chunk=2)
+    assert out is sqErrors
+    np.testing.assert_array_equal(sqErrors, [2.0, 3.0, 4.0, 0.0, 1.0])
+
+
+@pytest.mark.parametrize('chunk', [2, 3, 100])
+def test_element_errors(chunk):
+    errors = np.array([1.0, 2.0, 6.0, np.nan, 4.0, 5.0, 3.0])
+    errorElements = np.array([3, 1, 3, 1, -1, 7, 1])
+    result = errorstats.elementErrors(errors, errorElements, [1, 3, 5, 7], chunk=chunk)
+
+    np.testing.assert_array_equal(result['element'], [1, 3, 5, 7])
+    # the NaN error and the point without an element are not counted
+    np.testing.assert_array_equal(result['count'], [2, 2, 0, 1])
+    np.testing.assert_allclose(result['mean'], [2.5, 3.5, np.nan, 5.0])
+    np.testing.assert_allclose(result['max'], [3.0, 6.0, np.nan, 5.0])
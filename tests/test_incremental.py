@@ -0,0 +1,87 @@
+'''
+Tests of incremental re-fits: the spatial diff of point clouds, the nodes
+near changed points, and that a re-fit only moves those nodes.
+'''
+import numpy as np
+
+import synthetic
+from mapclientplugins.fieldworkmeshfittingstep import incremental
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import MeshSampler
+
+GD = [4, 4]
+
+
+def _rows(points):
+    return sorted(map(tuple, np.round(points, 9)))
+
+
+def test_changed_points():
+    rng = np.random.RandomState(0)
+    old = rng.uniform(size=(1000, 3))
+    moved = old[:10] + 0.5
+    added = rng.uniform(size=(3, 3))
+    new = np.vstack([moved, old[10:-5], added])
+    # the order of the points does not matter
+    new = new[rng.permutation(len(new))]
+
+    changed = incremental.changedPoints(old, new)
+    assert _rows(changed) == _rows(np.vstack([moved, added, old[:10], old[-5:]]))
+
+
+def test_changed_points_tolerance():
+    old = np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]])
+    new = old + 1e-3
+    assert incremental.changedPoints(old, new).shape == (4, 3)
+    assert incremental.changedPoints(old, new, tol=1e-2).shape == (0, 3)
+    assert incremental.changedPoints(old, old.copy()).shape == (0, 3)
+
+
+def test_nodes_near_points():
+    GF = synthetic.makeMesh('sphere', 3, elements=(2, 2))
+    params = GF.get_field_parameters()
+    sampler = MeshSampler(GF, meshfitting.getConfigBasisCache({}))
+    A, rowElements = sampler.evaluationMatrix(GD, params)
+    ep = A.dot(params[:, :, 0].T)
+
+    assert len(incremental.nodesNearPoints(GF, params, np.zeros((0, 3)), GD)) == 0
+
+    # a point just off the sample point furthest from other elements gives
+    # the nodes of its element only
+    otherDistance = [np.linalg.norm(ep[rowElements != e] - p, axis=1).min() for p, e in zip(ep, rowElements)]
+    row = int(np.argmax(otherDistance))
+    element = rowElements[row]
+    nodes = incremental.nodesNearPoints(GF, params, ep[row:row + 1] * 1.001, GD)
+    np.testing.assert_array_equal(nodes, np.unique(A[rowElements == element].nonzero()[1]))
+    assert len(nodes) < params.shape[1]
+
+    # a radius adds the elements of the sample points within it
+    wider = incremental.nodesNearPoints(GF, params, ep[row:row + 1] * 1.001, GD, radius=50.0)
+    assert set(nodes) < set(wider)
+
+
+def test_fit_incremental():
+    '''
+    A re-fit to a cloud with a dent only moves the nodes near the dent,
+    and returns None when most of the cloud has changed.
+    '''
+    GF = synthetic.makeMesh('sphere', 3, elements=(2, 2))
+    oldData = synthetic.makePointCloud('sphere', 3000)
+    config = {'verbose': 'False', 'max iterations': '2', 'mesh discretisation': repr(GD),
+              'normal weight': '0.0'}
+    params = meshfitting.fitMesh(meshfitting.shareTopology(GF), oldData, None, config)[1]
+
+    # push in the points in a small cap
+    centre = oldData[np.argmax(oldData[:, 2])]
+    dent = np.linalg.norm(oldData - centre, axis=1) < 0.2 * np.ptp(oldData[:, 2])
+    newData = oldData.copy()
+    newData[dent] *= 0.9
+
+    output = incremental.fitIncremental(GF, params, oldData, newData, None, config)
+    newParams, nChanged, nFree = output[1], output[-2], output[-1]
+    assert nChanged == 2 * dent.sum()
+    assert 0 < nFree < params.shape[1]
+    moved = np.any(np.abs(newParams - params) > 1e-12, axis=(0, 2))
+    assert 0 < moved.sum() <= nFree
+
+    assert incremental.fitIncremental(GF, params, oldData, oldData * 0.9, None, config) is None
@@ -0,0 +1,141 @@
+'''
+Finite difference checks of the analytic Jacobians of the fitting
+objective: the data term, the Sobolev penalty and the normal penalty, on
+all nodes and on the free nodes left by _reduceMatrices.
+'''
+import numpy as np
+import pytest
+
+import synthetic
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep import surfacefitting as sf
+from mapclientplugins.fieldworkmeshfittingstep.meshsampling import MeshSampler
+
+# relative tolerance of the analytic against the finite difference Jacobian
+RTOL = 1e-6
+
+# every FIXED_STEP-th node is fixed in the reduced checks
+FIXED_STEP = 3
+
+
+@pytest.fixture(scope='module')
+def mesh():
+    '''
+    A cube-sphere of 6 cubic elements with randomly perturbed nodes, so
+    that the normals are discontinuous across its edges, its sampler and
+    its nx3 parameters.
+    '''
+    GF = synthetic.makeMesh('sphere', 3, elements=(1, 1))
+    sampler = MeshSampler(GF, meshfitting.getConfigBasisCache({}))
+    P = GF.get_field_parameters()[:, :, 0].T
+    P = P + np.random.RandomState(0).normal(scale=0.5, size=P.shape)
+    return sampler, P
+
+
+def _finiteDifferenceJacobian(f, x, h=1e-6):
+    J = np.zeros((f(x).shape[0], x.shape[0]))
+    for i in range(x.shape[0]):
+        dx = np.zeros_like(x)
+        dx[i] = h
+        J[:, i] = (f(x + dx) - f(x - dx)) / (2.0 * h)
+    return J
+
+
+def _checkJacobian(obj, jac, P):
+    '''
+    Check jac against finite differences of obj, both functions of the nx3
+    parameter array P, at P. Parameters are ordered by coordinate, as in
+    fitSurfacePerItSearch.
+    '''
+    dims = P.shape[1]
+    x0 = P.T.ravel()
+
+    def f(x):
+        return obj(x.reshape((dims, -1)).T)
+
+    expected = _finiteDifferenceJacobian(f, x0)
+    actual = jac(P).toarray()
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=RTOL, atol=RTOL * np.abs(expected).max())
+
+
+def _split(P, fixed):
+    '''
+    Returns the free and fixed nodes, with every FIXED_STEP-th node fixed
+    if fixed is True.
+    '''
+    return sf._splitNodes(P.shape[0], np.arange(0, P.shape[0], FIXED_STEP) if fixed else None)
+
+
+@pytest.mark.parametrize('fixed', [False, True])
+def test_data_jacobian(mesh, fixed):
+    sampler, P = mesh
+    A = sampler.evaluationMatrix([4, 4], P.T)[0]
+    rng = np.random.RandomState(1)
+    epI = rng.randint(0, A.shape[0], 200)
+    target = A[epI].dot(P) + rng.normal(size=(200, 3))
+    pairW = rng.uniform(0.5, 2.0, 200)
+
+    freeNodes, fixedNodes = _split(P, fixed)
+    if len(fixedNodes) > 0:
+        rows, (Ap,), (offset,) = sf._reduceMatrices([A[epI]], freeNodes, fixedNodes, P)
+        target = target[rows] - offset
+        pairW = pairW[rows]
+    else:
+        Ap = A[epI]
+
+    def obj(Pn):
+        return pairW * ((Ap.dot(Pn) - target) ** 2.0).sum(1)
+
+    def jac(Pn):
+        return sf._geomJacobian(Ap, pairW, Ap.dot(Pn) - target)
+
+    _checkJacobian(obj, jac, P[freeNodes])
+
+
+@pytest.mark.parametrize('fixed', [False, True])
+def test_sobolev_jacobian(mesh, fixed):
+    sampler, P = mesh
+    sobMatrix = sampler.sobolevMatrix([4, 4], [1e-3, 1e-3, 1e-3, 1e-3, 2e-3], P.T)
+    freeNodes, fixedNodes = _split(P, fixed)
+    offset = None
+    if len(fixedNodes) > 0:
+        rows, (sobMatrix,), (offset,) = sf._reduceMatrices([sobMatrix], freeNodes, fixedNodes, P)
+
+    _checkJacobian(
+        sf.makeSobelovPenalty(sobMatrix, offset), sf.makeSobelovPenaltyJacobian(sobMatrix), P[freeNodes]
+    )
+
+
+@pytest.mark.parametrize('fixed', [False, True])
+def test_normal_jacobian(mesh, fixed):
+    sampler, P = mesh
+    edgeMatrices = sampler.edgeDerivativeMatrices(4)
+    freeNodes, fixedNodes = _split(P, fixed)
+    offsets = None
+    if len(fixedNodes) > 0:
+        rows, edgeMatrices, offsets = sf._reduceMatrices(edgeMatrices, freeNodes, fixedNodes, P)
+
+    nObj = sf.makeNormalPenalty(edgeMatrices, offsets)
+    assert np.abs(nObj(P[freeNodes])).max() > 1e-3
+    _checkJacobian(nObj, sf.makeNormalPenaltyJacobian(edgeMatrices, offsets), P[freeNodes])
+
+
+@pytest.mark.parametrize('matrices', ['evaluation', 'sobolev', 'edge derivatives'])
+def test_reduced_matrices(mesh, matrices):
+    '''
+    Reduced matrices evaluate the rows that depend on the free nodes as
+    the full matrices do.
+    '''
+    sampler, P = mesh
+    if matrices == 'evaluation':
+        full = [sampler.evaluationMatrix([4, 4], P.T)[0]]
+    elif matrices == 'sobolev':
+        full = [sampler.sobolevMatrix([4, 4], [1e-3, 1e-3, 1e-3, 1e-3, 2e-3], P.T)]
+    else:
+        full = list(sampler.edgeDerivativeMatrices(4))
+
+    freeNodes, fixedNodes = _split(P, True)
+    rows, reduced, offsets = sf._reduceMatrices(full, freeNodes, fixedNodes, P)
+    for M, R, offset in zip(full, reduced, offsets):
+        np.testing.assert_allclose(R.dot(P[freeNodes]) + offset, M.dot(P)[rows], rtol=1e-12, atol=1e-9)
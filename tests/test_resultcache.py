@@ -0,0 +1,103 @@
+'''
+Tests of the fit result cache: input and config keys, near hits and LRU
+eviction by size.
+'''
+import os
+
+import numpy as np
+
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep import resultcache
+
+
+def test_hash_array():
+    a = np.arange(12.0).reshape((4, 3))
+    assert resultcache.hashArray(a) == resultcache.hashArray(a.copy())
+    # non-contiguous views hash by their contents
+    assert resultcache.hashArray(a.T) == resultcache.hashArray(np.ascontiguousarray(a.T))
+    assert resultcache.hashArray(a) != resultcache.hashArray(a.reshape((3, 4)))
+    assert resultcache.hashArray(a) != resultcache.hashArray(a.astype(np.float32))
+    b = a.copy()
+    b[2, 1] += 1e-9
+    assert resultcache.hashArray(a) != resultcache.hashArray(b)
+    assert resultcache.hashArray(None) is None
+
+
+def test_input_key():
+    params = np.ones((3, 10, 1))
+    key = resultcache.makeInputKey('data', params, 'topology')
+    assert resultcache.makeInputKey('data', params.copy(), 'topology') == key
+    assert resultcache.makeInputKey('other', params, 'topology') != key
+    assert resultcache.makeInputKey('data', params * 2.0, 'topology') != key
+    assert resultcache.makeInputKey('data', params, 'other') != key
+
+
+def test_config_key_normalised():
+    '''
+    Configs are compared after parsing and filling in defaults, and
+    without the configs that do not change the result.
+    '''
+    key = meshfitting.fitConfigKey({})
+    assert meshfitting.fitConfigKey(dict(meshfitting.FIT_CONFIG_DEFAULTS)) == key
+    assert meshfitting.fitConfigKey({'normal weight': '5e1', 'sobelov discretisation': '[8, 8]'}) == key
+    assert meshfitting.fitConfigKey({'normal weight': '51.0'}) != key
+    assert meshfitting.fitConfigKey({'downsample spacing': '2.0'}) != key
+
+
+def test_config_key_ignores_non_result_args():
+    key = meshfitting.fitConfigKey({'fit schedule': "[{'it_max':2}]"})
+    nonResult = {'verbose': 'False', 'query workers': '4', 'query chunk size': '1000'}
+    assert meshfitting.fitConfigKey(dict(nonResult, **{'fit schedule': "[{'it_max':2}]"})) == key
+    assert meshfitting.fitConfigKey(
+        {'fit schedule': "[{'it_max':2, 'query_workers':4, 'query_chunk':1000}]"}
+    ) == key
+    assert meshfitting.fitConfigKey({'fit schedule': "[{'it_max':3}]"}) != key
+
+
+def test_get_put_and_nearest(tmp_path):
+    cache = resultcache.ResultCache(str(tmp_path))
+    assert cache.get('input', 'config') is None
+    assert cache.getNearest('input') is None
+
+    cache.put('input', 'config', {'params': 1})
+    cache.put('input', 'other config', {'params': 2})
+    cache.put('other input', 'config', {'params': 3})
+    os.utime(cache._path('input', 'config'), (1000.0, 1000.0))
+    os.utime(cache._path('input', 'other config'), (2000.0, 2000.0))
+
+    assert cache.get('input', 'config') == {'params': 1}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # getting an entry makes it the most recently used near hit
+    assert cache.getNearest('input') == {'params': 1}
+    assert cache.getNearest('missing') is None
+    assert cache.nearHits == 1
+
+    cache.clear()
+    assert cache.get('input', 'config') is None
+
+
+def test_eviction(tmp_path):
+    entry = {'params': np.zeros(1000)}
+    probe = resultcache.ResultCache(str(tmp_path / 'probe'))
+    probe.put('a', 'c', entry)
+    size = os.path.getsize(probe._path('a', 'c'))
+
+    cache = resultcache.ResultCache(str(tmp_path / 'cache'), maxBytes=int(2.5 * size))
+    for i, key in enumerate('abc'):
+        cache.put(key, 'config', entry)
+        os.utime(cache._path(key, 'config'), (1000.0 + i, 1000.0 + i))
+    # a was the least recently used when c was put
+    assert cache.get('a', 'config') is None
+    assert cache.get('b', 'config') is not None
+
+    # reading b made it more recent than c
+    cache.put('d', 'config', entry)
+    assert cache.get('c', 'config') is None
+    assert cache.get('b', 'config') is not None
+    assert cache.get('d', 'config') is not None
+
+    # an entry larger than the limit is kept until the next put
+    small = resultcache.ResultCache(str(tmp_path / 'small'), maxBytes=1)
+    small.put('a', 'config', entry)
+    assert small.get('a', 'config') is not None
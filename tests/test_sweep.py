@@ -0,0 +1,90 @@
+'''
+Tests of smoothing weight sweeps: parsing sweeps and selections, the
+Pareto front and the choice of run, and a small sweep fitted in process.
+'''
+import numpy as np
+import pytest
+
+import synthetic
+from mapclientplugins.fieldworkmeshfittingstep import meshfitting
+from mapclientplugins.fieldworkmeshfittingstep import sweep
+
+
+def _results(costs):
+    return [{'rmse': rmse, 'normal discontinuity': nd} for rmse, nd in costs]
+
+
+def test_parse_grid():
+    runs = sweep.parseSweep("{'normal_w': [10.0, 50.0], 'sob_w': [1e-6, 1e-5, 1e-4]}")
+    assert len(runs) == 6
+    # runs vary the arguments in the order of SWEEP_ARGS
+    assert runs[0] == {'sob_w': 1e-6, 'normal_w': 10.0}
+    assert runs[1] == {'sob_w': 1e-6, 'normal_w': 50.0}
+    assert runs[-1] == {'sob_w': 1e-4, 'normal_w': 50.0}
+
+
+def test_parse_runs():
+    runs = sweep.parseSweep("[(1e-6, 10.0, [5,5]), {'normal_w': 20.0}]")
+    assert runs == [{'sob_w': 1e-6, 'normal_w': 10.0, 'GD': [5, 5]}, {'normal_w': 20.0}]
+
+
+@pytest.mark.parametrize('inputStr', ['None', 'none', ''])
+def test_parse_empty(inputStr):
+    assert sweep.parseSweep(inputStr) == []
+
+
+@pytest.mark.parametrize('inputStr', ["{'sob_w': [1.0], 'xtol': [1e-3]}", "[{'it_max': 3}]"])
+def test_parse_invalid(inputStr):
+    with pytest.raises(ValueError):
+        sweep.parseSweep(inputStr)
+
+
+def test_run_config():
+    config = {'normal weight': '50.0', 'verbose': 'False'}
+    runConfig = sweep.runConfig(config, {'normal_w': 10.0, 'GD': [4, 4]})
+    assert runConfig == {'normal weight': '10.0', 'mesh discretisation': '[4, 4]', 'verbose': 'False'}
+    assert config['normal weight'] == '50.0'
+
+
+def test_pareto_front():
+    results = _results([(1.0, 5.0), (2.0, 2.0), (3.0, 3.0), (5.0, 1.0), (1.0, 6.0), (2.0, 2.0)])
+    # (3, 3) is beaten by (2, 2) and (1, 6) by (1, 5); equal results are both kept
+    assert sweep.paretoFront(results) == [0, 1, 3, 5]
+    assert sweep.paretoFront([]) == []
+
+
+def test_select_result():
+    results = _results([(1.0, 5.0), (2.0, 2.0), (3.0, 3.0), (5.0, 1.0)])
+    assert sweep.selectResult(results, sweep.SELECT_RMSE) == 0
+    assert sweep.selectResult(results, sweep.SELECT_SMOOTHEST) == 3
+    assert sweep.selectResult(results, sweep.SELECT_KNEE) == 1
+    assert sweep.selectResult(results, 2) == 2
+    with pytest.raises(ValueError):
+        sweep.selectResult(results, 4)
+    with pytest.raises(ValueError):
+        sweep.selectResult(results, 'fastest')
+
+
+def test_parse_selection():
+    assert sweep.parseSelection(' 2 ') == 2
+    assert sweep.parseSelection('knee') == sweep.SELECT_KNEE
+
+
+def test_sweep_fit():
+    GF = synthetic.makeMesh('sphere', 3, elements=(1, 1))
+    params = GF.get_field_parameters().copy()
+    data = synthetic.makePointCloud('sphere', 2000)
+    config = {'verbose': 'False', 'max iterations': '2', 'mesh discretisation': '[4,4]'}
+    runs = sweep.parseSweep("{'normal_w': [0.0, 1000.0]}")
+
+    results = sweep.sweepFit(GF, data, None, config, runs, processes=1)
+    np.testing.assert_array_equal(GF.get_field_parameters(), params)
+    assert [r['normal_w'] for r in results] == [0.0, 1000.0]
+    for r in results:
+        assert r['rmse'] > 0.0
+        assert r['errors'].shape == (len(data),)
+    assert results[1]['normal discontinuity'] < results[0]['normal discontinuity']
+
+    summary = sweep.summarise(results)
+    assert 'params' not in summary[0] and 'errors' not in summary[0]
+    assert [s['pareto'] for s in summary] == [i in sweep.paretoFront(results) for i in range(2)]